@@ -10,19 +10,27 @@ This script uses Google's Generative AI (Gemini) to analyze images and:
 The script supports command-line arguments for customizing detection mode, input/output paths,
 and appearance of the bounding boxes.
 """
-import google.generativeai as genai
-import PIL.Image
-import PIL.ImageDraw
+import hashlib
 import io
 import os
+import random
 import json
 import argparse
 import sys
 import re
+import fnmatch
 import functools
-from typing import Dict, List, Union, Optional, Any, Tuple, Set, Callable, TypeVar, cast
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List, Union, Optional, Any, Tuple, Set, Callable, TypeVar, Sequence, Iterable, Iterator, Sized, cast
 import logging
-from pydantic import SecretStr
+from pydantic import BaseModel, Field, SecretStr, TypeAdapter, ValidationError, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pathlib import Path
 from tenacity import (
@@ -34,6 +42,13 @@ from tenacity import (
     RetryCallState
 )
 
+# The Gemini SDK takes about a second to import and PIL a noticeable fraction of one, so
+# both are imported where they are first used (see load_gemini); --help, argument errors
+# and runs that never call Gemini don't pay for them.
+if TYPE_CHECKING:
+    import google.generativeai as genai
+    import PIL.Image
+
 
 # Setup logging
 logger = logging.getLogger('bboxes')
@@ -43,12 +58,21 @@ class GeminiAPIError(Exception):
     """Exception raised for errors in the Gemini API."""
     pass
 
+class InvalidImageError(Exception):
+    """Exception raised for files that cannot be decoded as images."""
+    pass
+
+class DetectionError(Exception):
+    """Exception raised when a detector backend cannot find boxes in an image."""
+    pass
+
 class Settings(BaseSettings):
     """
     Application settings using pydantic for validation and secure handling of secrets.
 
     Attributes:
-        GEMINI_API_KEY: Google Gemini API key stored as a SecretStr for security.
+        GEMINI_API_KEY: Google Gemini API key stored as a SecretStr for security. Only
+            needed once a detection actually calls Gemini.
         GEMINI_MODEL: The Gemini model to use for image processing.
         GEMINI_TEMPERATURE: Temperature setting for deterministic outputs (0.0-1.0).
             Lower values (closer to 0.0) produce more deterministic results.
@@ -57,13 +81,92 @@ class Settings(BaseSettings):
         GEMINI_MAX_RETRIES: Maximum number of retry attempts for Gemini API calls.
         GEMINI_MIN_WAIT: Minimum wait time between retries in seconds.
         GEMINI_MAX_WAIT: Maximum wait time between retries in seconds.
+        BATCH_CONCURRENCY: Number of images processed at once when given a directory.
+            Each image spends most of its time waiting on a Gemini round trip, so this
+            is effectively the number of requests kept in flight.
+        RENDER_WORKERS: Processes that decode, crop, resize and save the outputs of a
+            directory run, in parallel with the requests in flight. None means one per
+            CPU core (none on a single core); 0 renders in the request threads instead.
+        CACHE_DIR: Directory of the on-disk detection result cache.
+        CACHE_TTL_DAYS: Age in days after which a cached detection is ignored and removed.
+        CACHE_MAX_MB: Size in megabytes above which the oldest cached detections are evicted.
+        DEDUP_DISTANCE: Largest Hamming distance (out of 256 bits) between the perceptual
+            hashes of two images of the same size for one to be a candidate to reuse the
+            other's boxes within a run. Re-encoded or near-identical captures differ by a
+            few bits, but so can different tweets in the same layout.
+        DEDUP_MAX_DIFFERENCE: Largest mean difference (0-255) between the grayscale
+            thumbnails of two candidates for one to actually reuse the other's boxes.
+            Re-encodes stay around 0.1, different tweets in the same layout are above 0.35.
+        UPLOAD_MAX_EDGE: Longest edge in pixels of the copy sent to Gemini. Larger images
+            are downscaled before upload; 0 sends them at full resolution.
+        UPLOAD_QUALITY: JPEG quality (1-95) of the copy sent to Gemini.
+        GEMINI_RPM: Requests-per-minute budget shared by all workers. 0 means unlimited.
+        GEMINI_TPM: Tokens-per-minute budget shared by all workers, using an estimate of
+            each request's cost. 0 means unlimited.
+        DETECTOR: Default detector backend: 'gemini', 'local' (offline, tweet mode only)
+            or 'local-then-gemini'.
+        LOCAL_CONFIDENCE_THRESHOLD: With 'local-then-gemini', local detections less
+            confident than this (0.0-1.0) are sent to Gemini instead.
+        TILE_ASPECT: With --tile, height of a tile as a multiple of the image width.
+            General-mode images taller than one tile are detected tile by tile.
+        TILE_OVERLAP: Fraction (0.0-0.9) of a tile's height shared with the next tile.
+            Objects shorter than the overlap are whole in at least one tile.
+        TILE_NMS_IOU: Boxes of the same label from different tiles whose intersection
+            over union is at least this (0.0-1.0) are merged into one.
+        PROMPT_BATCH_SIZE: Number of images packed into one Gemini request during a
+            directory run. 1 sends every image on its own.
+        PROMPT_BATCH_LINGER_MS: How long the first image of a batch waits for the rest
+            before the batch is sent short.
+        OUTPUT_FORMAT: Format of the saved outputs: 'keep' (the input's) or 'jpeg',
+            'webp' or 'avif'.
+        OUTPUT_QUALITY: Quality preset of lossy outputs, one of QUALITY_PRESETS.
+        OUTPUT_STRIP_METADATA: Leave the input's EXIF, XMP and ICC profile out of the outputs.
+        OUTPUT_OPTIMIZE: Spend more encoder time on smaller outputs.
+        GEMINI_MOCK: Answer every Gemini request with MockGeminiModel instead of calling
+            the API, for tests and benchmarks that should cost nothing.
+        MOCK_BOXES: What the mock answers: 'random' for random boxes (the same ones for
+            the same upload), or a literal response text sent back as is.
+        MOCK_LATENCY_MS: Mean latency of a mock request in milliseconds.
+        MOCK_JITTER_MS: Standard deviation of the mock latency in milliseconds.
+        MOCK_ERROR_RATE: Fraction (0.0-1.0) of mock requests that fail with a server error.
+        MOCK_THROTTLE_RATE: Fraction (0.0-1.0) of mock requests that fail with a 429.
+        MOCK_SEED: Seed of the mock's latencies and failures, for reproducible runs.
     """
-    GEMINI_API_KEY: SecretStr
+    GEMINI_API_KEY: Optional[SecretStr] = None
     GEMINI_MODEL: str = 'gemini-2.0-flash'
     GEMINI_TEMPERATURE: float = 0.0  # Default to deterministic (0.0)
     GEMINI_MAX_RETRIES: int = 3  # Default to 3 retry attempts
     GEMINI_MIN_WAIT: float = 2.0  # Default minimum wait time in seconds
     GEMINI_MAX_WAIT: float = 10.0  # Default maximum wait time in seconds
+    BATCH_CONCURRENCY: int = 8  # Default number of images in flight for directories
+    RENDER_WORKERS: Optional[int] = None  # Default to one render process per CPU core
+    CACHE_DIR: str = "~/.cache/bboxes"
+    CACHE_TTL_DAYS: float = 30.0
+    CACHE_MAX_MB: float = 100.0
+    DEDUP_DISTANCE: int = 8
+    DEDUP_MAX_DIFFERENCE: float = 0.25
+    UPLOAD_MAX_EDGE: int = 1536
+    UPLOAD_QUALITY: int = 85
+    GEMINI_RPM: int = 0  # Default to no client-side request budget
+    GEMINI_TPM: int = 0  # Default to no client-side token budget
+    DETECTOR: str = "gemini"
+    LOCAL_CONFIDENCE_THRESHOLD: float = 0.6
+    TILE_ASPECT: float = 1.5  # 1080x1620 tiles for a 1080 pixel wide capture
+    TILE_OVERLAP: float = 0.25
+    TILE_NMS_IOU: float = 0.5
+    PROMPT_BATCH_SIZE: int = 1
+    PROMPT_BATCH_LINGER_MS: float = 100.0
+    OUTPUT_FORMAT: str = "keep"
+    OUTPUT_QUALITY: str = "high"
+    OUTPUT_STRIP_METADATA: bool = False
+    OUTPUT_OPTIMIZE: bool = False
+    GEMINI_MOCK: bool = False
+    MOCK_BOXES: str = "random"
+    MOCK_LATENCY_MS: float = 1500.0  # Roughly a real gemini-2.0-flash round trip
+    MOCK_JITTER_MS: float = 300.0
+    MOCK_ERROR_RATE: float = 0.0
+    MOCK_THROTTLE_RATE: float = 0.0
+    MOCK_SEED: Optional[int] = None
 
     # Use SettingsConfigDict instead of Config inner class
     model_config = SettingsConfigDict(
@@ -97,9 +200,234 @@ def setup_logging(verbose: bool = False) -> None:
     logger.info("Logging initialized")
 
 
-# Load settings with API key
+# Load settings (cheap: nothing here talks to Gemini)
 settings = Settings()
 
+class TokenBucket:
+    """
+    A per-minute budget that refills continuously.
+
+    Callers reserve what they need and are told how long to wait before spending it. The
+    balance may go negative: each reservation queues behind the ones already made, so
+    waiting callers are served in order instead of all retrying the moment it refills.
+    Not thread-safe by itself; RateLimiter serializes access.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        self.rate = per_minute / 60.0
+        # Allow a few seconds' worth of burst, not a whole minute's
+        self.capacity = max(1.0, per_minute / 10.0)
+        self.available = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float) -> float:
+        """
+        Take `amount` from the budget.
+
+        Args:
+            amount: Requests or tokens to spend
+
+        Returns:
+            float: Seconds to wait before the reservation may be used
+        """
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+        self.available -= amount
+        return max(0.0, -self.available / self.rate)
+
+def is_throttle_error(error: BaseException) -> bool:
+    """
+    Check whether an exception (or anything in its cause chain) means Gemini throttled us.
+
+    Args:
+        error: The exception raised by an API call
+
+    Returns:
+        bool: True for HTTP 429 / quota exhaustion errors
+    """
+    current: Optional[BaseException] = error
+    while current is not None:
+        if current.__class__.__name__ in ('ResourceExhausted', 'TooManyRequests'):
+            return True
+        message = str(current).lower()
+        if '429' in message or 'quota' in message or 'rate limit' in message:
+            return True
+        current = current.__cause__
+    return False
+
+class RateLimiter:
+    """
+    Shared client-side limits on Gemini calls: request and token budgets, plus an
+    adaptive concurrency limit.
+
+    gemini_retry only reacts after a failure, and in a concurrent batch every worker
+    backs off and retries at about the same moment, so requests arrive in waves of 429s.
+    The budgets (GEMINI_RPM / GEMINI_TPM) space requests out to stay under the quota to
+    begin with. The concurrency limit adapts AIMD-style, like TCP congestion control:
+    each success raises it by about one per `limit` successes, each throttling error
+    halves it, so throughput settles just under whatever the real quota turns out to
+    be. Requests already in flight when the limit was halved cannot halve it again,
+    which keeps one burst of 429s from collapsing the limit to 1.
+
+    All methods are thread-safe.
+    """
+
+    def __init__(self, max_concurrency: int, rpm: int = 0, tpm: int = 0) -> None:
+        """
+        Args:
+            max_concurrency: Upper bound for the adaptive concurrency limit
+            rpm: Requests-per-minute budget, 0 for unlimited
+            tpm: Tokens-per-minute budget, 0 for unlimited
+        """
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.throttled = 0
+        self._requests = TokenBucket(rpm) if rpm else None
+        self._tokens = TokenBucket(tpm) if tpm else None
+        self._epoch = 0
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_settings(cls, max_concurrency: int) -> "RateLimiter":
+        """Create a limiter with the GEMINI_RPM / GEMINI_TPM budgets."""
+        return cls(max_concurrency, rpm=settings.GEMINI_RPM, tpm=settings.GEMINI_TPM)
+
+    @contextmanager
+    def request(self, tokens: int = 0) -> Iterator[None]:
+        """
+        Hold a slot for one API call; blocks until the limits allow it.
+
+        Args:
+            tokens: Estimated token cost of the call, charged to the tokens-per-minute budget
+        """
+        waited = time.perf_counter()
+        with self._condition:
+            while self.in_flight >= max(1, int(self.limit)):
+                self._condition.wait()
+            self.in_flight += 1
+            epoch = self._epoch
+            delay = self._requests.reserve(1) if self._requests else 0.0
+            if self._tokens and tokens:
+                delay = max(delay, self._tokens.reserve(tokens))
+
+        throttled = False
+        try:
+            if delay:
+                logger.debug(f"Rate limiter delaying request by {delay:.2f} seconds")
+                time.sleep(delay)
+            add_stage_time("rate_limit", time.perf_counter() - waited)
+            yield
+        except Exception as e:
+            throttled = is_throttle_error(e)
+            raise
+        finally:
+            self._release(epoch, throttled)
+
+    def _release(self, epoch: int, throttled: bool) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                if epoch == self._epoch:
+                    self.limit = max(1.0, self.limit / 2)
+                    self._epoch += 1
+                    logger.warning(f"Gemini is throttling requests, reducing concurrency to {int(self.limit)}")
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+def estimate_request_tokens(image_size: Tuple[int, int], prompt: str) -> int:
+    """
+    Roughly estimate the token cost of one detection request, for the tokens-per-minute budget.
+
+    Gemini charges 258 tokens per 768x768 tile of an image (one tile for small images),
+    text costs about one token per 4 characters, and the answer is a short JSON document.
+
+    Args:
+        image_size: (width, height) of the uploaded image
+        prompt: The prompt text
+
+    Returns:
+        int: The estimated number of tokens
+    """
+    width, height = image_size
+    tiles = math.ceil(width / 768) * math.ceil(height / 768)
+    return 258 * tiles + len(prompt) // 4 + 200
+
+@dataclass
+class ImageStats:
+    """
+    Gemini requests, retries and per-stage timings of one image.
+
+    Attributes:
+        requests: Number of Gemini requests made
+        retries: Number of those requests that were retried after an error
+        stages: Seconds spent in each stage (see span), summed when a stage runs repeatedly
+    """
+    requests: int = 0
+    retries: int = 0
+    stages: Dict[str, float] = field(default_factory=dict)
+
+    def add(self, other: "ImageStats") -> None:
+        """Add the stats of another part of the image's processing, e.g. another thread's."""
+        self.requests += other.requests
+        self.retries += other.retries
+        for stage, seconds in other.stages.items():
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+# Stats of the image the current thread is working on
+_thread_stats = threading.local()
+
+@contextmanager
+def collecting_stats() -> Iterator[ImageStats]:
+    """
+    Collect the requests, retries and stage timings of the current thread inside the block.
+
+    Each image is detected in a single worker thread and rendered in a single thread
+    (possibly of a render process), so this attributes them to images without passing
+    a collector through every layer in between.
+
+    Yields:
+        ImageStats: The stats, updated as they happen
+    """
+    previous = getattr(_thread_stats, "stats", None)
+    stats = _thread_stats.stats = ImageStats()
+    try:
+        yield stats
+    finally:
+        _thread_stats.stats = previous
+
+def _count_request(kind: str) -> None:
+    stats = getattr(_thread_stats, "stats", None)
+    if stats is not None:
+        setattr(stats, kind, getattr(stats, kind) + 1)
+
+def add_stage_time(stage: str, seconds: float) -> None:
+    """Add time spent in a stage to the current image's stats, if they are being collected."""
+    logger.debug(f"span stage={stage} ms={seconds * 1000:.1f}")
+    stats = getattr(_thread_stats, "stats", None)
+    if stats is not None:
+        stats.stages[stage] = stats.stages.get(stage, 0.0) + seconds
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Time a stage of the current image, such as "decode", "request" or "save".
+
+    The duration goes to the stats of collecting_stats and to a debug log line in
+    key=value form. Spans should not be nested, so that stage times add up.
+
+    Args:
+        stage: Name of the stage
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_stage_time(stage, time.perf_counter() - started)
+
 # Define the retry mechanism for Gemini API calls
 def gemini_retry(
     max_retries: Optional[int] = None,
@@ -126,6 +454,8 @@ def gemini_retry(
     def _before_sleep(retry_state: RetryCallState) -> None:
         exception = retry_state.outcome.exception() if retry_state.outcome and retry_state.outcome.failed else None
         exception_name = exception.__class__.__name__ if exception else "Unknown error"
+        _count_request("retries")
+        add_stage_time("backoff", retry_state.next_action.sleep)
 
         logger.warning(
             f"Gemini API call failed with {exception_name}. "
@@ -154,15 +484,21 @@ def gemini_retry(
 # Add this function to wrap the Gemini API call
 @gemini_retry()
 def generate_gemini_content(
-    model: genai.GenerativeModel,
-    prompt_parts: List[Union[Dict[str, Union[str, bytes]], str]]
+    model: "genai.GenerativeModel",
+    prompt_parts: List[Union[Dict[str, Union[str, bytes]], str]],
+    limiter: Optional[RateLimiter] = None,
+    tokens: int = 0
 ) -> Any:
     """
     Make a call to the Gemini API with retry mechanism.
 
+    Each attempt, including retries, waits for a slot from the limiter.
+
     Args:
         model: The Gemini model instance
         prompt_parts: The prompt parts to send to the model
+        limiter: The run's shared rate limiter. If None, the call is not limited.
+        tokens: Estimated token cost of the call, for the limiter's token budget
 
     Returns:
         The response from the Gemini model
@@ -171,22 +507,1010 @@ def generate_gemini_content(
         GeminiAPIError: If there's an error in the Gemini API call
     """
     try:
-        response = model.generate_content(prompt_parts)
-        response.resolve()
+        # Resolving reads the rest of the response, which can still fail with a 429, so
+        # it belongs to the request as far as the limiter is concerned
+        with limiter.request(tokens) if limiter else nullcontext(), span("request"):
+            response = model.generate_content(prompt_parts)
+            response.resolve()
         return response
     except Exception as e:
         # Wrap the original exception in our custom exception
         raise GeminiAPIError(f"Error in Gemini API call: {str(e)}") from e
 
+@functools.lru_cache(maxsize=None)
+def load_gemini() -> Any:
+    """
+    Import the Gemini SDK and configure it with the API key, on first use.
+
+    Importing and configuring the SDK at module level made every start pay for it and
+    demand an API key, including --help, argument errors and --detector local runs. Now
+    only the first request of a run that actually calls Gemini does. A failure is not
+    cached, so it is reported again by every image that needs Gemini.
 
-# Configure Gemini with the API key from settings
-try:
-    genai.configure(api_key=settings.GEMINI_API_KEY.get_secret_value())
+    Returns:
+        The configured google.generativeai module
+
+    Raises:
+        GeminiAPIError: If GEMINI_API_KEY is not set or the SDK cannot be configured
+    """
+    if settings.GEMINI_API_KEY is None:
+        raise GeminiAPIError("GEMINI_API_KEY is not set. Add it to the environment or to .env")
+
+    import google.generativeai as genai
+
+    try:
+        genai.configure(api_key=settings.GEMINI_API_KEY.get_secret_value())
+    except Exception as e:
+        raise GeminiAPIError(f"Failed to configure Gemini API. Please check your API key. Error: {e}") from e
     logger.debug("Gemini API configured successfully")
-except Exception as e:
-    logger.error(f"Failed to configure Gemini API: {e}")
-    print(f"Error: Failed to configure Gemini API. Please check your API key. Error: {e}")
-    sys.exit(1)
+    return genai
+
+class DetectionCache:
+    """
+    On-disk cache of parsed bounding boxes, so the same image is never paid for twice.
+
+    Entries are keyed by everything that decides Gemini's answer: the image's sha256, the
+    detection mode, a hash of the prompt, GEMINI_MODEL and the temperature. Rendering
+    options (--crop-percent, --box-color, --resize, ...) are deliberately not part of the
+    key because they are applied to the boxes after the API call, so re-rendering with
+    different options is free. At the default temperature of 0.0 the model is
+    deterministic, so a cached answer is as good as a fresh one.
+
+    Each entry is a small JSON file under `directory`. Entries older than `ttl` seconds
+    count as misses, and evict() removes those plus the oldest entries once the cache
+    grows past `max_bytes`. Methods are safe to call from several worker threads.
+    """
+
+    def __init__(self, directory: Union[str, Path], ttl: float, max_bytes: int) -> None:
+        self.directory = Path(directory).expanduser()
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "DetectionCache":
+        """Create a cache configured by the CACHE_* settings."""
+        return cls(
+            settings.CACHE_DIR,
+            ttl=settings.CACHE_TTL_DAYS * 24 * 60 * 60,
+            max_bytes=int(settings.CACHE_MAX_MB * 1024 * 1024)
+        )
+
+    @staticmethod
+    def make_key(
+        image_sha256: str,
+        mode: str,
+        prompt: str,
+        model_name: str,
+        temperature: float,
+        variant: str = ""
+    ) -> str:
+        """
+        Build the cache key for one detection.
+
+        Args:
+            image_sha256: Hex sha256 of the image file
+            mode: Detection mode ('tweet' or 'general')
+            prompt: The prompt text sent with the image
+            model_name: The Gemini model name
+            temperature: Temperature setting for the Gemini model
+            variant: How the detection was made, if not from the whole image in one
+                request of its own (e.g. the tile layout, or "batch")
+
+        Returns:
+            str: A hex digest identifying the detection
+        """
+        prompt_sha256 = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        material = [image_sha256, mode, prompt_sha256, model_name, temperature]
+        if variant:
+            # Only when set, so keys of whole-image detections stay what they were
+            material.append(variant)
+        return hashlib.sha256(json.dumps(material).encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        # Fan out over 256 subdirectories so no single directory gets huge
+        return self.directory / key[:2] / f"{key}.json"
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Look up a detection.
+
+        Args:
+            key: A key from make_key
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: The cached boxes, or None on a miss
+        """
+        path = self._entry_path(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                self._count(hit=False)
+                return None
+            boxes = json.loads(path.read_text(encoding='utf-8'))['boxes']
+        except (OSError, ValueError, KeyError):
+            # Missing, unreadable or half-written entries are all just misses
+            self._count(hit=False)
+            return None
+
+        self._count(hit=True)
+        return boxes
+
+    def put(self, key: str, boxes: List[Dict[str, Any]]) -> None:
+        """
+        Store a detection. Failing to write is logged, never raised: the boxes are
+        still good, they just will not be reused.
+
+        Args:
+            key: A key from make_key
+            boxes: The parsed boxes to store
+        """
+        path = self._entry_path(key)
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path.write_text(json.dumps({'boxes': boxes}), encoding='utf-8')
+            # Atomic, so concurrent readers never see a partial entry
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write detection cache entry {path}: {e}")
+
+    def evict(self) -> None:
+        """Remove expired entries, then the oldest ones until the cache fits in max_bytes."""
+        now = time.time()
+        entries: List[Tuple[float, int, Path]] = []
+        for path in self.directory.glob('*/*.json'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        logger.debug(f"Detection cache holds {total} bytes after eviction")
+
+def dhash(img: "PIL.Image.Image", hash_size: int = 16) -> int:
+    """
+    Difference hash of an image: whether each cell of a small grayscale copy is brighter
+    than its right-hand neighbour.
+
+    Re-encoding, resaving and small changes (a status bar clock) leave it almost
+    unchanged. It is only a first filter: each cell of a tall screenshot spans several
+    lines of text, so screenshots of different tweets in the same layout, even with a
+    different number of lines, can come within a few bits of each other too. At 16x16
+    (256 bits) that is rarer than with the common 8x8 hash, but NearDuplicateIndex
+    still confirms every match with thumbnail_difference.
+
+    Args:
+        img: The image
+        hash_size: Side of the grid; the hash has hash_size squared bits
+
+    Returns:
+        int: The hash
+    """
+    import PIL.Image
+
+    small = img.convert('L').resize((hash_size + 1, hash_size), PIL.Image.Resampling.BOX)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+def dedup_thumbnail(img: "PIL.Image.Image", width: int = 64) -> "PIL.Image.Image":
+    """
+    Small grayscale copy of an image, for confirming a dhash match with thumbnail_difference.
+
+    Args:
+        img: The image
+        width: Width of the copy; the height keeps the aspect ratio
+
+    Returns:
+        PIL.Image.Image: The thumbnail
+    """
+    import PIL.Image
+
+    height = max(1, round(img.height * width / img.width))
+    return img.convert('L').resize((width, height), PIL.Image.Resampling.BOX)
+
+def thumbnail_difference(a: "PIL.Image.Image", b: "PIL.Image.Image") -> float:
+    """
+    Mean absolute difference (0-255) between two thumbnails from dedup_thumbnail.
+
+    Unlike the hash, it does not throw away how large a change is: a line of text more
+    or less shifts everything below it, which moves the mean well above the noise of a
+    re-encode.
+
+    Returns:
+        float: The difference, or infinity when the thumbnails differ in size
+    """
+    import PIL.ImageChops
+    import PIL.ImageStat
+
+    if a.size != b.size:
+        return math.inf
+    return PIL.ImageStat.Stat(PIL.ImageChops.difference(a, b)).mean[0]
+
+class BKTree:
+    """
+    Burkhard-Keller tree over the Hamming distance between integer hashes.
+
+    Each child edge is labelled with its distance to the parent, so by the triangle
+    inequality a search within `max_distance` of a key only has to descend into edges
+    labelled within `max_distance` of the key's distance to the node. Lookups stay far
+    below a linear scan as the number of images grows.
+    """
+
+    def __init__(self) -> None:
+        # Nodes are [key, value, {distance: child node}]
+        self._root: Optional[List[Any]] = None
+        self.size = 0
+
+    @staticmethod
+    def distance(a: int, b: int) -> int:
+        return (a ^ b).bit_count()
+
+    def add(self, key: int, value: Any) -> None:
+        """Add a key, also when an equal key is already present."""
+        self.size += 1
+        if self._root is None:
+            self._root = [key, value, {}]
+            return
+        node = self._root
+        while True:
+            d = self.distance(key, node[0])
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [key, value, {}]
+                return
+            node = child
+
+    def search(self, key: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """
+        Find every value whose key is within max_distance of key.
+
+        Returns:
+            List[Tuple[int, Any]]: (distance, value) pairs, nearest first
+        """
+        found: List[Tuple[int, Any]] = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            d = self.distance(key, node[0])
+            if d <= max_distance:
+                found.append((d, node[1]))
+            for edge, child in node[2].items():
+                if d - max_distance <= edge <= d + max_distance:
+                    stack.append(child)
+        found.sort(key=lambda item: item[0])
+        return found
+
+class DuplicateEntry:
+    """The boxes of one image in a NearDuplicateIndex, which may still be being detected."""
+
+    def __init__(self, thumbnail: "PIL.Image.Image") -> None:
+        self.thumbnail = thumbnail
+        self.boxes: Optional[List[Dict[str, Any]]] = None
+        self._settled = threading.Event()
+
+    def settle(self, boxes: Optional[List[Dict[str, Any]]]) -> None:
+        """Record the image's boxes, or None when its detection failed, and wake any waiters."""
+        self.boxes = boxes
+        self._settled.set()
+
+    def wait(self) -> Optional[List[Dict[str, Any]]]:
+        self._settled.wait()
+        return self.boxes
+
+class NearDuplicateIndex:
+    """
+    Boxes detected during one run, looked up by perceptual hash (dhash).
+
+    Screenshot folders often hold many captures of the same tweet. Boxes are normalized
+    to 0-1000, so an image can reuse the boxes of another one of the same size (and mode
+    and temperature) whose hash is within max_distance, instead of calling Gemini again.
+    A hash match alone is not enough, since different tweets in the same layout can
+    hash alike; it is only reused when the thumbnails (see dedup_thumbnail) differ by at
+    most max_difference as well.
+
+    Near-duplicates are often processed at the same time, since similar captures sort
+    next to each other. Every lookup therefore registers the image before it is
+    detected, and a later near-duplicate waits for that detection instead of starting
+    its own. It only falls back to its own request if that detection fails. Images only
+    ever wait on images registered before them, so waits cannot form a cycle.
+    """
+
+    def __init__(self, max_distance: int, max_difference: float = settings.DEDUP_MAX_DIFFERENCE) -> None:
+        self.max_distance = max_distance
+        self.max_difference = max_difference
+        self._trees: Dict[Tuple[Any, ...], BKTree] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.rejected = 0
+
+    def lookup(
+        self,
+        group: Tuple[Any, ...],
+        image_hash: int,
+        thumbnail: "PIL.Image.Image"
+    ) -> Tuple[Optional[List[Dict[str, Any]]], DuplicateEntry]:
+        """
+        Find the boxes of a near-duplicate, waiting for any that are still being detected.
+
+        Args:
+            group: What must match exactly, e.g. (mode, temperature, image size)
+            image_hash: The image's dhash
+            thumbnail: The image's dedup_thumbnail
+
+        Returns:
+            Tuple[Optional[List[Dict[str, Any]]], DuplicateEntry]: The reused boxes, or
+                None when there is no usable near-duplicate, and the image's own entry. The
+                caller must settle() the entry once its own detection is done or failed;
+                it is already settled when boxes were reused.
+        """
+        entry = DuplicateEntry(thumbnail)
+        with self._lock:
+            self.lookups += 1
+            tree = self._trees.setdefault(group, BKTree())
+            matches = tree.search(image_hash, self.max_distance)
+            tree.add(image_hash, entry)
+
+        for distance, match in matches:
+            difference = thumbnail_difference(thumbnail, match.thumbnail)
+            if difference > self.max_difference:
+                logger.debug(f"Hash match at distance {distance} rejected, thumbnails differ by {difference:.2f}")
+                with self._lock:
+                    self.rejected += 1
+                continue
+            boxes = match.wait()
+            if boxes is not None:
+                logger.debug(f"Near-duplicate at distance {distance} found")
+                with self._lock:
+                    self.hits += 1
+                entry.settle(boxes)
+                return boxes, entry
+
+        return None, entry
+
+    def add(
+        self,
+        group: Tuple[Any, ...],
+        image_hash: int,
+        thumbnail: "PIL.Image.Image",
+        boxes: List[Dict[str, Any]]
+    ) -> None:
+        """Record boxes that were found without a lookup, e.g. in the detection cache."""
+        entry = DuplicateEntry(thumbnail)
+        entry.settle(boxes)
+        with self._lock:
+            self._trees.setdefault(group, BKTree()).add(image_hash, entry)
+
+@dataclass
+class MockStats:
+    """
+    What the mock models of one ModelPool were asked to do, for benchmarks and tests.
+
+    Attributes:
+        calls: Requests received, including retries
+        errors: Requests answered with a server error
+        throttled: Requests answered with a 429
+        retry_seconds: Time requests spent on failed attempts and the backoff after them,
+            from the start of each failed attempt to the start of the next one
+    """
+    calls: int = 0
+    errors: int = 0
+    throttled: int = 0
+    retry_seconds: float = 0.0
+
+class MockResponse:
+    """The part of a Gemini response that bboxes reads."""
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+    def resolve(self) -> None:
+        pass
+
+class MockGeminiModel:
+    """
+    Local stand-in for a Gemini model, selected with GEMINI_MOCK.
+
+    generate_content() sleeps for a random latency and then either fails, with a server
+    error or a 429 at the configured rates, or answers with the configured response.
+    Random boxes are derived from a hash of the upload, so the same image always gets
+    the same boxes. It goes through the same retry, rate limiting and parsing code as
+    real requests, so it measures everything except the network.
+    """
+
+    NAME = "mock"
+
+    def __init__(
+        self,
+        mode: str,
+        stats: MockStats,
+        batched: bool = False,
+        boxes: str = "random",
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        seed: Optional[int] = None
+    ) -> None:
+        self.mode = mode
+        self.stats = stats
+        self.batched = batched
+        self.boxes = boxes
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self._random = random.Random(seed)
+        self._failed_at: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, mode: str, stats: MockStats, batched: bool = False) -> "MockGeminiModel":
+        """Create a mock model configured by the MOCK_* settings."""
+        return cls(
+            mode,
+            stats,
+            batched=batched,
+            boxes=settings.MOCK_BOXES,
+            latency_ms=settings.MOCK_LATENCY_MS,
+            jitter_ms=settings.MOCK_JITTER_MS,
+            error_rate=settings.MOCK_ERROR_RATE,
+            throttle_rate=settings.MOCK_THROTTLE_RATE,
+            seed=settings.MOCK_SEED
+        )
+
+    def generate_content(self, prompt_parts: List[Any]) -> MockResponse:
+        """
+        Answer a request like GenerativeModel.generate_content, after a simulated round trip.
+
+        Args:
+            prompt_parts: The prompt parts; the first one holds the uploaded image, or
+                for a batched model, the image parts are numbered from 0 in order
+
+        Returns:
+            MockResponse: The response
+
+        Raises:
+            Exception: A server error or a 429, at the configured rates
+        """
+        started = time.monotonic()
+        # Retries resend the same prompt_parts list, which identifies the request
+        request_id = id(prompt_parts)
+        with self._lock:
+            self.stats.calls += 1
+            failed_at = self._failed_at.pop(request_id, None)
+            if failed_at is not None:
+                self.stats.retry_seconds += started - failed_at
+            latency = max(0.0, self._random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+            roll = self._random.random()
+
+        time.sleep(latency)
+
+        if roll < self.error_rate + self.throttle_rate:
+            with self._lock:
+                self._failed_at[request_id] = started
+                if roll < self.error_rate:
+                    self.stats.errors += 1
+                else:
+                    self.stats.throttled += 1
+            if roll < self.error_rate:
+                raise Exception("503 The service is currently unavailable (mock)")
+            raise Exception("429 Resource has been exhausted (e.g. check quota) (mock)")
+
+        if self.boxes != "random":
+            return MockResponse(self.boxes)
+        if self.batched:
+            uploads = [part["data"] for part in prompt_parts if isinstance(part, dict)]
+            return MockResponse(json.dumps([
+                {"index": index, "boxes": self.random_boxes(data)} for index, data in enumerate(uploads)
+            ]))
+        return MockResponse(json.dumps(self.random_boxes(prompt_parts[0]["data"])))
+
+    def random_boxes(self, data: bytes) -> Any:
+        """
+        Plausible boxes for an upload: one for tweet mode, one to four labeled ones otherwise.
+
+        Args:
+            data: The uploaded image bytes, which seed the boxes
+
+        Returns:
+            Any: The response object, in the shape of RESPONSE_SCHEMAS[self.mode]
+        """
+        rng = random.Random(hashlib.sha256(data).digest())
+
+        def box() -> Dict[str, float]:
+            xmin, ymin = rng.uniform(0, 600), rng.uniform(0, 600)
+            return {
+                "xmin": round(xmin), "ymin": round(ymin),
+                "xmax": round(rng.uniform(xmin + 50, 1000)), "ymax": round(rng.uniform(ymin + 50, 1000)),
+            }
+
+        if self.mode == "tweet":
+            return box()
+        return [
+            {"label": rng.choice(["person", "dog", "cat", "car", "cup", "phone"]), **box()}
+            for _ in range(rng.randint(1, 4))
+        ]
+
+class ModelPool:
+    """
+    GenerativeModel instances shared by every worker of one run.
+
+    Building a model per image redid the same setup for every request, and when a batch
+    started N workers at once they raced to create the SDK's default client, so the
+    first wave of requests each opened a connection of its own. The pool creates that
+    client once, under a lock, and hands out one model per generation config (detection
+    mode and temperature), so every request of the run is multiplexed over the same
+    long-lived gRPC (HTTP/2) connection.
+
+    With settings.GEMINI_MOCK, the pool hands out MockGeminiModel instances instead and
+    never connects; their model_name is MockGeminiModel.NAME, so mock detections are
+    cached apart from real ones.
+    """
+
+    def __init__(self, model_name: Optional[str] = None, mock: Optional[bool] = None) -> None:
+        self.mock = settings.GEMINI_MOCK if mock is None else mock
+        self.model_name = MockGeminiModel.NAME if self.mock else model_name or settings.GEMINI_MODEL
+        self.mock_stats = MockStats()
+        self._models: Dict[Tuple[str, float, bool], Any] = {}
+        self._connected = False
+        self._lock = threading.Lock()
+
+    def get(self, mode: str, temperature: float, batched: bool = False) -> Any:
+        """
+        Get the shared model for a detection mode and temperature, creating it on first use.
+
+        The model asks for JSON output constrained to the mode's RESPONSE_SCHEMAS entry,
+        or for a batched model, its BATCH_RESPONSE_SCHEMAS entry.
+
+        Args:
+            mode: Detection mode ('tweet' or 'general')
+            temperature: Temperature setting for the Gemini model (0.0-1.0)
+            batched: Get the model for multi-image requests (see PromptBatcher)
+
+        Returns:
+            genai.GenerativeModel: A model that is safe to use from any worker thread
+                (a MockGeminiModel in mock mode)
+        """
+        with self._lock:
+            if self.mock:
+                model = self._models.get((mode, temperature, batched))
+                if model is None:
+                    model = MockGeminiModel.from_settings(mode, self.mock_stats, batched)
+                    self._models[(mode, temperature, batched)] = model
+                return model
+
+            genai = load_gemini()
+            if not self._connected:
+                from google.generativeai import client as genai_client
+                genai_client.get_default_generative_client()
+                self._connected = True
+
+            model = self._models.get((mode, temperature, batched))
+            if model is None:
+                generation_config = {
+                    "temperature": temperature,
+                    "response_mime_type": "application/json",
+                    "response_schema": (BATCH_RESPONSE_SCHEMAS if batched else RESPONSE_SCHEMAS)[mode],
+                }
+                model = genai.GenerativeModel(self.model_name, generation_config=generation_config)
+                self._models[(mode, temperature, batched)] = model
+                logger.debug(f"Initialized Gemini model: {self.model_name} for {mode} mode{' (batched)' if batched else ''} with temperature: {temperature}")
+            return model
+
+class BatchJournal:
+    """
+    Append-only JSONL log of a directory run, so an interrupted run can pick up where it died.
+
+    One line is appended per finished image with its path, size, mtime, sha256, mode,
+    status, boxes, output path, the files it wrote and the run's rendering options, and
+    flushed immediately, so a run killed by a quota error or Ctrl-C loses nothing it
+    already paid for. With --resume, images whose latest record says "done" for the same
+    mode, output path and options, whose file has not changed size or mtime since, and
+    whose outputs all still exist, are skipped. Everything else, including failures,
+    runs again; boxes that were detected before a later step failed come from the
+    detection cache at no cost.
+    """
+
+    FILENAME = ".bboxes-journal.jsonl"
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        resume: bool = False,
+        options: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """
+        Open a journal.
+
+        Args:
+            path: Path to the journal file
+            resume: If True, load the existing journal and append to it. Otherwise any
+                existing journal is replaced by a fresh one.
+            options: The settings that shape this run's outputs (crop, colors, label,
+                encoding...). Images done with other options are not skipped.
+        """
+        self.path = Path(path)
+        # Normalized the way it reads back, so it compares equal to a loaded record
+        self.options = json.loads(json.dumps(options or {}))
+        self._completed: Dict[str, Dict[str, Any]] = {}
+        if resume and self.path.exists():
+            self._completed = self._load()
+        self._file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        # Later lines win, so a path that failed and then succeeded counts as done
+        latest: Dict[str, Dict[str, Any]] = {}
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    latest[record['path']] = record
+                except (ValueError, KeyError, TypeError):
+                    # The line being written when the previous run died
+                    continue
+        return {path: record for path, record in latest.items() if record.get('status') == 'done'}
+
+    @staticmethod
+    def _fingerprint(image_path: str) -> Tuple[str, int, int]:
+        stat = os.stat(image_path)
+        return os.path.abspath(image_path), stat.st_size, stat.st_mtime_ns
+
+    def is_done(self, image_path: str, mode: str, output_path: str) -> bool:
+        """
+        Check whether an earlier run already finished this image with the same settings
+        and its outputs are still there.
+
+        Args:
+            image_path: Path to the input image
+            mode: Detection mode ('tweet' or 'general')
+            output_path: Path the output is saved to
+
+        Returns:
+            bool: True if the image can be skipped
+        """
+        try:
+            path, size, mtime_ns = self._fingerprint(image_path)
+        except OSError:
+            return False
+        record = self._completed.get(path)
+        return (
+            record is not None
+            and record.get('size') == size
+            and record.get('mtime_ns') == mtime_ns
+            and record.get('mode') == mode
+            and record.get('output_path') == os.path.abspath(output_path)
+            and record.get('options') == self.options
+            and all(os.path.exists(output) for output in record.get('outputs', []))
+        )
+
+    def record(self, result: "ImageResult", mode: str) -> None:
+        """
+        Append the outcome of one image.
+
+        Args:
+            result: The image's result
+            mode: Detection mode ('tweet' or 'general')
+        """
+        try:
+            path, size, mtime_ns = self._fingerprint(result.image_path)
+        except OSError:
+            path, size, mtime_ns = os.path.abspath(result.image_path), None, None
+
+        record = {
+            'path': path,
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'sha256': result.sha256,
+            'mode': mode,
+            'status': result.status,
+            'boxes': result.boxes,
+            'output_path': os.path.abspath(result.output_path),
+            'outputs': sorted({os.path.abspath(region['output']) for region in result.regions or []}),
+            'options': self.options,
+            'error': result.error,
+            'time': time.time(),
+        }
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+
+    def close(self) -> None:
+        """Close the journal file."""
+        self._file.close()
+
+class ResultsSidecar:
+    """
+    JSONL file with one machine-readable record per processed image (--results).
+
+    Where the journal only remembers what is done, the sidecar describes each result
+    completely, so later tools never need the API again: the input path, sha256, size
+    and mode; the boxes as detected (normalized to 0-1000); for every drawn or cropped
+    region its label and its pixel box before and after padding, and the file it was
+    saved to; and the latency and the number of Gemini requests and retries. Records are
+    written and flushed as images finish, in completion order.
+    """
+
+    def __init__(self, path: Union[str, Path], append: bool = False) -> None:
+        """
+        Open a results file.
+
+        Args:
+            path: Path to the JSONL file
+            append: If True, add to an existing file instead of replacing it
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'a' if append else 'w', encoding='utf-8')
+
+    def record(self, result: "ImageResult", mode: str) -> None:
+        """
+        Append the record of one image.
+
+        Args:
+            result: The image's result
+            mode: Detection mode ('tweet' or 'general')
+        """
+        record = {
+            'path': os.path.abspath(result.image_path),
+            'sha256': result.sha256,
+            'mode': mode,
+            'status': result.status,
+            'width': result.image_size[0] if result.image_size else None,
+            'height': result.image_size[1] if result.image_size else None,
+            'boxes': result.boxes,
+            'regions': result.regions,
+            'output_path': os.path.abspath(result.output_path),
+            'elapsed_ms': round(result.elapsed * 1000, 1) if result.elapsed is not None else None,
+            'requests': result.requests,
+            'retries': result.retries,
+            'stages_ms': {stage: round(seconds * 1000, 2) for stage, seconds in result.stages.items()},
+            'error': result.error,
+            'time': time.time(),
+        }
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+
+    def close(self) -> None:
+        """Close the results file."""
+        self._file.close()
+
+class RunMetrics:
+    """
+    Distributions of the stage timings and latencies of a run's images, summarized at its end.
+
+    Images are processed concurrently, so the wall time of a run says little about where
+    it goes. Summing each stage over all images shows what dominates (usually "request",
+    the Gemini round trip), and the percentiles show whether a stage is uniformly slow or
+    has a long tail, such as "rate_limit" or "backoff" under throttling.
+    """
+
+    # Order of the stages in the summary; stages not listed here come last
+    STAGES = (
+        "read", "decode", "hash", "cache", "dhash", "dedup_wait", "batch_wait", "encode", "rate_limit",
+        "request", "backoff", "parse", "redecode", "crop", "draw", "resize", "save",
+    )
+    # Upper bounds in seconds of the latency histogram's buckets
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, List[float]] = {}
+        self.latencies: List[float] = []
+        self.requests = 0
+        self.retries = 0
+        self.retried_images = 0
+
+    def record(self, result: "ImageResult") -> None:
+        """
+        Add the stats of one finished image.
+
+        Args:
+            result: The image's result
+        """
+        for stage, seconds in result.stages.items():
+            self.stages.setdefault(stage, []).append(seconds)
+        if result.elapsed is not None and result.status != "skipped":
+            self.latencies.append(result.elapsed)
+        self.requests += result.requests
+        self.retries += result.retries
+        if result.retries:
+            self.retried_images += 1
+
+    @staticmethod
+    def percentile(ordered: Sequence[float], fraction: float) -> float:
+        """Nearest-rank percentile of sorted values, e.g. fraction 0.99 for p99."""
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+    def summary(self) -> List[str]:
+        """
+        Describe the run: a table of the stage timings, the requests and retries, and a
+        histogram of the per-image latency.
+
+        Returns:
+            List[str]: The lines of the summary, empty when no image was processed
+        """
+        if not self.latencies:
+            return []
+
+        lines = [f"{'Stage (ms)':<12}{'images':>8}{'total':>11}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}"]
+        order = [stage for stage in self.STAGES if stage in self.stages]
+        order += sorted(stage for stage in self.stages if stage not in self.STAGES)
+        for stage in order:
+            ordered = sorted(self.stages[stage])
+            columns = [sum(ordered)] + [self.percentile(ordered, q) for q in (0.5, 0.9, 0.99)] + [ordered[-1]]
+            total, p50, p90, p99, top = (value * 1000 for value in columns)
+            lines.append(f"{stage:<12}{len(ordered):>8}{total:>11.1f}{p50:>9.1f}{p90:>9.1f}{p99:>9.1f}{top:>9.1f}")
+
+        lines.append(f"Gemini requests: {self.requests}, retries: {self.retries} (on {self.retried_images} images)")
+
+        ordered = sorted(self.latencies)
+        lines.append(
+            f"Latency per image: p50 {self.percentile(ordered, 0.5):.2f}s, p90 {self.percentile(ordered, 0.9):.2f}s, "
+            f"p99 {self.percentile(ordered, 0.99):.2f}s, max {ordered[-1]:.2f}s"
+        )
+        counts = [0] * (len(self.BUCKETS) + 1)
+        for latency in ordered:
+            counts[next((i for i, bound in enumerate(self.BUCKETS) if latency <= bound), len(self.BUCKETS))] += 1
+        # Only the range of buckets that has images in it
+        first = next(i for i, count in enumerate(counts) if count)
+        last = max(i for i, count in enumerate(counts) if count)
+        for i in range(first, last + 1):
+            bucket = f"<= {self.BUCKETS[i]:g}s" if i < len(self.BUCKETS) else f"> {self.BUCKETS[-1]:g}s"
+            bar = "#" * math.ceil(40 * counts[i] / max(counts))
+            lines.append(f"  {bucket:>9} | {bar:<40} {counts[i]}")
+        return lines
+
+# --output-format choices other than 'keep' -> extension
+OUTPUT_EXTENSIONS = {"jpeg": ".jpg", "webp": ".webp", "avif": ".avif"}
+
+# --output-quality presets -> quality per Pillow format. "high" keeps the quality=92
+# the resized outputs always had.
+QUALITY_PRESETS = {
+    "high": {"JPEG": 92, "WEBP": 90, "AVIF": 80},
+    "balanced": {"JPEG": 85, "WEBP": 80, "AVIF": 65},
+    "small": {"JPEG": 75, "WEBP": 65, "AVIF": 50},
+}
+
+@dataclass
+class OutputEncoding:
+    """
+    How the outputs are encoded (--output-format, --output-quality, --strip-metadata, --optimize).
+
+    Screenshots are mostly flat color and text, which WebP and AVIF compress to a
+    fraction of the PNG they usually arrive as, and even JPEG beats PNG on photos. The
+    output format sets the extension of every output path (see output_path), so the
+    file name always matches its content.
+
+    Attributes:
+        format: 'keep' to save in the input's format, or 'jpeg', 'webp' or 'avif'
+        quality: Name of the quality preset (see QUALITY_PRESETS) used by the lossy formats
+        strip_metadata: Leave out the input's EXIF, XMP and ICC profile
+        optimize: Spend more encoder time for smaller files: optimized Huffman tables
+            and progressive JPEG, the slowest WebP method, a slower AVIF speed, and
+            optimized PNG compression
+    """
+    format: str = "keep"
+    quality: str = "high"
+    strip_metadata: bool = False
+    optimize: bool = False
+
+    @classmethod
+    def from_settings(cls) -> "OutputEncoding":
+        """Create the encoding configured by the OUTPUT_* settings."""
+        return cls(
+            format=settings.OUTPUT_FORMAT,
+            quality=settings.OUTPUT_QUALITY,
+            strip_metadata=settings.OUTPUT_STRIP_METADATA,
+            optimize=settings.OUTPUT_OPTIMIZE
+        )
+
+    def output_path(self, path: str) -> str:
+        """
+        Give an output path the extension of the output format.
+
+        Args:
+            path: The output path as named after the input, e.g. "out/tweet_bbox.png"
+
+        Returns:
+            str: The path to save to, e.g. "out/tweet_bbox.webp" for 'webp'
+        """
+        if self.format == "keep":
+            return path
+        return os.path.splitext(path)[0] + OUTPUT_EXTENSIONS[self.format]
+
+    def save_params(self, img: "PIL.Image.Image", image_format: str) -> Dict[str, Any]:
+        """
+        Build the Image.save keyword arguments for one output.
+
+        Args:
+            img: The image to save; its info holds the input's metadata
+            image_format: The Pillow format it is saved in, e.g. "PNG"
+
+        Returns:
+            Dict[str, Any]: The keyword arguments
+        """
+        params: Dict[str, Any] = {}
+        quality = QUALITY_PRESETS[self.quality].get(image_format)
+        if quality is not None:
+            params["quality"] = quality
+        if self.optimize:
+            params.update({
+                "JPEG": {"optimize": True, "progressive": True},
+                "WEBP": {"method": 6},
+                "AVIF": {"speed": 4},
+                "PNG": {"optimize": True},
+            }.get(image_format, {}))
+
+        if self.strip_metadata:
+            # PNG and AVIF otherwise copy the ICC profile from the image's info by themselves
+            params["icc_profile"] = None
+        elif image_format in ("JPEG", "WEBP", "AVIF", "PNG"):
+            # The other encoders only write metadata they are handed
+            for key in ("exif", "icc_profile", "xmp"):
+                if img.info.get(key):
+                    params[key] = img.info[key]
+        return params
+
+@dataclass
+class RunContext:
+    """
+    State shared by every image of one process_path run.
+
+    Attributes:
+        cache: The detection result cache, or None when caching is disabled (--no-cache).
+        models: The Gemini models shared by all workers.
+        upload_max_edge: Longest edge of the copy sent to Gemini (0 for full resolution).
+        upload_quality: JPEG quality of the copy sent to Gemini.
+        journal: The journal of a directory run, or None for a single image.
+        limiter: Request/token budgets and adaptive concurrency for Gemini calls.
+        detector: The detector backend. If None, Gemini is used.
+        dedup: Boxes of the run's images by perceptual hash, or None when near-duplicates
+            are not reused (--no-dedup).
+        results: The results sidecar (--results), or None.
+        metrics: Stage timings and retries of the run's images, for the summary at its end.
+        tile_aspect: In general mode, detect images taller than this multiple of their
+            width tile by tile (see tile_layout). 0 disables tiling.
+        tile_overlap: Fraction of a tile's height shared with the next tile.
+        batcher: Packs requests into multi-image prompts (--batch-size), or None.
+        encoding: How the outputs are encoded (--output-format, --output-quality).
+    """
+    cache: Optional[DetectionCache] = None
+    models: ModelPool = field(default_factory=ModelPool)
+    upload_max_edge: int = field(default_factory=lambda: settings.UPLOAD_MAX_EDGE)
+    upload_quality: int = field(default_factory=lambda: settings.UPLOAD_QUALITY)
+    journal: Optional["BatchJournal"] = None
+    limiter: Optional[RateLimiter] = None
+    detector: Optional["Detector"] = None
+    dedup: Optional[NearDuplicateIndex] = None
+    results: Optional[ResultsSidecar] = None
+    metrics: RunMetrics = field(default_factory=RunMetrics)
+    tile_aspect: float = 0.0
+    tile_overlap: float = field(default_factory=lambda: settings.TILE_OVERLAP)
+    batcher: Optional["PromptBatcher"] = None
+    encoding: OutputEncoding = field(default_factory=OutputEncoding.from_settings)
 
 def resolve_path(path: str) -> str:
     """
@@ -211,20 +1535,51 @@ def resolve_path(path: str) -> str:
 
     return absolute_path
 
+def save_output(img: "PIL.Image.Image", path: str, encoding: Optional[OutputEncoding] = None) -> None:
+    """
+    Encode and save an output image, in the format its extension names.
+
+    Args:
+        img: The image to save
+        path: Where to save it
+        encoding: Quality, metadata and effort settings. Defaults to OutputEncoding().
+
+    Raises:
+        OSError: If the image cannot be written
+    """
+    import PIL.Image
+
+    encoding = encoding or OutputEncoding()
+    image_format = PIL.Image.registered_extensions().get(os.path.splitext(path)[1].lower())
+    params = encoding.save_params(img, image_format) if image_format else {}
+
+    # JPEG has no alpha channel or palette, WebP and AVIF no palette
+    if image_format == "JPEG" and img.mode not in ("RGB", "L", "CMYK"):
+        img = img.convert("RGB")
+    elif image_format in ("WEBP", "AVIF") and img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+
+    with span("save"):
+        img.save(path, **params)
+
 def resize_image_with_background(
-    image: PIL.Image.Image,
-    output_path: str
-) -> None:
+    image: "PIL.Image.Image",
+    output_path: str,
+    encoding: Optional[OutputEncoding] = None
+) -> str:
     """
     Resize an image to 1080x1350 while preserving aspect ratio, centered on a background of its primary color.
 
     Args:
         image: The PIL Image object to resize
         output_path: Path to save the resized image. Will be modified to include "_larger" before the extension.
+        encoding: How to encode the output. Defaults to OutputEncoding().
 
     Returns:
-        None
+        str: The path the resized image was saved to
     """
+    import PIL.Image
+
     # Create output filename with _larger suffix
     output_dir = os.path.dirname(output_path)
     output_basename = os.path.basename(output_path)
@@ -256,307 +1611,2707 @@ def resize_image_with_background(
 
     logger.debug(f"Resizing from {img_width}x{img_height} to {new_width}x{new_height} to preserve aspect ratio")
 
-    # Resize image
-    resized_img = image.resize((new_width, new_height), PIL.Image.Resampling.LANCZOS)
+    with span("resize"):
+        # Resize image
+        resized_img = image.resize((new_width, new_height), PIL.Image.Resampling.LANCZOS)
 
-    # Calculate position to paste (center)
-    paste_x = (target_width - new_width) // 2
-    paste_y = (target_height - new_height) // 2
+        # Calculate position to paste (center)
+        paste_x = (target_width - new_width) // 2
+        paste_y = (target_height - new_height) // 2
 
-    # Paste resized image onto background
-    background.paste(resized_img, (paste_x, paste_y))
+        # Paste resized image onto background
+        background.paste(resized_img, (paste_x, paste_y))
 
-    # Save the result with high quality
-    background.save(larger_output_path, quality=92)
+    # The new canvas has no metadata of its own; carry over the input's
+    background.info.update({key: image.info[key] for key in ("exif", "icc_profile", "xmp") if key in image.info})
+    save_output(background, larger_output_path, encoding)
     logger.info(f"Resized image saved to {larger_output_path}")
     print(f"Resized image saved to {larger_output_path}")
+    return larger_output_path
+
+def upload_size(size: Tuple[int, int], max_edge: int) -> Tuple[int, int]:
+    """
+    Size of the copy of an image that is sent to Gemini.
+
+    Args:
+        size: (width, height) of the original
+        max_edge: Longest edge of the upload in pixels. 0 disables downscaling.
+
+    Returns:
+        Tuple[int, int]: (width, height) of the upload
+    """
+    width, height = size
+    if not max_edge or max(width, height) <= max_edge:
+        return size
+    scale = max_edge / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def encode_for_upload(
+    img: "PIL.Image.Image",
+    max_edge: int = settings.UPLOAD_MAX_EDGE,
+    quality: int = settings.UPLOAD_QUALITY
+) -> bytes:
+    """
+    Encode the copy of an image that is sent to Gemini, downscaled to at most `max_edge`.
+
+    Gemini returns boxes normalized to 0-1000, so they apply unchanged to the full-resolution
+    original: the upload only has to be legible, not full size. A 4K phone screenshot shrinks
+    to a fraction of its bytes, which cuts both upload time and model latency.
+
+    The image has already been decoded by load_image, so it is first shrunk by an integer
+    factor with reduce(), a cheap box filter, and only the small remainder goes through
+    the LANCZOS resize.
 
-def is_valid_image(file_path: str) -> bool:
+    Args:
+        img: The decoded image
+        max_edge: Longest edge of the upload in pixels. 0 disables downscaling.
+        quality: JPEG quality of the upload (1-95)
+
+    Returns:
+        bytes: The JPEG-encoded upload
+    """
+    import PIL.Image
+
+    width, height = img.size
+    upload = img
+    target = upload_size(img.size, max_edge)
+
+    # JPEG has no alpha channel or palette, and reduce() cannot shrink a palette image
+    # (a GIF or an 8-bit PNG), so convert before downscaling
+    if upload.mode not in ('RGB', 'L'):
+        upload = upload.convert('RGB')
+
+    if target != img.size:
+        factor = max(width, height) // max_edge
+        if factor >= 2:
+            upload = upload.reduce(factor)
+        upload = upload.resize(target, PIL.Image.Resampling.LANCZOS)
+        logger.debug(f"Downscaled upload from {width}x{height} to {target[0]}x{target[1]}")
+
+    img_byte_arr = io.BytesIO()
+    upload.save(img_byte_arr, format='JPEG', quality=quality)
+    return img_byte_arr.getvalue()
+
+# Extensions of the files a directory run picks up
+IMAGE_EXTENSIONS: Set[str] = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+
+def is_image_candidate(file_path: str) -> bool:
     """
-    Check if a file is a valid image that can be processed.
+    Check whether a file looks like an image worth processing, without opening it.
+
+    Whether it really is an image is only known once load_image decodes it.
 
     Args:
         file_path: Path to the file to check
 
     Returns:
-        bool: True if the file is a valid image, False otherwise
+        bool: True for non-hidden files with an image extension
     """
     # Skip hidden files
     if os.path.basename(file_path).startswith('.'):
         return False
 
-    # Valid image extensions
-    valid_extensions: Set[str] = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+    return os.path.splitext(file_path)[1].lower() in IMAGE_EXTENSIONS
 
-    # Check file extension
-    file_ext = os.path.splitext(file_path)[1].lower()
-    if file_ext not in valid_extensions:
-        return False
+_SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+_AGE_UNITS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60, "w": 7 * 24 * 60 * 60}
 
-    # Try to open the file as an image
-    try:
-        with PIL.Image.open(file_path) as img:
-            img.verify()  # Verify it's an image
-        return True
-    except Exception:
-        logger.debug(f"File {file_path} is not a valid image")
-        return False
+def parse_size(text: str) -> int:
+    """
+    Parse a file size such as "500KB" or "2.5MB". A bare number is bytes.
 
-def process_path(
-    path: str,
-    output_path: Optional[str] = None,
-    mode: str = "tweet",
-    box_color: str = "red",
-    box_width: int = 4,
-    label: Optional[str] = None,
-    autocrop: bool = False,
-    crop_percent: float = 100.0,
-    resize: bool = False,
-    temperature: float = settings.GEMINI_TEMPERATURE
-) -> int:
+    Raises:
+        ValueError: If the text is not a size
     """
-    Process a path which can be either a file or directory.
+    text = text.strip().upper()
+    for unit in sorted(_SIZE_UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * _SIZE_UNITS[unit])
+    return int(text)
+
+def parse_since(text: str, now: Optional[float] = None) -> float:
+    """
+    Parse a --modified-since value into a Unix timestamp.
 
     Args:
-        path: Path to process (file or directory)
-        output_path: Path for the output file(s). If None, default naming is used.
-        mode: Detection mode ('tweet' or 'general')
-        box_color: Color of the bounding box
-        box_width: Width of the bounding box line
-        label: Custom label for the bounding box
-        autocrop: If True, crop the image to the detected area
-        crop_percent: Percentage of tweet height to include when cropping
-        resize: If True, resize the cropped image to 1080x1350
-        temperature: Temperature setting for the Gemini model (0.0-1.0).
-                    Defaults to settings.GEMINI_TEMPERATURE (deterministic).
+        text: An age such as "30m", "12h", "7d" or "2w", or an ISO date or datetime
+            such as "2025-06-01" or "2025-06-01T09:30"
+        now: The time ages are counted back from. Defaults to the current time.
 
     Returns:
-        int: 0 for success, non-zero for failure
+        float: The timestamp
+
+    Raises:
+        ValueError: If the text is neither an age nor an ISO date
     """
-    path_obj = Path(path)
-    success_count = 0
-    failure_count = 0
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([smhdw])', text.strip())
+    if match:
+        return (time.time() if now is None else now) - float(match.group(1)) * _AGE_UNITS[match.group(2)]
+    return datetime.fromisoformat(text.strip()).timestamp()
+
+def _matches_any(patterns: Sequence[str], relative_path: str) -> bool:
+    # Patterns with a slash match the path below the root, others just the name
+    name = relative_path.rsplit('/', 1)[-1]
+    return any(fnmatch.fnmatch(relative_path if '/' in pattern else name, pattern) for pattern in patterns)
+
+@dataclass
+class DiscoveryFilter:
+    """
+    Which files of a directory a run processes, on top of is_image_candidate.
 
-    if path_obj.is_file():
-        # Process a single file
-        if is_valid_image(str(path_obj)):
-            result = process_single_image(
-                str(path_obj), output_path, mode, box_color,
-                box_width, label, autocrop, crop_percent, resize, temperature
-            )
-            return 0 if result else 1
-        else:
-            logger.error(f"Not a valid image file: {path}")
-            print(f"Error: Not a valid image file: {path}")
-            return 1
+    Attributes:
+        recursive: Descend into subdirectories (hidden ones are always skipped)
+        include: Globs a file must match one of, if any are given
+        exclude: Globs of files and directories to skip
+        min_size: Smallest file size in bytes
+        max_size: Largest file size in bytes
+        modified_since: Unix timestamp a file must have been modified at or after
+
+    Globs containing a "/" are matched against the path relative to the root of the run
+    (where "*" also matches "/"), others against the file or directory name.
+    """
+    recursive: bool = False
+    include: Sequence[str] = ()
+    exclude: Sequence[str] = ()
+    min_size: Optional[int] = None
+    max_size: Optional[int] = None
+    modified_since: Optional[float] = None
+
+    def accepts_file(self, relative_path: str, stat: os.stat_result) -> bool:
+        """Check a file against the globs and the size and modification time limits."""
+        if self.include and not _matches_any(self.include, relative_path):
+            return False
+        if self.exclude and _matches_any(self.exclude, relative_path):
+            return False
+        if self.min_size is not None and stat.st_size < self.min_size:
+            return False
+        if self.max_size is not None and stat.st_size > self.max_size:
+            return False
+        return self.modified_since is None or stat.st_mtime >= self.modified_since
+
+    def accepts_directory(self, relative_path: str) -> bool:
+        """Check whether a subdirectory should be descended into."""
+        return self.recursive and not (self.exclude and _matches_any(self.exclude, relative_path))
+
+def discover_images(
+    root: str,
+    filters: Optional[DiscoveryFilter] = None,
+    skip_directories: Iterable[str] = ()
+) -> Iterator[str]:
+    """
+    Find the image files of a directory tree, yielding each one as soon as it is found.
 
-    elif path_obj.is_dir():
-        # Process all image files in the directory
-        logger.info(f"Processing all images in directory: {path}")
-        print(f"Processing all images in directory: {path}")
+    Built on os.scandir, whose entries carry the file type (and on most platforms what
+    stat needs) from the directory listing itself, so filtering costs no extra system
+    calls per file. The walk is a generator so that a run starts processing the first
+    images while the rest of the tree is still being listed. Each directory is listed
+    and sorted in full, so the order is stable, and its files come before its
+    subdirectories. Symlinked directories are not followed.
 
-        for item in path_obj.glob('*'):
-            if item.is_file() and is_valid_image(str(item)):
-                # For directories, we need to generate output paths for each file
-                if output_path:
-                    # If explicit output directory is provided, use it
-                    output_dir = Path(output_path)
-                    if not output_dir.exists():
-                        output_dir.mkdir(parents=True, exist_ok=True)
-
-                    # Create output filename based on input filename with suffix
-                    input_name, input_ext = os.path.splitext(item.name)
-                    suffix = "_cropped" if autocrop else "_bbox"
-                    output_filename = f"{input_name}{suffix}{input_ext}"
-                    file_output_path = str(output_dir / output_filename)
-                else:
-                    # Generate output path based on input file
-                    input_name, input_ext = os.path.splitext(item.name)
-                    suffix = "_cropped" if autocrop else "_bbox"
-                    output_filename = f"{input_name}{suffix}{input_ext}"
-                    file_output_path = str(item.parent / output_filename)
-
-                logger.info(f"Processing image: {item.name}")
-                print(f"Processing image: {item.name}")
-
-                result = process_single_image(
-                    str(item), file_output_path, mode, box_color,
-                    box_width, label, autocrop, crop_percent, resize, temperature
-                )
+    Args:
+        root: The directory to search
+        filters: Which files to yield. Defaults to the images directly in root.
+        skip_directories: Directories never to descend into, such as an output
+            directory inside the tree
 
-                if result:
-                    success_count += 1
-                else:
-                    failure_count += 1
+    Yields:
+        str: Paths of the matching files
+    """
+    filters = filters or DiscoveryFilter()
+    skip = {os.path.realpath(directory) for directory in skip_directories}
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as listing:
+                entries = sorted(listing, key=lambda entry: entry.name)
+        except OSError as e:
+            logger.warning(f"Cannot list {directory}: {e}")
+            continue
+
+        subdirectories = []
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            relative_path = os.path.relpath(entry.path, root).replace(os.sep, '/')
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if filters.accepts_directory(relative_path) and os.path.realpath(entry.path) not in skip:
+                        subdirectories.append(entry.path)
+                elif entry.is_file() and is_image_candidate(entry.name) and filters.accepts_file(relative_path, entry.stat()):
+                    yield entry.path
+            except OSError as e:
+                # Vanished or unreadable since the listing
+                logger.warning(f"Cannot check {entry.path}: {e}")
 
-        logger.info(f"Processing completed. Successful: {success_count}, Failed: {failure_count}")
-        print(f"Processing completed. Successful: {success_count}, Failed: {failure_count}")
+        # Reversed, so the stack pops them in name order
+        stack.extend(reversed(subdirectories))
 
-        return 0 if failure_count == 0 else 1
-    else:
-        logger.error(f"Path does not exist: {path}")
-        print(f"Error: Path does not exist: {path}")
-        return 1
+@dataclass
+class LoadedImage:
+    """
+    An image file that has been read and hashed once, and decoded once in this process.
 
-def process_single_image(
-    image_path: str,
-    output_path: str,
-    mode: str = "tweet",
-    box_color: str = "red",
-    box_width: int = 4,
+    Attributes:
+        path: Path to the image file
+        sha256: Hex sha256 of the file's bytes
+        image: The fully decoded image
+        data: The file's bytes, kept so a render worker process can decode the image
+            (see decode_image) without reading the file again
+    """
+    path: str
+    sha256: str
+    image: "PIL.Image.Image"
+    data: bytes = b""
+
+def decode_image(path: str, data: bytes) -> "PIL.Image.Image":
+    """
+    Fully decode the bytes of an image file.
+
+    Args:
+        path: Path to the image file, for messages
+        data: The file's bytes
+
+    Returns:
+        PIL.Image.Image: The decoded image
+
+    Raises:
+        InvalidImageError: If the bytes cannot be decoded as an image.
+    """
+    import PIL.Image
+
+    try:
+        img = PIL.Image.open(io.BytesIO(data))
+        # Decode now, so truncated or corrupt files fail here rather than mid-render
+        img.load()
+    except (OSError, SyntaxError, ValueError, PIL.Image.DecompressionBombError) as e:
+        logger.debug(f"Could not decode {path}: {e}")
+        raise InvalidImageError(f"Not a valid image file: {path}") from e
+    return img
+
+def load_image(path: str, data: Optional[bytes] = None) -> LoadedImage:
+    """
+    Read, hash and decode an image file in a single pass.
+
+    This is the only place an input file is opened. The old flow opened each file to
+    verify() it during a serial pre-pass over the whole directory, opened it again to
+    decode it, and read it a third time to hash it for the cache. Now every later stage
+    (cache key, upload, crop, draw) works from what this returns, and a file that is
+    not really an image is rejected here, inside the worker, as part of normal processing.
+
+    The file is read and hashed once per run, and decoded once per process that needs
+    its pixels: with render worker processes (the default for a directory), the worker
+    decodes the bytes it is sent again rather than being sent the pixels (see
+    process_batch), but never reads the file a second time. That decode is timed as
+    the "redecode" stage.
+
+    Args:
+        path: Path to the image file
+        data: The file's bytes, when another process already read them
+
+    Returns:
+        LoadedImage: The file's hash and decoded image
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist.
+        InvalidImageError: If the file cannot be decoded as an image.
+    """
+    if data is None:
+        with span("read"), open(path, 'rb') as f:
+            data = f.read()
+
+    with span("decode"):
+        img = decode_image(path, data)
+
+    logger.debug(f"Loaded {path}: {img.format} {img.size[0]}x{img.size[1]}, {len(data)} bytes")
+    with span("hash"):
+        sha256 = hashlib.sha256(data).hexdigest()
+    return LoadedImage(path=path, sha256=sha256, image=img, data=data)
+
+def default_output_path(
+    image_path: Path,
+    output_dir: Optional[str],
+    autocrop: bool,
+    root: Optional[Path] = None
+) -> str:
+    """
+    Build the output path for one image of a directory run.
+
+    Args:
+        image_path: Path to the input image
+        output_dir: Directory to write into. If None, the output goes next to the input.
+        autocrop: If True, use the "_cropped" suffix instead of "_bbox"
+        root: The directory the run was given. Images in its subdirectories get the same
+            subdirectories under output_dir, so equal names cannot collide.
+
+    Returns:
+        str: The output path, e.g. "out/tweet_bbox.png" for "in/tweet.png", or
+            "out/2024/tweet_bbox.png" for "in/2024/tweet.png" with root "in"
+    """
+    input_name, input_ext = os.path.splitext(image_path.name)
+    suffix = "_cropped" if autocrop else "_bbox"
+    if output_dir is None:
+        parent = image_path.parent
+    elif root is None:
+        parent = Path(output_dir)
+    else:
+        parent = Path(output_dir) / image_path.parent.relative_to(root)
+    return str(parent / f"{input_name}{suffix}{input_ext}")
+
+def default_render_workers() -> int:
+    """
+    The number of render processes when RENDER_WORKERS is not set: one per CPU core.
+
+    With a single core there is nothing to run in parallel, so rendering stays in the
+    request threads (0) rather than paying to pickle every job to another process.
+    """
+    cores = os.cpu_count() or 1
+    return cores if cores > 1 else 0
+
+def init_render_worker(level: int) -> None:
+    """
+    Set up logging in a render worker process.
+
+    Forked workers inherit the parent's handlers; spawned ones (the default on macOS)
+    start unconfigured and only need the same level.
+
+    Args:
+        level: The parent's log level for the bboxes logger
+    """
+    if level <= logging.INFO and not logging.getLogger().handlers:
+        setup_logging(level <= logging.DEBUG)
+    logger.setLevel(level)
+
+async def process_batch(
+    jobs: Iterable[Tuple[str, str]],
+    concurrency: int,
+    render_workers: int = 0,
+    on_result: Optional[Callable[["ImageResult"], None]] = None,
+    **options: Any
+) -> Tuple[int, int, int]:
+    """
+    Process many images concurrently, reporting each one as it finishes.
+
+    Every image costs a Gemini round trip of several seconds, so a serial loop spends
+    nearly all of its time waiting on the network. Instead, `concurrency` workers pull
+    jobs from a queue and run the network stage (load, detect) in a thread pool of the
+    same size, so N requests are in flight at any moment.
+
+    With render_workers, the CPU-bound rest (decode, crop, resize, encode and save) runs
+    in a pool of that many processes. Once requests overlap, that work outgrows what one
+    interpreter's threads can do while holding the GIL. The network stage hands each
+    detection to the render stage through a bounded queue: while renders are backed up,
+    the network workers wait rather than piling up decoded images in memory, and while
+    requests are in flight, the render processes keep the cores busy.
+
+    Jobs may come from a generator, such as one walking a directory tree: it is advanced
+    in a thread, one job at a time as the workers free up, so the first images are in
+    flight while the rest are still being found. Without a length, progress shows only
+    the count so far.
+
+    Args:
+        jobs: (image_path, output_path) pairs to process
+        concurrency: Maximum number of images in the network stage at once
+        render_workers: Number of render processes. 0 renders in the network threads.
+        on_result: Called with every result once it is final
+        **options: Keyword arguments passed through to process_image. When options["ctx"]
+            has a journal or a results sidecar, every result is recorded in them.
+
+    Returns:
+        Tuple[int, int, int]: (success count, failure count, count of files skipped as not images)
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    queue: "asyncio.Queue[Optional[Tuple[str, str]]]" = asyncio.Queue(maxsize=concurrency)
+    renders: "asyncio.Queue[Optional[Tuple[ImageResult, RenderJob, float]]]" = asyncio.Queue(maxsize=2 * max(1, render_workers))
+    total = len(jobs) if isinstance(jobs, Sized) else None
+    counts = {"done": 0, "failed": 0, "skipped": 0}
+    ctx: Optional[RunContext] = options.get("ctx")
+
+    def finish(result: ImageResult, started: float) -> None:
+        result.elapsed = time.monotonic() - started
+        if ctx and ctx.journal:
+            ctx.journal.record(result, options.get("mode", "tweet"))
+        if ctx and ctx.results:
+            ctx.results.record(result, options.get("mode", "tweet"))
+        if ctx:
+            ctx.metrics.record(result)
+        if on_result:
+            on_result(result)
+
+        status = result.status
+        counts[status] += 1
+        finished = sum(counts.values())
+        progress = f"{finished}/{total}" if total is not None else str(finished)
+        description = {"done": "Done", "failed": "Failed", "skipped": "Skipped (not an image)"}[status]
+        logger.info(f"[{progress}] {description}: {result.image_path}")
+        # Flushed, so lines printed by render worker processes never land mid-line
+        print(f"[{progress}] {description}: {os.path.basename(result.image_path)}", flush=True)
+
+    async def produce() -> None:
+        job_iterator = iter(jobs)
+        # A generator may block on I/O (listing directories), so it is advanced off the loop
+        while (job := await loop.run_in_executor(None, next, job_iterator, None)) is not None:
+            await queue.put(job)
+        # One sentinel per worker so every worker exits once the jobs run out
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def work(executor: ThreadPoolExecutor) -> None:
+        while (job := await queue.get()) is not None:
+            image_path, file_output_path = job
+            started = time.monotonic()
+            if not render_workers:
+                result = await loop.run_in_executor(
+                    executor,
+                    functools.partial(process_image, image_path, file_output_path, **options)
+                )
+                finish(result, started)
+                continue
+
+            result, render = await loop.run_in_executor(
+                executor,
+                functools.partial(detect_image, image_path, file_output_path, **options)
+            )
+            if render is None:
+                finish(result, started)
+            else:
+                # The worker decodes render.data again (its "redecode" stage): the pixels
+                # cost far more to pickle. Free them here now rather than at the next GC.
+                render.image.close()
+                render.image = None
+                await renders.put((result, render, started))
+
+    async def network(executor: ThreadPoolExecutor) -> None:
+        await asyncio.gather(*(work(executor) for _ in range(concurrency)))
+        for _ in range(render_workers):
+            await renders.put(None)
+
+    async def render(pool: ProcessPoolExecutor) -> None:
+        while (item := await renders.get()) is not None:
+            result, job, started = item
+            try:
+                result.regions, stats = await loop.run_in_executor(pool, render_job, job)
+                result.add_stats(stats)
+                logger.info(f"Successfully processed: {result.image_path}")
+                result.status = "done"
+            except Exception as e:
+                logger.error(f"Error rendering image {result.image_path}: {e}")
+                print(f"Error rendering image {result.image_path}: {e}")
+                result.error = str(e)
+            finish(result, started)
+
+    pool_context = ProcessPoolExecutor(
+        max_workers=render_workers,
+        initializer=init_render_worker,
+        initargs=(logger.getEffectiveLevel(),)
+    ) if render_workers else nullcontext()
+
+    with pool_context as pool:
+        if pool:
+            # Start the render processes before any thread exists: forking a process
+            # that has threads can deadlock the child
+            await loop.run_in_executor(pool, int)
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bboxes") as executor:
+            stages = [produce(), network(executor), *(render(pool) for _ in range(render_workers))]
+            await asyncio.gather(*stages)
+
+    return counts["done"], counts["failed"], counts["skipped"]
+
+def process_path(
+    path: str,
+    output_path: Optional[str] = None,
+    mode: str = "tweet",
+    box_color: str = "red",
+    box_width: int = 4,
+    label: Optional[str] = None,
+    autocrop: bool = False,
+    crop_percent: float = 100.0,
+    resize: bool = False,
+    temperature: float = settings.GEMINI_TEMPERATURE,
+    concurrency: int = settings.BATCH_CONCURRENCY,
+    use_cache: bool = True,
+    upload_max_edge: int = settings.UPLOAD_MAX_EDGE,
+    upload_quality: int = settings.UPLOAD_QUALITY,
+    resume: bool = False,
+    detector: str = settings.DETECTOR,
+    render_workers: Optional[int] = settings.RENDER_WORKERS,
+    dedup_distance: Optional[int] = settings.DEDUP_DISTANCE,
+    discovery: Optional[DiscoveryFilter] = None,
+    results_path: Optional[str] = None,
+    replay_results: Optional[str] = None,
+    profile_path: Optional[str] = None,
+    tile: bool = False,
+    tile_overlap: float = settings.TILE_OVERLAP,
+    batch_size: int = settings.PROMPT_BATCH_SIZE,
+    encoding: Optional[OutputEncoding] = None
+) -> int:
+    """
+    Process a path which can be either a file or directory.
+
+    Args:
+        path: Path to process (file or directory)
+        output_path: Path for the output file(s). If None, default naming is used.
+        mode: Detection mode ('tweet' or 'general')
+        box_color: Color of the bounding box
+        box_width: Width of the bounding box line
+        label: Custom label for the bounding box
+        autocrop: If True, crop the image to the detected area
+        crop_percent: Percentage of tweet height to include when cropping
+        resize: If True, resize the cropped image to 1080x1350
+        temperature: Temperature setting for the Gemini model (0.0-1.0).
+                    Defaults to settings.GEMINI_TEMPERATURE (deterministic).
+        concurrency: Maximum number of images processed at once for a directory.
+                    Defaults to settings.BATCH_CONCURRENCY.
+        use_cache: If True, reuse and store detections in the on-disk detection cache.
+        upload_max_edge: Longest edge of the copy sent to Gemini (0 for full resolution).
+        upload_quality: JPEG quality of the copy sent to Gemini.
+        resume: For a directory, skip images that the journal of an earlier run records
+                as done instead of starting a new journal.
+        detector: Detector backend, one of DETECTORS, or "replay" to re-render boxes
+                    stored by an earlier run. Defaults to settings.DETECTOR.
+        render_workers: For a directory, number of processes that render the outputs
+                    (0 renders in the request threads). None means one per CPU core.
+        dedup_distance: Reuse the boxes of an earlier image of the run whose perceptual
+                    hash is at most this many bits away. None disables the reuse.
+        discovery: For a directory, which files to process (subdirectories, globs,
+                    size and age). Defaults to the images directly in the directory.
+        results_path: Write a JSONL record of every image to this file (see
+                    ResultsSidecar). With resume, records are appended to it.
+        replay_results: With detector "replay", the results sidecar to take the boxes
+                    from. If None, they come from the detection cache.
+        profile_path: Instead of processing the path, profile one image of it with
+                    cProfile and write the stats to this file (see profile_image).
+        tile: In general mode, detect images taller than settings.TILE_ASPECT times
+                    their width in overlapping tiles (see tile_layout).
+        tile_overlap: Fraction of a tile's height shared with the next tile.
+        batch_size: For a directory, number of images packed into one Gemini request
+                    (see PromptBatcher); at most `concurrency` are. 1 disables batching.
+        encoding: Format, quality preset, metadata and effort of the outputs; the format
+                    also sets their extension. Defaults to the OUTPUT_* settings.
+
+    Returns:
+        int: 0 for success, non-zero for failure
+    """
+    path_obj = Path(path)
+    ctx = RunContext(
+        cache=DetectionCache.from_settings() if use_cache else None,
+        upload_max_edge=upload_max_edge,
+        upload_quality=upload_quality,
+        limiter=RateLimiter.from_settings(concurrency),
+        detector=make_detector(detector, replay_results),
+        dedup=NearDuplicateIndex(dedup_distance) if dedup_distance is not None else None,
+        results=ResultsSidecar(results_path, append=resume) if results_path else None,
+        tile_aspect=settings.TILE_ASPECT if tile else 0.0,
+        tile_overlap=tile_overlap,
+        encoding=encoding or OutputEncoding.from_settings()
+    )
+    # Only workers running at the same time can share a request
+    batch_size = min(batch_size, concurrency)
+    if batch_size > 1 and path_obj.is_dir() and not profile_path:
+        ctx.batcher = PromptBatcher(batch_size, settings.PROMPT_BATCH_LINGER_MS / 1000)
+
+    try:
+        if profile_path:
+            return profile_image(
+                path_obj, output_path, profile_path, ctx, discovery, mode=mode, box_color=box_color,
+                box_width=box_width, label=label, autocrop=autocrop, crop_percent=crop_percent,
+                resize=resize, temperature=temperature
+            )
+        return _process_path(
+            path_obj, output_path, mode, box_color, box_width, label,
+            autocrop, crop_percent, resize, temperature, concurrency, resume, ctx,
+            default_render_workers() if render_workers is None else render_workers,
+            discovery
+        )
+    finally:
+        if ctx.journal:
+            ctx.journal.close()
+        if ctx.results:
+            ctx.results.close()
+        if isinstance(ctx.detector, LocalThenGeminiDetector):
+            logger.info(f"Local detector handled {ctx.detector.local_count} images, {ctx.detector.escalated_count} went to Gemini")
+            print(f"Local detector handled {ctx.detector.local_count} images, {ctx.detector.escalated_count} went to Gemini")
+        if ctx.limiter.throttled:
+            logger.info(f"Gemini throttled {ctx.limiter.throttled} requests; concurrency settled at {int(ctx.limiter.limit)}")
+            print(f"Gemini throttled {ctx.limiter.throttled} requests; concurrency settled at {int(ctx.limiter.limit)}")
+        if ctx.models.mock:
+            stats = ctx.models.mock_stats
+            logger.info(f"Mock Gemini answered {stats.calls} requests ({stats.errors} errors, {stats.throttled} throttled)")
+        if ctx.dedup and ctx.dedup.lookups:
+            rate = ctx.dedup.hits / ctx.dedup.lookups
+            logger.info(f"Near-duplicates: reused boxes for {ctx.dedup.hits} of {ctx.dedup.lookups} detections ({rate:.0%}), rejected {ctx.dedup.rejected} hash matches")
+            print(f"Near-duplicates: reused boxes for {ctx.dedup.hits} of {ctx.dedup.lookups} detections ({rate:.0%})")
+        if ctx.batcher and ctx.batcher.requests:
+            batcher = ctx.batcher
+            logger.info(f"Batched prompts: {batcher.requests} requests for {batcher.images} images, {batcher.fallbacks} asked again on their own")
+            print(f"Batched prompts: {batcher.requests} requests for {batcher.images} images, {batcher.fallbacks} asked again on their own")
+        if ctx.cache:
+            ctx.cache.evict()
+            logger.info(f"Detection cache: {ctx.cache.hits} hits, {ctx.cache.misses} misses")
+        summary = "\n".join(ctx.metrics.summary())
+        if summary:
+            logger.info(f"Run summary:\n{summary}")
+            if len(ctx.metrics.latencies) > 1:
+                print(summary)
+
+def _process_path(
+    path_obj: Path,
+    output_path: Optional[str],
+    mode: str,
+    box_color: str,
+    box_width: int,
+    label: Optional[str],
+    autocrop: bool,
+    crop_percent: float,
+    resize: bool,
+    temperature: float,
+    concurrency: int,
+    resume: bool,
+    ctx: RunContext,
+    render_workers: int = 0,
+    discovery: Optional[DiscoveryFilter] = None
+) -> int:
+    """The body of process_path, run with the run's shared state already set up."""
+    path = str(path_obj)
+
+    if path_obj.is_file():
+        # Process a single file
+        result = None
+        if is_image_candidate(path):
+            started = time.monotonic()
+            result = process_image(
+                path, output_path and ctx.encoding.output_path(output_path), mode, box_color,
+                box_width, label, autocrop, crop_percent, resize, temperature, ctx
+            )
+            result.elapsed = time.monotonic() - started
+            if ctx.results:
+                ctx.results.record(result, mode)
+            ctx.metrics.record(result)
+
+        if result is None or result.status == "skipped":
+            logger.error(f"Not a valid image file: {path}")
+            print(f"Error: Not a valid image file: {path}")
+            return 1
+        return 0 if result.status == "done" else 1
+
+    elif path_obj.is_dir():
+        # Process all image files in the directory
+        logger.info(f"Processing all images in directory: {path}")
+        print(f"Processing all images in directory: {path}")
+
+        if output_path:
+            # If explicit output directory is provided, use it
+            Path(output_path).mkdir(parents=True, exist_ok=True)
+
+        journal_path = Path(output_path or path) / BatchJournal.FILENAME
+        ctx.journal = BatchJournal(journal_path, resume=resume, options={
+            "box_color": box_color, "box_width": box_width, "label": label, "autocrop": autocrop,
+            "crop_percent": crop_percent, "resize": resize, "temperature": temperature,
+            "encoding": asdict(ctx.encoding),
+        })
+        resumed = 0
+
+        def discover_jobs() -> Iterator[Tuple[str, str]]:
+            # Streamed into process_batch, so a large tree starts processing at once
+            nonlocal resumed
+            skip_directories = [output_path] if output_path else []
+            for image_path in discover_images(path, discovery, skip_directories):
+                file_output_path = ctx.encoding.output_path(default_output_path(Path(image_path), output_path, autocrop, path_obj))
+                if resume and ctx.journal.is_done(image_path, mode, file_output_path):
+                    resumed += 1
+                    continue
+                os.makedirs(os.path.dirname(file_output_path) or '.', exist_ok=True)
+                yield image_path, file_output_path
+
+        logger.info(f"Processing images with concurrency {concurrency} and {render_workers} render workers")
+        print(f"Processing images, {concurrency} at a time")
+
+        import asyncio
+
+        success_count, failure_count, skipped_count = asyncio.run(process_batch(
+            discover_jobs(),
+            concurrency,
+            render_workers,
+            mode=mode,
+            box_color=box_color,
+            box_width=box_width,
+            label=label,
+            autocrop=autocrop,
+            crop_percent=crop_percent,
+            resize=resize,
+            temperature=temperature,
+            ctx=ctx
+        ))
+
+        if resume:
+            logger.info(f"Resumed from {journal_path}: skipped {resumed} images already done")
+            print(f"Resumed: skipped {resumed} images already done")
+        logger.info(f"Processing completed. Successful: {success_count}, Failed: {failure_count}, Skipped: {skipped_count}")
+        print(f"Processing completed. Successful: {success_count}, Failed: {failure_count}, Skipped: {skipped_count}")
+
+        return 0 if failure_count == 0 else 1
+    else:
+        logger.error(f"Path does not exist: {path}")
+        print(f"Error: Path does not exist: {path}")
+        return 1
+
+def profile_image(
+    path_obj: Path,
+    output_path: Optional[str],
+    profile_path: str,
+    ctx: RunContext,
+    discovery: Optional[DiscoveryFilter] = None,
+    **options: Any
+) -> int:
+    """
+    Process one image under cProfile and write the stats to a file (--profile).
+
+    The stage timings show how long each step takes; the profile shows why, down to the
+    function. Only one image is processed, in the calling thread, so that every stage,
+    from decoding through the request to saving, is in the profile. For a directory it
+    is the first file the discovery finds that decodes as an image. The SDK and Pillow's
+    plugins are imported beforehand, so the profile shows the cost of an image rather
+    than of starting up.
+
+    Args:
+        path_obj: The image, or the directory to take the first image from
+        output_path: The output file, or for a directory the output directory
+        profile_path: Where to write the stats, for pstats or a viewer such as snakeviz
+        ctx: Shared state of the run
+        discovery: For a directory, which files to consider
+        **options: Keyword arguments passed through to process_image
+
+    Returns:
+        int: 0 for success, non-zero for failure
+    """
+    import cProfile
+    import pstats
+    import PIL.Image
+
+    autocrop = options.get("autocrop", False)
+    if path_obj.is_dir():
+        candidates = [
+            (image_path, ctx.encoding.output_path(default_output_path(Path(image_path), output_path, autocrop, path_obj)))
+            for image_path in discover_images(str(path_obj), discovery)
+        ]
+    else:
+        candidates = [(str(path_obj), ctx.encoding.output_path(output_path or default_output_path(path_obj, None, autocrop)))]
+
+    PIL.Image.init()
+    if not isinstance(ctx.detector, (LocalTweetDetector, StoredBoxesDetector)):
+        ctx.models.get(options.get("mode", "tweet"), options.get("temperature", settings.GEMINI_TEMPERATURE))
+
+    for image_path, file_output_path in candidates:
+        os.makedirs(os.path.dirname(file_output_path) or '.', exist_ok=True)
+        profiler = cProfile.Profile()
+        started = time.monotonic()
+        result = profiler.runcall(process_image, image_path, file_output_path, ctx=ctx, **options)
+        result.elapsed = time.monotonic() - started
+        if result.status != "skipped":
+            break
+    else:
+        logger.error(f"No images to profile in {path_obj}")
+        print(f"Error: No images to profile in {path_obj}")
+        return 1
+
+    if ctx.results:
+        ctx.results.record(result, options.get("mode", "tweet"))
+    ctx.metrics.record(result)
+    profiler.dump_stats(profile_path)
+    logger.info(f"Wrote the profile of {image_path} to {profile_path}")
+    print(f"Profile of {image_path} written to {profile_path}. Slowest functions, by cumulative time:")
+    pstats.Stats(profiler, stream=sys.stdout).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(20)
+    return 0 if result.status == "done" else 1
+
+@dataclass
+class ImageResult:
+    """
+    The outcome of processing one image.
+
+    Attributes:
+        image_path: Path to the input image
+        output_path: Path the output was saved to (for general mode with autocrop, the
+            base name the per-object files are derived from)
+        status: "done", "failed", or "skipped" when the file is not an image
+        sha256: Hex sha256 of the input, once it has been read
+        boxes: The detected boxes, normalized to 0-1000, once detection has succeeded
+        error: The error message of a failed or skipped image
+        elapsed: Seconds from when a batch worker took the image until its result was final
+        image_size: (width, height) of the input, once it has been read
+        regions: What was drawn or cropped, as returned by render_tweet_box or
+            render_object_boxes, once the output is saved
+        requests: Number of Gemini requests made for the image (0 when the boxes came
+            from the cache, a near-duplicate or the local detector)
+        retries: Number of those requests that were retried after an error
+        stages: Seconds spent in each stage of the image (see span)
+    """
+    image_path: str
+    output_path: str
+    status: str
+    sha256: Optional[str] = None
+    boxes: Optional[List[Dict[str, Any]]] = None
+    error: Optional[str] = None
+    elapsed: Optional[float] = None
+    image_size: Optional[Tuple[int, int]] = None
+    regions: Optional[List[Dict[str, Any]]] = None
+    requests: int = 0
+    retries: int = 0
+    stages: Dict[str, float] = field(default_factory=dict)
+
+    def add_stats(self, stats: ImageStats) -> None:
+        """Add the requests, retries and stage timings of one part of the image's processing."""
+        self.requests += stats.requests
+        self.retries += stats.retries
+        for stage, seconds in stats.stages.items():
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+@dataclass
+class RenderJob:
+    """
+    Everything needed to draw or crop the detected boxes of one image and save the result.
+
+    Jobs are pickled to render worker processes, so they carry the file's bytes rather
+    than an open file or (unless rendering in-process) the decoded pixels.
+
+    Attributes:
+        image_path: Path to the input image
+        output_path: Path to save the output to
+        mode: Detection mode ('tweet' or 'general')
+        boxes: The detected boxes, normalized to 0-1000
+        options: The rendering keyword arguments of process_image (box_color, box_width,
+            label, autocrop, crop_percent, resize)
+        data: The input file's bytes
+        image: The already decoded image, when rendering in the same process
+    """
+    image_path: str
+    output_path: str
+    mode: str
+    boxes: List[Dict[str, Any]]
+    options: Dict[str, Any]
+    data: bytes = b""
+    image: Optional["PIL.Image.Image"] = None
+
+def render_job(job: RenderJob) -> Tuple[List[Dict[str, Any]], ImageStats]:
+    """
+    Draw or crop the boxes of one image and save the result; the CPU-bound stage of an image.
+
+    Args:
+        job: The image, its boxes and the rendering options
+
+    Returns:
+        Tuple[List[Dict[str, Any]], ImageStats]: The rendered regions, as returned by
+            render_tweet_box or render_object_boxes, and the timings of the render stages
+
+    Raises:
+        InvalidImageError: If the image bytes cannot be decoded
+        OSError: If the output cannot be written
+    """
+    with collecting_stats() as stats:
+        image = job.image
+        if image is None:
+            # Hashed and checked already; only the pixels are needed again
+            with span("redecode"):
+                image = decode_image(job.image_path, job.data)
+        options = job.options
+        if job.mode == "tweet":
+            regions = render_tweet_box(
+                image, job.boxes[0], job.output_path, options["box_color"], options["box_width"],
+                options["label"], options["autocrop"], options["crop_percent"], options["resize"],
+                options.get("encoding")
+            )
+        else:
+            regions = render_object_boxes(
+                image, job.boxes, job.output_path, options["box_color"], options["box_width"],
+                options["autocrop"], options["resize"], options.get("encoding")
+            )
+    # A render worker's prints would otherwise sit in its buffer until it exits
+    sys.stdout.flush()
+    return regions, stats
+
+def detect_image(
+    image_path: str,
+    output_path: str,
+    mode: str = "tweet",
+    box_color: str = "red",
+    box_width: int = 4,
+    label: Optional[str] = None,
+    autocrop: bool = False,
+    crop_percent: float = 100.0,
+    resize: bool = False,
+    temperature: float = settings.GEMINI_TEMPERATURE,
+    ctx: Optional[RunContext] = None,
+    image: Optional[LoadedImage] = None
+) -> Tuple[ImageResult, Optional[RenderJob]]:
+    """
+    Load an image and detect its boxes: the network stage of process_image.
+
+    Never raises: every error ends up in the returned ImageResult. Takes the same
+    arguments as process_image.
+
+    Returns:
+        Tuple[ImageResult, Optional[RenderJob]]: The result so far, whose status stays
+            "failed" until the render succeeds, and the job that renders the output, or
+            None when the image was skipped or detection failed
+    """
+    result = ImageResult(image_path=image_path, output_path=output_path, status="failed")
+
+    with collecting_stats() as stats:
+        try:
+            loaded = image or load_image(image_path)
+            result.sha256 = loaded.sha256
+            result.image_size = loaded.image.size
+
+            if mode == "tweet":
+                logger.info(f"Using tweet content detection mode for {image_path}")
+            else:  # general mode
+                logger.info(f"Using general object detection mode for {image_path}")
+            detector = ctx.detector if ctx and ctx.detector else GeminiDetector()
+            result.boxes = detector.detect(loaded, mode, temperature, ctx).boxes
+        except InvalidImageError as e:
+            logger.debug(str(e))
+            result.status, result.error = "skipped", str(e)
+            return result, None
+        except Exception as e:
+            if result.sha256 is None:
+                logger.error(f"Error reading image {image_path}: {e}")
+                print(f"Error reading image {image_path}: {e}")
+            else:
+                logger.exception(f"Error processing image {image_path}: {e}")
+                print(f"Error processing image {image_path}: {e}")
+            result.error = str(e)
+            return result, None
+        finally:
+            result.add_stats(stats)
+
+    options = {
+        "box_color": box_color, "box_width": box_width, "label": label,
+        "autocrop": autocrop, "crop_percent": crop_percent, "resize": resize,
+        "encoding": ctx.encoding if ctx else None,
+    }
+    return result, RenderJob(image_path, output_path, mode, result.boxes, options, loaded.data, loaded.image)
+
+def process_image(
+    image_path: str,
+    output_path: str,
+    mode: str = "tweet",
+    box_color: str = "red",
+    box_width: int = 4,
+    label: Optional[str] = None,
+    autocrop: bool = False,
+    crop_percent: float = 100.0,
+    resize: bool = False,
+    temperature: float = settings.GEMINI_TEMPERATURE,
+    ctx: Optional[RunContext] = None,
+    image: Optional[LoadedImage] = None
+) -> ImageResult:
+    """
+    Process a single image file and describe what happened.
+
+    Never raises: every error ends up in the returned ImageResult.
+
+    Args:
+        image_path: Path to the input image file
+        output_path: Path to save the output image with bounding box
+        mode: Detection mode ('tweet' or 'general')
+        box_color: Color of the bounding box (name or hex code)
+        box_width: Width of the bounding box line
+        label: Custom label for the bounding box
+        autocrop: If True, crop the image to the detected area
+        crop_percent: Percentage of tweet height to include when cropping
+        resize: If True, resize the cropped image to 1080x1350
+        temperature: Temperature setting for the Gemini model (0.0-1.0).
+                    Defaults to settings.GEMINI_TEMPERATURE (deterministic).
+        ctx: Shared state of the current run (detector, cache, models, upload settings). Defaults to None.
+        image: The already loaded image. If None, it is loaded from image_path.
+
+    Returns:
+        ImageResult: The status, and the boxes when detection succeeded
+    """
+    result, job = detect_image(
+        image_path, output_path, mode, box_color, box_width, label,
+        autocrop, crop_percent, resize, temperature, ctx, image
+    )
+    if job is None:
+        return result
+
+    try:
+        result.regions, stats = render_job(job)
+        result.add_stats(stats)
+        logger.info(f"Successfully processed: {image_path}")
+        result.status = "done"
+    except Exception as e:
+        logger.exception(f"Error processing image {image_path}: {e}")
+        print(f"Error processing image {image_path}: {e}")
+        result.error = str(e)
+
+    return result
+
+def process_single_image(
+    image_path: str,
+    output_path: str,
+    mode: str = "tweet",
+    box_color: str = "red",
+    box_width: int = 4,
     label: Optional[str] = None,
     autocrop: bool = False,
     crop_percent: float = 100.0,
     resize: bool = False,
-    temperature: float = settings.GEMINI_TEMPERATURE
+    temperature: float = settings.GEMINI_TEMPERATURE,
+    ctx: Optional[RunContext] = None,
+    image: Optional[LoadedImage] = None
 ) -> bool:
     """
-    Process a single image file.
+    Process a single image file.
+
+    Args:
+        image_path: Path to the input image file
+        output_path: Path to save the output image with bounding box
+        mode: Detection mode ('tweet' or 'general')
+        box_color: Color of the bounding box (name or hex code)
+        box_width: Width of the bounding box line
+        label: Custom label for the bounding box
+        autocrop: If True, crop the image to the detected area
+        crop_percent: Percentage of tweet height to include when cropping
+        resize: If True, resize the cropped image to 1080x1350
+        temperature: Temperature setting for the Gemini model (0.0-1.0).
+                    Defaults to settings.GEMINI_TEMPERATURE (deterministic).
+        ctx: Shared state of the current run (detector, cache, models, upload settings). Defaults to None.
+        image: The already loaded image. If None, it is loaded from image_path.
+
+    Returns:
+        bool: True if processing succeeded, False otherwise
+    """
+    return process_image(
+        image_path, output_path, mode, box_color, box_width, label,
+        autocrop, crop_percent, resize, temperature, ctx, image
+    ).status == "done"
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parse command line arguments for the bounding box script.
+
+    Returns:
+        argparse.Namespace: The parsed command line arguments.
+    """
+    # Create examples for the help text
+    examples = """
+Examples:
+    # Basic usage with default parameters (tweet mode)
+    # Output will be saved as input_filename_bbox.ext
+    python bboxes.py --image-path "my_tweet.jpg"
+
+    # Process all images in a directory
+    python bboxes.py --image-path "path/to/image/directory"
+
+    # Process directory with custom output directory
+    python bboxes.py --image-path "input/directory" --output-path "output/directory"
+
+    # Keep 16 Gemini requests in flight while processing a directory
+    python bboxes.py --image-path "input/directory" --concurrency 16
+
+    # Pack 4 small screenshots into each Gemini request (keep --concurrency at a multiple of it)
+    python bboxes.py --image-path "input/directory" --batch-size 4 --concurrency 16
+
+    # Crop and resize with 4 processes instead of one per CPU core
+    python bboxes.py --image-path "input/directory" --autocrop --resize --render-workers 4
+
+    # Find the tweet offline with the layout heuristic, or use it first and ask Gemini only when unsure
+    python bboxes.py --image-path "tweet.jpg" --detector local
+    python bboxes.py --image-path "input/directory" --detector local-then-gemini
+
+    # Stay under a 60 requests / 1M tokens per minute quota (set GEMINI_RPM / GEMINI_TPM in .env)
+    GEMINI_RPM=60 GEMINI_TPM=1000000 python bboxes.py --image-path "input/directory"
+
+    # Dry run against a local stand-in for Gemini (no API calls, no cost), e.g. with 5% of requests failing
+    GEMINI_MOCK=true MOCK_ERROR_RATE=0.05 python bboxes.py --image-path "input/directory" --no-cache
+
+    # Process a whole tree, mirroring its subdirectories in the output directory
+    python bboxes.py --image-path "input/directory" --output-path "output/directory" --recursive
+
+    # Only PNGs from the last week, leaving out thumbnails and the "drafts" directories
+    python bboxes.py --image-path "input/directory" --recursive --include "*.png" --exclude drafts --max-size 20MB --min-size 10KB --modified-since 7d
+
+    # Only images of one subtree, modified since a date
+    python bboxes.py --image-path "input/directory" --recursive --include "2025/*" --modified-since 2025-06-01
+
+    # Also write a JSONL record per image (boxes, padded pixel regions, outputs, latency, retries)
+    python bboxes.py --image-path "input/directory" --results results.jsonl
+
+    # Re-render with other crop settings from the boxes of an earlier run, without calling Gemini
+    python bboxes.py --image-path "input/directory" --output-path "output/v2" --autocrop --crop-percent 88 --replay results.jsonl
+    python bboxes.py --image-path "input/directory" --output-path "output/v2" --box-color blue --replay
+
+    # See where the time of one image goes: stage timings in the debug log, a cProfile of every function
+    python bboxes.py --verbose --image-path "tweet.jpg" --profile bboxes.pstats
+
+    # Save WebP outputs at the "balanced" preset, without EXIF (GPS, camera) or ICC data
+    python bboxes.py --image-path "input/directory" --autocrop --output-format webp --output-quality balanced --strip-metadata
+
+    # The smallest AVIF outputs, trading encoder time for size
+    python bboxes.py --image-path "input/directory" --output-format avif --output-quality small --optimize
+
+    # Continue an interrupted directory run, skipping images it already finished
+    python bboxes.py --image-path "input/directory" --output-path "output/directory" --resume
+
+    # Specify an image path and output
+    python bboxes.py --image-path "my_tweet.jpg" --output-path "result.jpg"
+
+    # Use general object detection mode
+    python bboxes.py --mode "general" --image-path "photo.jpg"
+
+    # Detect objects in a full-page scroll capture tile by tile (tiles are 1.5x as tall as wide, see TILE_ASPECT)
+    python bboxes.py --mode "general" --image-path "scroll_capture.png" --tile --tile-overlap 0.3
+
+    # Customize the bounding box
+    python bboxes.py --image-path "tweet.png" --box-color "blue" --box-width 5 --label "Twitter Post"
+
+    # Crop to the detected area instead of drawing a box
+    python bboxes.py --image-path "tweet.jpg" --autocrop
+
+    # Crop with custom percentage (to fine-tune where the bottom crop occurs)
+    python bboxes.py --image-path "tweet.jpg" --autocrop --crop-percent 90.0
+
+    # Crop and resize to 1080x1350 with primary color background
+    python bboxes.py --image-path "tweet.jpg" --autocrop --resize
+
+    # Send Gemini a smaller, lower-quality copy (boxes still apply to the full image)
+    python bboxes.py --image-path "tweet.jpg" --upload-max-edge 1024 --upload-quality 75
+
+    # Re-detect instead of reusing cached boxes (e.g. after the model was updated)
+    python bboxes.py --image-path "tweet.jpg" --no-cache
+
+    # Only reuse boxes between (almost) identical captures, or never
+    python bboxes.py --image-path "input/directory" --dedup-distance 2
+    python bboxes.py --image-path "input/directory" --no-dedup
+
+    # Override the default deterministic temperature setting (0.0)
+    python bboxes.py --image-path "tweet.jpg" --temperature 0.2
+
+    # Enable debug logging
+    python bboxes.py --verbose --image-path "image.jpg"
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Detect objects or tweet content in images and draw bounding boxes",
+        epilog=examples,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--image-path", type=str, required=False,
+        help="Path to the input image file or directory containing images"
+    )
+    parser.add_argument(
+        "--output-path", type=str,
+        help="Path to save the output image or directory for multiple images"
+    )
+    parser.add_argument(
+        "--mode", type=str, choices=["tweet", "general"], default="tweet",
+        help="Detection mode: 'tweet' for tweet content or 'general' for all objects"
+    )
+    parser.add_argument(
+        "--detector", type=str, choices=DETECTORS, default=settings.DETECTOR,
+        help=f"Detector backend: 'gemini', 'local' (offline layout heuristic, tweet mode only) or 'local-then-gemini' (Gemini only when the local confidence is below {settings.LOCAL_CONFIDENCE_THRESHOLD}) (default: {settings.DETECTOR})"
+    )
+    parser.add_argument(
+        "--tile", action="store_true",
+        help=f"In general mode, split images taller than {settings.TILE_ASPECT}x their width into overlapping tiles, detect them concurrently and merge the boxes"
+    )
+    parser.add_argument(
+        "--tile-overlap", type=float, default=settings.TILE_OVERLAP,
+        help=f"With --tile, fraction of a tile's height shared with the next one; objects shorter than the overlap are whole in some tile (default: {settings.TILE_OVERLAP})"
+    )
+    parser.add_argument(
+        "--box-color", type=str, default="red",
+        help="Color of the bounding box (name or hex code)"
+    )
+    parser.add_argument(
+        "--box-width", type=int, default=4,
+        help="Width of the bounding box line"
+    )
+    parser.add_argument(
+        "--label", type=str,
+        help="Custom label for the bounding box (tweet mode only)"
+    )
+    parser.add_argument(
+        "--autocrop", action="store_true",
+        help="Crop image to the detected area instead of drawing a bounding box"
+    )
+    parser.add_argument(
+        "--crop-percent", type=float, default=100.0,
+        help="When using --autocrop with tweets, percentage of tweet height to include (default: 100.0)"
+    )
+    parser.add_argument(
+        "--resize", action="store_true",
+        help="When used with --autocrop, resize the output to 1080x1350 and center it on a background of the primary color"
+    )
+    parser.add_argument(
+        "--temperature", type=float, default=settings.GEMINI_TEMPERATURE,
+        help=f"Temperature setting for the Gemini model (0.0-1.0). Lower values produce more consistent results. (default: {settings.GEMINI_TEMPERATURE} - deterministic)"
+    )
+    parser.add_argument(
+        "--upload-max-edge", type=int, default=settings.UPLOAD_MAX_EDGE,
+        help=f"Downscale the copy sent to Gemini to this longest edge in pixels, 0 for full resolution (default: {settings.UPLOAD_MAX_EDGE})"
+    )
+    parser.add_argument(
+        "--upload-quality", type=int, default=settings.UPLOAD_QUALITY,
+        help=f"JPEG quality (1-95) of the copy sent to Gemini (default: {settings.UPLOAD_QUALITY})"
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help=f"Always call Gemini instead of reusing detections cached in {settings.CACHE_DIR}"
+    )
+    parser.add_argument(
+        "--dedup-distance", type=int, default=settings.DEDUP_DISTANCE,
+        help=f"Reuse the boxes of an earlier image of the same size whose perceptual hash differs in at most this many of 256 bits and whose thumbnail matches too (default: {settings.DEDUP_DISTANCE})"
+    )
+    parser.add_argument(
+        "--no-dedup", action="store_true",
+        help="Always detect every image instead of reusing the boxes of near-duplicates"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=settings.BATCH_CONCURRENCY,
+        help=f"When processing a directory, number of images to process at once (default: {settings.BATCH_CONCURRENCY})"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=settings.PROMPT_BATCH_SIZE,
+        help=f"When processing a directory, pack up to this many images into one Gemini request; images the answer leaves out are asked for on their own (default: {settings.PROMPT_BATCH_SIZE}, no batching)"
+    )
+    parser.add_argument(
+        "--output-format", choices=["keep", *OUTPUT_EXTENSIONS], default=settings.OUTPUT_FORMAT,
+        help=f"Format of the saved images; also sets their extension. 'keep' saves in the input's format (default: {settings.OUTPUT_FORMAT})"
+    )
+    parser.add_argument(
+        "--output-quality", choices=list(QUALITY_PRESETS), default=settings.OUTPUT_QUALITY,
+        help=f"Quality preset of JPEG, WebP and AVIF outputs: high, balanced or small (default: {settings.OUTPUT_QUALITY})"
+    )
+    parser.add_argument(
+        "--strip-metadata", action="store_true", default=settings.OUTPUT_STRIP_METADATA,
+        help="Leave the input's EXIF data (camera, GPS, time) and ICC profile out of the saved images"
+    )
+    parser.add_argument(
+        "--optimize", action="store_true", default=settings.OUTPUT_OPTIMIZE,
+        help="Spend more encoder time on smaller saved images (progressive JPEG, slowest WebP and AVIF methods, optimized PNG)"
+    )
+    parser.add_argument(
+        "--render-workers", type=int, default=settings.RENDER_WORKERS,
+        help="When processing a directory, number of processes that crop, resize and save the outputs while requests are in flight; 0 does it in the request threads (default: one per CPU core)"
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help=f"When processing a directory, skip images that the previous run's journal ({BatchJournal.FILENAME} in the output directory) records as done"
+    )
+    parser.add_argument(
+        "--results", type=str, metavar="FILE.jsonl",
+        help="Write one JSON record per image to this file as it finishes: input, sha256, mode, normalized boxes, raw and padded pixel boxes with labels and outputs, latency and retries (appended to with --resume)"
+    )
+    parser.add_argument(
+        "--replay", nargs="?", const="", metavar="FILE.jsonl",
+        help="Re-render from the boxes of an earlier run instead of detecting: from this --results file, or without one from the detection cache. Makes no API calls; images without stored boxes fail"
+    )
+    parser.add_argument(
+        "--profile", type=str, metavar="FILE.pstats",
+        help="Process only one image (the first one found in a directory) under cProfile, write the stats to this file and print the slowest functions"
+    )
+    parser.add_argument(
+        "--recursive", action="store_true",
+        help="When processing a directory, also process the images in its subdirectories (hidden ones and the output directory are skipped)"
+    )
+    parser.add_argument(
+        "--include", action="append", default=[], metavar="GLOB",
+        help="When processing a directory, only process files matching this glob; a glob with a '/' matches the path below the directory, others the file name. Can be repeated"
+    )
+    parser.add_argument(
+        "--exclude", action="append", default=[], metavar="GLOB",
+        help="When processing a directory, skip files and subdirectories matching this glob (matched like --include). Can be repeated"
+    )
+    parser.add_argument(
+        "--min-size", type=str,
+        help="When processing a directory, skip files smaller than this, e.g. 10KB"
+    )
+    parser.add_argument(
+        "--max-size", type=str,
+        help="When processing a directory, skip files larger than this, e.g. 20MB"
+    )
+    parser.add_argument(
+        "--modified-since", type=str,
+        help="When processing a directory, skip files last modified before this: an age such as 30m, 12h, 7d or 2w, or an ISO date such as 2025-06-01"
+    )
+    parser.add_argument(
+        "--verbose", action="store_true",
+        help="Enable verbose debug logging"
+    )
+
+    args = parser.parse_args()
+
+    if args.replay == "" and args.no_cache:
+        parser.error("--replay without a results file reads the detection cache, which --no-cache disables")
+    if args.replay and not os.path.isfile(args.replay):
+        parser.error(f"--replay file not found: {args.replay}")
+    if args.replay and args.results and os.path.abspath(args.replay) == os.path.abspath(args.results):
+        parser.error("--results must not overwrite the file given to --replay")
+    if args.tile and args.mode != "general":
+        parser.error("--tile only supports --mode general")
+    if not 0 <= args.tile_overlap <= 0.9:
+        parser.error("--tile-overlap must be between 0 and 0.9")
+    if args.detector == "local" and args.mode != "tweet":
+        parser.error("--detector local only supports --mode tweet")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.output_format in ("webp", "avif"):
+        import PIL.features
+        if not PIL.features.check(args.output_format):
+            parser.error(f"--output-format {args.output_format} needs a Pillow built with {args.output_format.upper()} support")
+    if args.render_workers is not None and args.render_workers < 0:
+        parser.error("--render-workers must be 0 or more")
+    if not 0 <= args.dedup_distance <= 256:
+        parser.error("--dedup-distance must be between 0 and 256")
+    if args.upload_max_edge < 0:
+        parser.error("--upload-max-edge must be 0 or more")
+    if not 1 <= args.upload_quality <= 95:
+        parser.error("--upload-quality must be between 1 and 95")
+    for option in ("min_size", "max_size"):
+        value = getattr(args, option)
+        if value is not None:
+            try:
+                setattr(args, option, parse_size(value))
+            except ValueError:
+                parser.error(f"--{option.replace('_', '-')} must be a size such as 500KB or 20MB, not {value!r}")
+    if args.min_size is not None and args.max_size is not None and args.min_size > args.max_size:
+        parser.error("--min-size must not be larger than --max-size")
+    if args.modified_since is not None:
+        try:
+            args.modified_since = parse_since(args.modified_since)
+        except ValueError:
+            parser.error(f"--modified-since must be an age such as 7d or an ISO date such as 2025-06-01, not {args.modified_since!r}")
+
+    return args
+
+# Prompts live at module level so the detection cache can key on them: rewording a
+# prompt changes its hash, which invalidates every result produced with the old one.
+TWEET_PROMPT = """You're looking at a screenshot of a tweet. Create a precise bounding box around the MAIN TWEET CONTENT ONLY.
+
+The bounding box MUST include:
+1. The user's profile picture/avatar (usually circular)
+2. The username and @handle
+3. The "Follow" button
+4. The entire tweet text/content - CRITICALLY IMPORTANT TO INCLUDE ALL TEXT, INCLUDING ANY EMOJI OR SPECIAL CHARACTERS
+
+This is a single cohesive unit that forms the main tweet. Make sure the box captures ALL of this content.
+
+The bounding box MUST exclude:
+1. The navigation elements and header
+2. The date/timestamp (generally a line like "11:34 PM · 2/28/25")
+3. The view count (e.g., "2M Views")
+4. Like/retweet/view counts and all engagement metrics
+5. Any replies or comments below the main tweet
+6. Any UI elements at the bottom of the screen
+
+VERY IMPORTANT: Draw the bottom boundary of the box ABOVE the timestamp and view count row.
+The timestamp is generally shown in a smaller font below the tweet content, often with a dot separator and view count.
+
+Make sure your coordinates cover the ENTIRE tweet content from the profile picture to the end of the tweet text.
+When in doubt, make the bounding box LARGER rather than smaller to ensure no text is cut off.
+
+It is better to include a bit more space than to cut off any part of the text!
+
+Return only a JSON object with the exact coordinates as:
+{"xmin": [left coordinate], "ymin": [top coordinate], "xmax": [right coordinate], "ymax": [bottom coordinate]}
+
+The coordinates should be NORMALIZED to a range of 0-1000, where 0 represents the left/top edge and 1000 represents the right/bottom edge of the image."""
+
+OBJECTS_PROMPT = "Identify and provide bounding box coordinates for all objects in the image. Return the results in JSON format. Each object should have 'label', 'xmin', 'ymin', 'xmax', and 'ymax' fields. The coordinates should be NORMALIZED to a range of 0-1000, where 0 represents the left/top edge and 1000 represents the right/bottom edge of the image. If there are no objects, return an empty JSON array. Example: [{'label': 'dog', 'xmin': 100, 'ymin': 200, 'xmax': 400, 'ymax': 600}, {'label': 'cat', 'xmin': 500, 'ymin': 300, 'xmax': 800, 'ymax': 700}]"
+
+# Detection mode -> prompt
+PROMPTS: Dict[str, str] = {"tweet": TWEET_PROMPT, "general": OBJECTS_PROMPT}
+
+# Put in front of the mode's prompt in a multi-image request (see PromptBatcher)
+BATCH_PROMPT = """You are given {count} images. Each image comes right after a line "Image <index>:", with indexes counting from 0.
+
+Follow the instructions below for EACH image on its own, as if it were the only image. Return a JSON array with exactly one entry per image: {{"index": <the image's index>, "boxes": <the answer the instructions ask for, for that image>}}.
+
+Instructions for each image:
+"""
+
+class TweetBox(BaseModel):
+    """
+    A bounding box with coordinates normalized to 0-1000, as Gemini returns it.
+
+    Out-of-range and inverted boxes do not validate, so they are rejected before they
+    reach the detection cache; drawing one would fail on every later run.
+    """
+    xmin: float = Field(ge=0, le=1000)
+    ymin: float = Field(ge=0, le=1000)
+    xmax: float = Field(ge=0, le=1000)
+    ymax: float = Field(ge=0, le=1000)
+
+    @model_validator(mode="after")
+    def _check_order(self) -> "TweetBox":
+        if self.xmin > self.xmax or self.ymin > self.ymax:
+            raise ValueError(f"inverted box: ({self.xmin}, {self.ymin}) to ({self.xmax}, {self.ymax})")
+        return self
+
+class ObjectBox(TweetBox):
+    """A labeled bounding box, one per object in general mode."""
+    label: str
+
+_BOX_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {key: {"type": "integer"} for key in ("xmin", "ymin", "xmax", "ymax")},
+    "required": ["xmin", "ymin", "xmax", "ymax"],
+}
+
+# Detection mode -> the response schema Gemini is constrained to. These mirror TweetBox and
+# a list of ObjectBox; they are written out because the SDK only accepts this OpenAPI
+# subset, not the JSON Schema pydantic generates.
+RESPONSE_SCHEMAS: Dict[str, Dict[str, Any]] = {
+    "tweet": _BOX_SCHEMA,
+    "general": {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {"label": {"type": "string"}, **_BOX_SCHEMA["properties"]},
+            "required": ["label", *_BOX_SCHEMA["required"]],
+        },
+    },
+}
+
+# Detection mode -> the response schema of a multi-image request: one answer per image,
+# each in the shape of RESPONSE_SCHEMAS, keyed by the image's index in the request
+BATCH_RESPONSE_SCHEMAS: Dict[str, Dict[str, Any]] = {
+    mode: {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {"index": {"type": "integer"}, "boxes": schema},
+            "required": ["index", "boxes"],
+        },
+    }
+    for mode, schema in RESPONSE_SCHEMAS.items()
+}
+
+_OBJECT_BOXES = TypeAdapter(List[ObjectBox])
+
+def parse_boxes(json_string: str, mode: str) -> List[Dict[str, Any]]:
+    """
+    Parse and validate a schema-constrained Gemini response.
+
+    The model is asked for JSON matching RESPONSE_SCHEMAS, so the answer should validate
+    as a TweetBox or a list of ObjectBox as-is. If it somehow does not, the old regex
+    scraping (scrape_tweet_box / scrape_object_boxes) is tried before giving up, since
+    every unusable response is a paid call wasted.
+
+    Args:
+        json_string: The raw response text
+        mode: Detection mode ('tweet' or 'general')
+
+    Returns:
+        List[Dict[str, Any]]: Boxes normalized to 0-1000. Tweet mode always returns exactly one.
+
+    Raises:
+        GeminiAPIError: If neither validation nor scraping finds usable boxes
+    """
+    try:
+        if mode == "tweet":
+            return [TweetBox.model_validate_json(json_string).model_dump()]
+        return [box.model_dump() for box in _OBJECT_BOXES.validate_json(json_string)]
+    except ValidationError as e:
+        logger.warning(f"Gemini response does not match the {mode} schema, falling back to scraping it")
+        logger.debug(f"Validation errors: {e}")
+
+    if mode == "tweet":
+        return [scrape_tweet_box(json_string)]
+    return scrape_object_boxes(json_string)
+
+def parse_batch_boxes(json_string: str, mode: str, count: int) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Parse the response to a multi-image request, keeping every answer that is usable.
+
+    Unlike parse_boxes this never raises: an image whose answer is missing, duplicated
+    or does not validate is left out, and PromptBatcher asks for it on its own.
+
+    Args:
+        json_string: The raw response text
+        mode: Detection mode ('tweet' or 'general')
+        count: Number of images in the request
+
+    Returns:
+        Dict[int, List[Dict[str, Any]]]: The boxes by image index, in the format parse_boxes returns
+    """
+    try:
+        answers = json.loads(json_string)
+    except json.JSONDecodeError:
+        logger.warning(f"Batched Gemini response is not JSON: {json_string[:200]}")
+        return {}
+    if not isinstance(answers, list):
+        logger.warning("Batched Gemini response is not a JSON array")
+        return {}
+
+    boxes: Dict[int, List[Dict[str, Any]]] = {}
+    duplicates: Set[int] = set()
+    for answer in answers:
+        index = answer.get("index") if isinstance(answer, dict) else None
+        if not isinstance(index, int) or not 0 <= index < count or "boxes" not in answer:
+            continue
+        if index in boxes:
+            duplicates.add(index)
+            continue
+        try:
+            if mode == "tweet":
+                boxes[index] = [TweetBox.model_validate(answer["boxes"]).model_dump()]
+            else:
+                boxes[index] = [box.model_dump() for box in _OBJECT_BOXES.validate_python(answer["boxes"])]
+        except ValidationError as e:
+            logger.debug(f"Batched answer for image {index} does not match the {mode} schema: {e}")
+
+    # Two answers for one image: either could be the one meant for another image
+    for index in duplicates:
+        boxes.pop(index, None)
+    return boxes
+
+def scrape_tweet_box(json_string: str) -> Dict[str, float]:
+    """
+    Scrape a normalized bounding box out of a free-form answer to TWEET_PROMPT.
+
+    Only used as a fallback, when a response does not validate as a TweetBox.
+
+    Args:
+        json_string: The raw response text
+
+    Returns:
+        Dict[str, float]: The box as {"xmin", "ymin", "xmax", "ymax"}, normalized to 0-1000
+
+    Raises:
+        GeminiAPIError: If no usable coordinates can be found in the response
+    """
+    try:
+        # Try to find the JSON object in the response text
+        json_pattern = r'\{.*?\}'
+        match = re.search(json_pattern, json_string, re.DOTALL)
+
+        if match:
+            json_string = match.group(0)
+            logger.debug(f"Extracted JSON: {json_string}")
+
+        # Clean up malformed JSON with square brackets around values
+        json_string = re.sub(r'\[\s*(\d+)\s*\]', r'\1', json_string)
+        logger.debug(f"Cleaned JSON: {json_string}")
+
+        tweet_box: Dict[str, Any] = json.loads(json_string)
+    except json.JSONDecodeError:
+        logger.error(f"Invalid JSON response from Gemini: {json_string}")
+        print(f"Error: Invalid JSON response from Gemini: {json_string}")
+
+        # Attempt to manually extract coordinates if JSON parsing fails
+        logger.debug("Attempting manual coordinate extraction")
+        xmin_match = re.search(r'"xmin":\s*\[?(\d+)', json_string)
+        ymin_match = re.search(r'"ymin":\s*\[?(\d+)', json_string)
+        xmax_match = re.search(r'"xmax":\s*\[?(\d+)', json_string)
+        ymax_match = re.search(r'"ymax":\s*\[?(\d+)', json_string)
+
+        if not all([xmin_match, ymin_match, xmax_match, ymax_match]):
+            logger.error("Could not manually extract coordinates")
+            raise GeminiAPIError(f"Could not extract coordinates from response: {json_string}")
+
+        tweet_box = {
+            'xmin': int(xmin_match.group(1)),
+            'ymin': int(ymin_match.group(1)),
+            'xmax': int(xmax_match.group(1)),
+            'ymax': int(ymax_match.group(1))
+        }
+        logger.debug(f"Manually extracted coordinates: {tweet_box}")
+
+    # Check if we have valid coordinates
+    required_keys = ['xmin', 'ymin', 'xmax', 'ymax']
+    if not isinstance(tweet_box, dict) or not all(key in tweet_box for key in required_keys):
+        raise GeminiAPIError(f"Missing required coordinates in response: {tweet_box}")
+
+    try:
+        return TweetBox.model_validate({key: tweet_box[key] for key in required_keys}).model_dump()
+    except ValidationError as e:
+        raise GeminiAPIError(f"Invalid bounding box coordinates: {tweet_box}") from e
+
+def scrape_object_boxes(json_string: str) -> List[Dict[str, Any]]:
+    """
+    Scrape a list of labeled boxes out of a free-form answer to OBJECTS_PROMPT.
+
+    Only used as a fallback, when a response does not validate as a list of ObjectBox.
+    Entries that do not validate on their own, e.g. inverted boxes, are left out.
+
+    Args:
+        json_string: The raw response text
+
+    Returns:
+        List[Dict[str, Any]]: One {"label", "xmin", "ymin", "xmax", "ymax"} dict per object
+
+    Raises:
+        GeminiAPIError: If the response is not a JSON list, or none of its entries is a
+            valid box
+    """
+    try:
+        # Clean up malformed JSON with square brackets around values
+        json_string = re.sub(r'\[\s*(\d+)\s*\]', r'\1', json_string)
+        logger.debug(f"Cleaned JSON data: {json_string}")
+
+        object_data: List[Dict[str, Any]] = json.loads(json_string)
+    except json.JSONDecodeError:
+        # No manual extraction for object detection as it's more complex
+        raise GeminiAPIError(f"Invalid JSON response from Gemini: {json_string}")
+
+    if not isinstance(object_data, list):
+        raise GeminiAPIError(f"Gemini returned results that are not a list: {object_data}")
+
+    boxes = []
+    for entry in object_data:
+        if isinstance(entry, dict):
+            entry = {'label': 'Object', **entry}
+        try:
+            boxes.append(ObjectBox.model_validate(entry).model_dump())
+        except ValidationError:
+            logger.warning(f"Leaving out an invalid box from Gemini: {entry}")
+    if object_data and not boxes:
+        raise GeminiAPIError(f"Gemini returned no valid boxes: {object_data}")
+
+    logger.debug(f"Parsed JSON data with {len(boxes)} of {len(object_data)} objects")
+    return boxes
+
+def request_boxes(
+    img: "PIL.Image.Image",
+    mode: str,
+    temperature: float,
+    ctx: Optional[RunContext] = None
+) -> List[Dict[str, Any]]:
+    """
+    Ask Gemini for the bounding boxes in an image.
+
+    Args:
+        img: The image to analyze
+        mode: Detection mode ('tweet' or 'general')
+        temperature: Temperature setting for the Gemini model (0.0-1.0)
+        ctx: Shared state of the current run (models, upload settings, rate limiter). If
+            None, a model is created for this call, the upload uses the default settings
+            and the call is not rate limited.
+
+    Returns:
+        List[Dict[str, Any]]: Boxes normalized to 0-1000. Tweet mode always returns exactly one.
+
+    Raises:
+        GeminiAPIError: If the API call fails or the response cannot be parsed
+    """
+    ctx = ctx or RunContext()
+    model = ctx.models.get(mode, temperature)
+
+    with span("encode"):
+        img_bytes = encode_for_upload(img, ctx.upload_max_edge, ctx.upload_quality)
+    logger.debug(f"Image loaded and converted, size: {len(img_bytes)} bytes")
+
+    img_part: Dict[str, Union[str, bytes]] = {"mime_type": "image/jpeg", "data": img_bytes}
+    prompt_parts: List[Union[Dict[str, Union[str, bytes]], str]] = [img_part, PROMPTS[mode]]
+
+    logger.debug("Sending prompt to Gemini")
+    _count_request("requests")
+    # Use the retry mechanism for the API call
+    tokens = estimate_request_tokens(upload_size(img.size, ctx.upload_max_edge), PROMPTS[mode])
+    response = generate_gemini_content(model, prompt_parts, ctx.limiter, tokens)
+    logger.debug("Received response from Gemini")
+
+    json_string: str = response.text
+    logger.debug(f"Raw response: {json_string}")
+
+    with span("parse"):
+        return parse_boxes(json_string, mode)
+
+@dataclass
+class PendingBatch:
+    """
+    The images of one multi-image request, while they are collected and answered.
+
+    Attributes:
+        images: The images, in the order they are numbered in the request
+        done: Set once the request has been answered or has failed
+        boxes: The usable answers by image index, once done
+        error: Why the request failed, if it did
+    """
+    images: List["PIL.Image.Image"] = field(default_factory=list)
+    done: threading.Event = field(default_factory=threading.Event)
+    boxes: Dict[int, List[Dict[str, Any]]] = field(default_factory=dict)
+    error: Optional[BaseException] = None
+
+class PromptBatcher:
+    """
+    Packs the Gemini requests of concurrent workers into multi-image requests (--batch-size).
+
+    Every request carries a fixed overhead (the prompt, the round trip, a slot of the
+    per-minute quota) that dominates for small screenshots. With batching, up to `size`
+    workers that need boxes for the same mode and temperature share one request, which
+    numbers the images and asks for an array of answers keyed by index.
+
+    The first worker of a batch leads it: it waits until the batch is full, or for at
+    most `linger` seconds, sends the request and wakes the others. A batch that only
+    got one image is sent as a normal request. Images whose answer is missing or
+    unusable fall back to a request of their own, so an incomplete response costs only
+    the images it left out. When the request itself fails (after retries), every image
+    of the batch fails with it.
+
+    The request is counted in the stats of the leader's image. All methods are thread-safe.
+    """
+
+    def __init__(self, size: int, linger: float) -> None:
+        """
+        Args:
+            size: Most images per request
+            linger: Seconds the leader of a batch waits for it to fill
+        """
+        self.size = size
+        self.linger = linger
+        self.requests = 0
+        self.images = 0
+        self.fallbacks = 0
+        self._open: Dict[Tuple[str, float], PendingBatch] = {}
+        self._condition = threading.Condition()
+
+    def request(
+        self,
+        img: "PIL.Image.Image",
+        mode: str,
+        temperature: float,
+        ctx: RunContext
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the boxes of an image as part of a batch, blocking until the batch is answered.
+
+        Args:
+            img: The image to analyze
+            mode: Detection mode ('tweet' or 'general')
+            temperature: Temperature setting for the Gemini model (0.0-1.0)
+            ctx: Shared state of the current run
+
+        Returns:
+            List[Dict[str, Any]]: Boxes normalized to 0-1000, as returned by request_boxes
+
+        Raises:
+            GeminiAPIError: If the batch's request, or the image's fallback request, fails
+        """
+        group = (mode, temperature)
+        with self._condition:
+            batch = self._open.get(group)
+            leader = batch is None
+            if batch is None:
+                batch = self._open[group] = PendingBatch()
+            index = len(batch.images)
+            batch.images.append(img)
+            if len(batch.images) >= self.size:
+                # Full: closed to newcomers, and the leader is woken to send it
+                del self._open[group]
+                self._condition.notify_all()
+
+            if leader:
+                deadline = time.monotonic() + self.linger
+                with span("batch_wait"):
+                    while self._open.get(group) is batch and (remaining := deadline - time.monotonic()) > 0:
+                        self._condition.wait(remaining)
+                if self._open.get(group) is batch:
+                    del self._open[group]
+
+        if leader:
+            try:
+                batch.boxes = self._send(batch.images, mode, temperature, ctx)
+            except Exception as e:
+                batch.error = e
+                raise
+            finally:
+                batch.done.set()
+        else:
+            with span("batch_wait"):
+                batch.done.wait()
+            if batch.error is not None:
+                raise GeminiAPIError(f"Batched request failed: {batch.error}") from batch.error
+
+        boxes = batch.boxes.get(index)
+        if boxes is not None:
+            return boxes
+        with self._condition:
+            self.fallbacks += 1
+        logger.info(f"Batched response has no usable answer for image {index} of {len(batch.images)}, asking for it on its own")
+        return request_boxes(img, mode, temperature, ctx)
+
+    def _send(
+        self,
+        images: List["PIL.Image.Image"],
+        mode: str,
+        temperature: float,
+        ctx: RunContext
+    ) -> Dict[int, List[Dict[str, Any]]]:
+        with self._condition:
+            self.requests += 1
+            self.images += len(images)
+        if len(images) == 1:
+            return {0: request_boxes(images[0], mode, temperature, ctx)}
+
+        model = ctx.models.get(mode, temperature, batched=True)
+        prompt = BATCH_PROMPT.format(count=len(images)) + PROMPTS[mode]
+        prompt_parts: List[Union[Dict[str, Union[str, bytes]], str]] = []
+        tokens = len(prompt) // 4
+        for index, img in enumerate(images):
+            with span("encode"):
+                img_bytes = encode_for_upload(img, ctx.upload_max_edge, ctx.upload_quality)
+            prompt_parts += [f"Image {index}:", {"mime_type": "image/jpeg", "data": img_bytes}]
+            tokens += estimate_request_tokens(upload_size(img.size, ctx.upload_max_edge), "")
+        prompt_parts.append(prompt)
+
+        logger.debug(f"Sending a batched prompt with {len(images)} images to Gemini")
+        _count_request("requests")
+        response = generate_gemini_content(model, prompt_parts, ctx.limiter, tokens)
+        logger.debug(f"Raw batched response: {response.text}")
+
+        with span("parse"):
+            return parse_batch_boxes(response.text, mode, len(images))
+
+def tile_layout(size: Tuple[int, int], aspect: float, overlap: float) -> List[Tuple[int, int, int, int]]:
+    """
+    Split a tall image into overlapping, full-width tiles.
+
+    A full-page scroll capture of 1080x20000 pixels reaches Gemini downscaled to about
+    80 pixels wide, far too small to read. Tiles of a bounded aspect ratio keep the
+    upload legible, at one request per tile.
+
+    Args:
+        size: (width, height) of the image
+        aspect: Height of a tile as a multiple of the width
+        overlap: Fraction of a tile's height shared with the next tile
+
+    Returns:
+        List[Tuple[int, int, int, int]]: The (left, top, right, bottom) pixel boxes of the
+            tiles from top to bottom, or an empty list when the image fits in one tile
+    """
+    width, height = size
+    tile_height = max(1, round(width * aspect))
+    if aspect <= 0 or height <= tile_height:
+        return []
+
+    stride = max(1, round(tile_height * (1 - overlap)))
+    count = math.ceil((height - tile_height) / stride) + 1
+    # The last tile is moved up to end at the bottom edge instead of running past it
+    tops = [min(i * stride, height - tile_height) for i in range(count)]
+    return [(0, top, width, top + tile_height) for top in tops]
+
+def box_iou(a: Dict[str, float], b: Dict[str, float]) -> Tuple[float, float]:
+    """
+    Measure how much two boxes overlap.
 
     Args:
-        image_path: Path to the input image file
-        output_path: Path to save the output image with bounding box
+        a: A box with xmin, ymin, xmax and ymax
+        b: Another box in the same coordinates
+
+    Returns:
+        Tuple[float, float]: The intersection over union, and the intersection over the
+            area of the smaller box
+    """
+    width = min(a['xmax'], b['xmax']) - max(a['xmin'], b['xmin'])
+    height = min(a['ymax'], b['ymax']) - max(a['ymin'], b['ymin'])
+    if width <= 0 or height <= 0:
+        return 0.0, 0.0
+    intersection = width * height
+    area_a = (a['xmax'] - a['xmin']) * (a['ymax'] - a['ymin'])
+    area_b = (b['xmax'] - b['xmin']) * (b['ymax'] - b['ymin'])
+    return intersection / (area_a + area_b - intersection), intersection / min(area_a, area_b)
+
+def merge_tile_boxes(
+    candidates: List[Tuple[Dict[str, Any], bool]],
+    iou_threshold: float
+) -> List[Dict[str, Any]]:
+    """
+    Merge the boxes of overlapping tiles with non-maximum suppression.
+
+    An object in the overlap of two tiles is found in both, and one crossing a tile's
+    edge is found cut off. Gemini gives no scores, so boxes are ranked by whether they
+    were cut off at an edge shared with another tile, and then by area: a whole box
+    from one tile wins over the cut-off part from the next. A box is dropped when a
+    higher-ranked box of the same label overlaps it by `iou_threshold` or more, or
+    contains most (80%) of it.
+
+    Args:
+        candidates: (box, cut off) pairs, with the boxes in full-image coordinates
+        iou_threshold: Intersection over union from which two boxes count as the same object
+
+    Returns:
+        List[Dict[str, Any]]: The remaining boxes, from top to bottom
+    """
+    def area(box: Dict[str, Any]) -> float:
+        return (box['xmax'] - box['xmin']) * (box['ymax'] - box['ymin'])
+
+    def same_object(box: Dict[str, Any], other: Dict[str, Any]) -> bool:
+        if str(box.get('label', '')).lower() != str(other.get('label', '')).lower():
+            return False
+        iou, contained = box_iou(box, other)
+        return iou >= iou_threshold or contained >= 0.8
+
+    kept: List[Dict[str, Any]] = []
+    for box, _ in sorted(candidates, key=lambda candidate: (candidate[1], -area(candidate[0]))):
+        if not any(same_object(box, other) for other in kept):
+            kept.append(box)
+    return sorted(kept, key=lambda box: (box['ymin'], box['xmin']))
+
+def request_tiled_boxes(
+    img: "PIL.Image.Image",
+    mode: str,
+    temperature: float,
+    tiles: List[Tuple[int, int, int, int]],
+    ctx: Optional[RunContext] = None
+) -> List[Dict[str, Any]]:
+    """
+    Ask Gemini for the boxes of each tile of an image at once, and combine them.
+
+    The tiles are requested concurrently, through the run's rate limiter like any other
+    request, by at most as many threads as the limiter lets requests run at once
+    (settings.BATCH_CONCURRENCY without one): a very tall image would otherwise start a
+    thread per tile, only for most of them to wait on the limiter. Each tile's boxes,
+    normalized to the tile, are mapped back to the full image and merged with
+    merge_tile_boxes.
+
+    Args:
+        img: The image to analyze
+        mode: Detection mode; tiling is meant for 'general'
+        temperature: Temperature setting for the Gemini model (0.0-1.0)
+        tiles: The tiles, from tile_layout
+        ctx: Shared state of the current run
+
+    Returns:
+        List[Dict[str, Any]]: Boxes normalized to 0-1000 of the full image
+
+    Raises:
+        GeminiAPIError: If the request for any tile fails
+    """
+    width, height = img.size
+    crops = [img.crop(tile) for tile in tiles]
+
+    def detect_tile(crop: "PIL.Image.Image") -> Tuple[List[Dict[str, Any]], ImageStats]:
+        # Collected here and added to the image's stats, which belong to the calling thread
+        with collecting_stats() as stats:
+            return request_boxes(crop, mode, temperature, ctx), stats
+
+    max_concurrency = ctx.limiter.max_concurrency if ctx and ctx.limiter else settings.BATCH_CONCURRENCY
+    workers = min(len(tiles), max_concurrency)
+    if workers <= 1:
+        outcomes = [detect_tile(crop) for crop in crops]
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bboxes-tile") as executor:
+            outcomes = list(executor.map(detect_tile, crops))
+
+    candidates: List[Tuple[Dict[str, Any], bool]] = []
+    current = getattr(_thread_stats, "stats", None)
+    for (left, top, right, bottom), (boxes, stats) in zip(tiles, outcomes):
+        if current is not None:
+            current.add(stats)
+        for box in boxes:
+            mapped = dict(box)
+            mapped['xmin'] = (left + box['xmin'] / 1000 * (right - left)) / width * 1000
+            mapped['xmax'] = (left + box['xmax'] / 1000 * (right - left)) / width * 1000
+            mapped['ymin'] = (top + box['ymin'] / 1000 * (bottom - top)) / height * 1000
+            mapped['ymax'] = (top + box['ymax'] / 1000 * (bottom - top)) / height * 1000
+            # Within 0.5% of an edge shared with another tile
+            cut_off = (top > 0 and box['ymin'] <= 5) or (bottom < height and box['ymax'] >= 995)
+            candidates.append((mapped, cut_off))
+
+    boxes = merge_tile_boxes(candidates, settings.TILE_NMS_IOU)
+    logger.info(f"Merged {len(candidates)} boxes from {len(tiles)} tiles into {len(boxes)}")
+    return boxes
+
+def image_tiles(size: Tuple[int, int], mode: str, ctx: Optional[RunContext]) -> List[Tuple[int, int, int, int]]:
+    """The tiles an image is detected in for the run's settings; empty for a single request."""
+    if mode != "general" or not ctx or not ctx.tile_aspect:
+        return []
+    return tile_layout(size, ctx.tile_aspect, ctx.tile_overlap)
+
+def detection_key(loaded: LoadedImage, mode: str, temperature: float, ctx: RunContext) -> str:
+    """
+    Build the detection cache key of an image for the run's model, tiling and batching.
+
+    Tiled and batched detections are made from other prompts (per tile, or BATCH_PROMPT
+    around the mode's prompt) and, for batches, another response schema, so each gets
+    a variant of its own: a later run made differently never reuses their answers.
+    --detector replay looks boxes up with the same key, so it needs the same --tile and
+    --batch-size as the run that stored them.
+
+    Args:
+        loaded: The image
         mode: Detection mode ('tweet' or 'general')
-        box_color: Color of the bounding box (name or hex code)
-        box_width: Width of the bounding box line
-        label: Custom label for the bounding box
-        autocrop: If True, crop the image to the detected area
-        crop_percent: Percentage of tweet height to include when cropping
-        resize: If True, resize the cropped image to 1080x1350
-        temperature: Temperature setting for the Gemini model (0.0-1.0).
-                    Defaults to settings.GEMINI_TEMPERATURE (deterministic).
+        temperature: Temperature setting for the Gemini model
+        ctx: Shared state of the current run
 
     Returns:
-        bool: True if processing succeeded, False otherwise
+        str: The key, as built by DetectionCache.make_key
     """
-    try:
-        if mode == "tweet":
-            logger.info(f"Using tweet content detection mode for {image_path}")
-            detect_tweet_content(
-                image_path,
-                output_path,
-                box_color=box_color,
-                box_width=box_width,
-                label=label,
-                autocrop=autocrop,
-                crop_percent=crop_percent,
-                resize=resize,
-                temperature=temperature
-            )
-        else:  # general mode
-            logger.info(f"Using general object detection mode for {image_path}")
-            detect_objects_and_draw_boxes(
-                image_path,
-                output_path,
-                box_color=box_color,
-                box_width=box_width,
-                autocrop=autocrop,
-                resize=resize,
-                temperature=temperature
-            )
-        logger.info(f"Successfully processed: {image_path}")
-        return True
-    except Exception as e:
-        logger.exception(f"Error processing image {image_path}: {e}")
-        print(f"Error processing image {image_path}: {e}")
-        return False
+    tiles = image_tiles(loaded.image.size, mode, ctx)
+    if tiles:
+        variant = f"tiles:{ctx.tile_aspect}:{ctx.tile_overlap}"
+    elif ctx.batcher:
+        variant = "batch"
+    else:
+        variant = ""
+    return DetectionCache.make_key(loaded.sha256, mode, PROMPTS[mode], ctx.models.model_name, temperature, variant)
+
+def detect_boxes(
+    loaded: LoadedImage,
+    mode: str,
+    temperature: float,
+    ctx: Optional[RunContext] = None
+) -> List[Dict[str, Any]]:
+    """
+    Get the bounding boxes for an image, from the detection cache or a near-duplicate
+    when possible.
 
-def parse_args() -> argparse.Namespace:
+    Boxes reused from a near-duplicate are not written to the detection cache, which
+    only holds what Gemini said about each exact file.
+
+    Args:
+        loaded: The image, whose hash is part of the cache key
+        mode: Detection mode ('tweet' or 'general')
+        temperature: Temperature setting for the Gemini model (0.0-1.0)
+        ctx: Shared state of the current run. Without one, nothing is cached or reused.
+
+    Returns:
+        List[Dict[str, Any]]: Boxes normalized to 0-1000, as returned by request_boxes
     """
-    Parse command line arguments for the bounding box script.
+    cache = ctx.cache if ctx else None
+    dedup = ctx.dedup if ctx else None
+    group = (mode, temperature, loaded.image.size)
+
+    tiles = image_tiles(loaded.image.size, mode, ctx)
+
+    def request() -> List[Dict[str, Any]]:
+        if tiles:
+            return request_tiled_boxes(loaded.image, mode, temperature, tiles, ctx)
+        if ctx and ctx.batcher:
+            return ctx.batcher.request(loaded.image, mode, temperature, ctx)
+        return request_boxes(loaded.image, mode, temperature, ctx)
+
+    key = None
+    if ctx and cache:
+        key = detection_key(loaded, mode, temperature, ctx)
+        with span("cache"):
+            boxes = cache.get(key)
+        if boxes is not None:
+            logger.info(f"Using cached {mode} detection for {loaded.path}")
+            if dedup:
+                with span("dhash"):
+                    image_hash, thumbnail = dhash(loaded.image), dedup_thumbnail(loaded.image)
+                dedup.add(group, image_hash, thumbnail, boxes)
+            return boxes
+
+    if dedup is None:
+        boxes = request()
+    else:
+        with span("dhash"):
+            image_hash, thumbnail = dhash(loaded.image), dedup_thumbnail(loaded.image)
+        with span("dedup_wait"):
+            boxes, entry = dedup.lookup(group, image_hash, thumbnail)
+        if boxes is not None:
+            logger.info(f"Reusing the {mode} detection of a near-duplicate for {loaded.path}")
+            return boxes
+        try:
+            boxes = request()
+        finally:
+            # None when the request failed, so waiting near-duplicates make their own
+            entry.settle(boxes)
+
+    if cache and key:
+        with span("cache"):
+            cache.put(key, boxes)
+    return boxes
+
+@dataclass
+class Detection:
+    """
+    Boxes found by a detector.
+
+    Attributes:
+        boxes: Boxes normalized to 0-1000, in the format parse_boxes returns
+        confidence: How sure the detector is, from 0.0 to 1.0
+        detector: Name of the backend that produced the boxes
+    """
+    boxes: List[Dict[str, Any]]
+    confidence: float
+    detector: str
+
+class Detector(ABC):
+    """
+    A backend that finds the boxes in an image; one per --detector choice.
+
+    Subclasses implement detect(). Detectors are shared by all workers of a run, so
+    detect() must be thread-safe.
+    """
+
+    name = ""
+
+    @abstractmethod
+    def detect(
+        self,
+        loaded: LoadedImage,
+        mode: str,
+        temperature: float,
+        ctx: Optional[RunContext] = None
+    ) -> Detection:
+        """
+        Find the boxes in an image.
+
+        Args:
+            loaded: The image
+            mode: Detection mode ('tweet' or 'general')
+            temperature: Temperature setting for the Gemini model (0.0-1.0)
+            ctx: Shared state of the current run
+
+        Returns:
+            Detection: The boxes and how confident the detector is in them
+
+        Raises:
+            DetectionError: If the detector cannot handle the image or mode
+        """
+
+class GeminiDetector(Detector):
+    """Detection by Gemini, through the detection cache."""
+
+    name = "gemini"
+
+    def detect(
+        self,
+        loaded: LoadedImage,
+        mode: str,
+        temperature: float,
+        ctx: Optional[RunContext] = None
+    ) -> Detection:
+        return Detection(detect_boxes(loaded, mode, temperature, ctx), confidence=1.0, detector=self.name)
+
+def pixel_values(img: "PIL.Image.Image") -> List[float]:
+    """Values of a single-band image, row by row (Image.getdata is deprecated since Pillow 12.1)."""
+    flattened = getattr(img, "get_flattened_data", None)
+    return list(flattened() if flattened else img.getdata())
+
+def find_tweet_region(img: "PIL.Image.Image", analysis_width: int = 360) -> Tuple[Optional[Dict[str, float]], float]:
+    """
+    Locate the main tweet in a screenshot from its layout alone, in a few milliseconds.
+
+    Tweet screenshots are very regular: a flat background, a header separated from the
+    tweet by a faint full-width divider line, the tweet itself (avatar, name, text, media),
+    the timestamp/views row, and another divider above the engagement bar. This finds the
+    dividers and the blocks of "ink" between them from per-row averages of a
+    background-difference mask, and returns the blocks above the timestamp row, which is
+    the same region TWEET_PROMPT asks Gemini for.
+
+    The confidence starts at the fraction of the left/right border that matches the
+    background (screenshots are flat there, photos are not) and is reduced for each
+    expected landmark that is missing.
+
+    Args:
+        img: The screenshot
+        analysis_width: Width the screenshot is shrunk to for analysis
 
     Returns:
-        argparse.Namespace: The parsed command line arguments.
+        Tuple[Optional[Dict[str, float]], float]: The box normalized to 0-1000 (None if
+            nothing was found), and the confidence from 0.0 to 1.0
     """
-    # Create examples for the help text
-    examples = """
-Examples:
-    # Basic usage with default parameters (tweet mode)
-    # Output will be saved as input_filename_bbox.ext
-    python bboxes.py --image-path "my_tweet.jpg"
+    import PIL.Image
+    import PIL.ImageChops
+
+    gray = img.convert('L')
+    if gray.width > analysis_width:
+        gray = gray.resize((analysis_width, max(1, round(gray.height * analysis_width / gray.width))), PIL.Image.Resampling.BOX)
+    width, height = gray.size
+
+    border = pixel_values(gray.crop((0, 0, 1, height))) + pixel_values(gray.crop((width - 1, 0, width, height)))
+    background = sorted(border)[len(border) // 2]
+    uniformity = sum(1 for value in border if abs(value - background) <= 8) / len(border)
+
+    difference = PIL.ImageChops.difference(gray, PIL.Image.new('L', gray.size, background))
+    # Text, icons and avatars stand out from the background; in light mode divider lines
+    # barely do
+    ink = difference.point(lambda value: 255 if value > 24 else 0)
+    faint = difference.point(lambda value: 255 if value > 4 else 0)
+
+    def row_profile(mask: "PIL.Image.Image") -> List[float]:
+        # Shrinking to one column averages every row exactly (in float mode)
+        return [value / 255 for value in pixel_values(mask.convert('F').resize((1, mask.height), PIL.Image.Resampling.BOX))]
+
+    ink_rows = row_profile(ink)
+    faint_rows = row_profile(faint)
+
+    # Dividers: thin runs of rows that are marked across nearly the full width (thick
+    # runs are banners or photos)
+    max_divider = max(2, height // 250)
+    dividers: List[int] = []
+    run: List[int] = []
+    for y in range(height + 1):
+        if y < height and faint_rows[y] >= 0.9:
+            run.append(y)
+            continue
+        if run and len(run) <= max_divider:
+            dividers.append(run[0])
+        run = []
+
+    header_dividers = [y for y in dividers if y < height * 0.25]
+    top = header_dividers[-1] + max_divider if header_dividers else 0
+    footer_dividers = [y for y in dividers if y > top + height * 0.05]
+    bottom = footer_dividers[0] if footer_dividers else height
+
+    # Blocks of ink rows; text lines of one paragraph are merged, the gap above the
+    # timestamp row is usually wide enough to keep it separate
+    merge_gap = max(2, round(width * 0.022))
+    blocks: List[List[int]] = []
+    for y in range(top, bottom):
+        if ink_rows[y] < 0.002:
+            continue
+        if blocks and y - blocks[-1][1] <= merge_gap:
+            blocks[-1][1] = y
+        else:
+            blocks.append([y, y])
+
+    if not blocks:
+        return None, 0.0
+
+    confidence = uniformity
+    if not header_dividers:
+        confidence *= 0.8
+    if not footer_dividers:
+        confidence *= 0.6
+    if len(blocks) >= 2:
+        # Leave out the last block: the timestamp and view count row
+        content_top, content_bottom = blocks[0][0], blocks[-2][1] + 1
+    else:
+        content_top, content_bottom = blocks[0][0], blocks[0][1] + 1
+        confidence *= 0.5
+
+    columns = [value / 255 for value in pixel_values(ink.crop((0, content_top, width, content_bottom)).convert('F').resize((width, 1), PIL.Image.Resampling.BOX))]
+    inked = [x for x, value in enumerate(columns) if value > 0]
+    if not inked:
+        return None, 0.0
+
+    box = {
+        'xmin': inked[0] / width * 1000,
+        'ymin': content_top / height * 1000,
+        'xmax': (inked[-1] + 1) / width * 1000,
+        'ymax': content_bottom / height * 1000,
+    }
+    if not 0.05 <= (content_bottom - content_top) / height <= 0.95:
+        confidence *= 0.3
+
+    return box, round(confidence, 3)
+
+class LocalTweetDetector(Detector):
+    """Offline detection of the main tweet in a screenshot, using find_tweet_region."""
+
+    name = "local"
+
+    def detect(
+        self,
+        loaded: LoadedImage,
+        mode: str,
+        temperature: float,
+        ctx: Optional[RunContext] = None
+    ) -> Detection:
+        if mode != "tweet":
+            raise DetectionError("The local detector only supports tweet mode")
+
+        box, confidence = find_tweet_region(loaded.image)
+        if box is None:
+            raise DetectionError(f"No tweet content found in {loaded.path}")
+
+        logger.debug(f"Local detector found {box} in {loaded.path} with confidence {confidence}")
+        return Detection([box], confidence=confidence, detector=self.name)
+
+class LocalThenGeminiDetector(Detector):
+    """
+    The local detector first, escalating to Gemini only when it is unsure.
 
-    # Process all images in a directory
-    python bboxes.py --image-path "path/to/image/directory"
+    Images whose local confidence is below `threshold`, or which the local detector
+    cannot handle at all (including every image in general mode), go to Gemini.
+    """
 
-    # Process directory with custom output directory
-    python bboxes.py --image-path "input/directory" --output-path "output/directory"
+    name = "local-then-gemini"
+
+    def __init__(self, threshold: float) -> None:
+        self.threshold = threshold
+        self.local = LocalTweetDetector()
+        self.gemini = GeminiDetector()
+        self.local_count = 0
+        self.escalated_count = 0
+        self._lock = threading.Lock()
+
+    def detect(
+        self,
+        loaded: LoadedImage,
+        mode: str,
+        temperature: float,
+        ctx: Optional[RunContext] = None
+    ) -> Detection:
+        try:
+            detection = self.local.detect(loaded, mode, temperature, ctx)
+            if detection.confidence >= self.threshold:
+                with self._lock:
+                    self.local_count += 1
+                return detection
+            logger.info(f"Local confidence {detection.confidence:.2f} for {loaded.path} is below {self.threshold}, asking Gemini")
+        except DetectionError as e:
+            logger.info(f"{e}, asking Gemini")
+
+        with self._lock:
+            self.escalated_count += 1
+        return self.gemini.detect(loaded, mode, temperature, ctx)
+
+class StoredBoxesDetector(Detector):
+    """
+    Boxes detected by an earlier run, so outputs can be re-rendered without any API calls (--replay).
+
+    The boxes come from a results sidecar (--results) when one is given, otherwise from
+    the detection cache. Either way they are looked up by the image's sha256, so the
+    images may have been moved or renamed since. (Boxes reused from a near-duplicate
+    are only in the sidecar: the cache holds what Gemini said about each exact file.)
+    Changing the box style, label, crop
+    percentage or resize then only costs the padding, crop, draw and save of each image,
+    which the batch engine spreads over its render processes.
+    """
 
-    # Specify an image path and output
-    python bboxes.py --image-path "my_tweet.jpg" --output-path "result.jpg"
+    name = "replay"
+
+    def __init__(self, results_path: Optional[str] = None) -> None:
+        """
+        Args:
+            results_path: A results sidecar to take the boxes from. If None, they come
+                from the run's detection cache.
+
+        Raises:
+            OSError: If the sidecar cannot be read
+        """
+        self.results_path = results_path
+        self.stored = self.load_results(results_path) if results_path else None
+
+    @staticmethod
+    def load_results(path: str) -> Dict[Tuple[str, str], List[Dict[str, Any]]]:
+        """
+        Read the detected boxes of a results sidecar.
+
+        Args:
+            path: Path to the JSONL file written by ResultsSidecar
+
+        Returns:
+            Dict[Tuple[str, str], List[Dict[str, Any]]]: The boxes by (sha256, mode). Of
+                several records for the same image, the last one with boxes wins.
+        """
+        stored: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    if record['sha256'] and record['boxes']:
+                        stored[(record['sha256'], record['mode'])] = record['boxes']
+                except (ValueError, KeyError, TypeError):
+                    # A partly written last line
+                    continue
+        logger.info(f"Loaded stored boxes for {len(stored)} images from {path}")
+        return stored
+
+    def detect(
+        self,
+        loaded: LoadedImage,
+        mode: str,
+        temperature: float,
+        ctx: Optional[RunContext] = None
+    ) -> Detection:
+        if self.stored is not None:
+            boxes = self.stored.get((loaded.sha256, mode))
+            source = self.results_path
+        else:
+            cache = ctx.cache if ctx else None
+            if cache is None:
+                raise DetectionError("Replaying from the detection cache needs the cache to be enabled")
+            boxes = cache.get(detection_key(loaded, mode, temperature, ctx))
+            source = "the detection cache"
 
-    # Use general object detection mode
-    python bboxes.py --mode "general" --image-path "photo.jpg"
+        if boxes is None:
+            raise DetectionError(f"No stored {mode} boxes for {loaded.path} in {source}")
+        logger.debug(f"Replaying {len(boxes)} stored boxes for {loaded.path}")
+        return Detection(boxes, confidence=1.0, detector=self.name)
 
-    # Customize the bounding box
-    python bboxes.py --image-path "tweet.png" --box-color "blue" --box-width 5 --label "Twitter Post"
+# --detector choices
+DETECTORS = ("gemini", "local", "local-then-gemini")
 
-    # Crop to the detected area instead of drawing a box
-    python bboxes.py --image-path "tweet.jpg" --autocrop
+def make_detector(name: str, replay_results: Optional[str] = None) -> Detector:
+    """
+    Create the detector backend for a --detector choice, or "replay" for --replay.
 
-    # Crop with custom percentage (to fine-tune where the bottom crop occurs)
-    python bboxes.py --image-path "tweet.jpg" --autocrop --crop-percent 90.0
+    Args:
+        name: One of DETECTORS, or "replay"
+        replay_results: For "replay", the results sidecar to take the boxes from. If
+            None, they come from the detection cache.
 
-    # Crop and resize to 1080x1350 with primary color background
-    python bboxes.py --image-path "tweet.jpg" --autocrop --resize
+    Returns:
+        Detector: The backend
+    """
+    if name == "replay":
+        return StoredBoxesDetector(replay_results)
+    if name == "local":
+        return LocalTweetDetector()
+    if name == "local-then-gemini":
+        return LocalThenGeminiDetector(settings.LOCAL_CONFIDENCE_THRESHOLD)
+    return GeminiDetector()
+
+def render_tweet_box(
+    img: "PIL.Image.Image",
+    tweet_box: Dict[str, float],
+    output_path: str,
+    box_color: str = "red",
+    box_width: int = 4,
+    label: Optional[str] = None,
+    autocrop: bool = False,
+    crop_percent: float = 92.0,
+    resize: bool = False,
+    encoding: Optional[OutputEncoding] = None
+) -> List[Dict[str, Any]]:
+    """
+    Pad a detected tweet box, then crop to it or draw it, and save the result.
 
-    # Override the default deterministic temperature setting (0.0)
-    python bboxes.py --image-path "tweet.jpg" --temperature 0.2
+    Args:
+        img: The full-resolution image
+        tweet_box: The box from parse_boxes, normalized to 0-1000
+        output_path: Path to save the output image
+        box_color: Color of the bounding box (name or hex code)
+        box_width: Width of the bounding box line
+        label: Custom label for the bounding box. Defaults to "Tweet Content".
+        autocrop: If True, crop the image to the detected area instead of drawing a box
+        crop_percent: Percentage of tweet height to include when cropping
+        resize: If True and autocrop is True, resize the cropped image to 1080x1350
+        encoding: How to encode the output. Defaults to OutputEncoding().
 
-    # Enable debug logging
-    python bboxes.py --verbose --image-path "image.jpg"
+    Returns:
+        List[Dict[str, Any]]: The one rendered region: its "label", its pixel "box" as
+            detected and "padded" as drawn or cropped (both [xmin, ymin, xmax, ymax]),
+            and the "output" file
+    """
+    import PIL.ImageDraw
+
+    xmin = tweet_box['xmin']
+    ymin = tweet_box['ymin']
+    xmax = tweet_box['xmax']
+    ymax = tweet_box['ymax']
+
+    logger.debug(f"Bounding box coordinates: xmin={xmin}, ymin={ymin}, xmax={xmax}, ymax={ymax}")
+
+    # Convert normalized coordinates (0-1000 range) to absolute pixel coordinates
+    width, height = img.size
+    abs_xmin = int(xmin / 1000 * width)
+    abs_ymin = int(ymin / 1000 * height)
+    abs_xmax = int(xmax / 1000 * width)
+    abs_ymax = int(ymax / 1000 * height)
+    logger.debug(f"Converted to absolute coordinates: xmin={abs_xmin}, ymin={abs_ymin}, xmax={abs_xmax}, ymax={abs_ymax}")
+
+    # Add padding to ensure we capture all content
+    # Horizontal padding (5% of width on each side)
+    h_padding = int(width * 0.05)
+    # Vertical padding (5% of detected height for top, but no padding at the bottom to exclude timestamp/view count)
+    v_padding_top = int((abs_ymax - abs_ymin) * 0.05)
+
+    # For autocrop, we want to exclude the timestamp and view count at the bottom
+    # Create smarter padding calculations based on whether we're cropping or drawing boxes
+    if autocrop:
+        # When cropping, reduce bottom padding to exclude timestamp
+        # Estimate the position of timestamp (typically about 92-95% of the way down from the top of the tweet)
+        # Find approximate height of tweet content excluding timestamp
+        tweet_content_height = abs_ymax - abs_ymin
+        # Target approximately 92% of the tweet height to cut off timestamp
+        timestamp_position = abs_ymin + int(tweet_content_height * crop_percent / 100)
+
+        # Apply more precise padding for cropping
+        padded_xmin = max(0, abs_xmin - h_padding)
+        padded_ymin = max(0, abs_ymin - v_padding_top)
+        padded_xmax = min(width, abs_xmax + h_padding)
+        # Use the estimated timestamp position instead of the full ymax
+        padded_ymax = min(height, timestamp_position)
+
+        logger.debug(f"Cropping with tighter bottom margin to exclude timestamp: ymax={padded_ymax}")
+        logger.debug(f"Original height: {abs_ymax-abs_ymin}px, Cropped height: {padded_ymax-padded_ymin}px, Crop percent: {crop_percent}%")
+        logger.debug(f"Removed approximately {abs_ymax-timestamp_position}px from bottom to exclude timestamp/views")
+    else:
+        # For drawing boxes, use normal padding to show the full tweet
+        v_padding_bottom = int((abs_ymax - abs_ymin) * 0.10)
+
+        # Apply standard padding for drawing boxes
+        padded_xmin = max(0, abs_xmin - h_padding)
+        padded_ymin = max(0, abs_ymin - v_padding_top)
+        padded_xmax = min(width, abs_xmax + h_padding)
+        padded_ymax = min(height, abs_ymax + v_padding_bottom)
+
+    logger.debug(f"Added padding to coordinates: xmin={padded_xmin}, ymin={padded_ymin}, xmax={padded_xmax}, ymax={padded_ymax}")
+
+    # Use custom label or default
+    box_label = label if label else "Tweet Content"
+    region = {
+        'label': box_label,
+        'box': [abs_xmin, abs_ymin, abs_xmax, abs_ymax],
+        'padded': [padded_xmin, padded_ymin, padded_xmax, padded_ymax],
+        'output': output_path,
+    }
+
+    if autocrop:
+        # Crop the image to the padded bounding box
+        with span("crop"):
+            cropped_img = img.crop((padded_xmin, padded_ymin, padded_xmax, padded_ymax))
+
+        # Either resize the cropped image or just save it
+        if resize:
+            logger.info("Resizing cropped image to 1080x1350")
+            region['output'] = resize_image_with_background(cropped_img, output_path, encoding)
+        else:
+            save_output(cropped_img, output_path, encoding)
+            logger.info(f"Cropped image saved to {output_path}")
+            print(f"Cropped image saved to {output_path}")
+    else:
+        # Draw using padded coordinates
+        with span("draw"):
+            draw = PIL.ImageDraw.Draw(img)
+            draw.rectangle([(padded_xmin, padded_ymin), (padded_xmax, padded_ymax)], outline=box_color, width=box_width)
+            draw.text((padded_xmin, padded_ymin - 20), box_label, fill=box_color)
+        logger.debug(f"Drew bounding box with label: {box_label}")
+
+        save_output(img, output_path, encoding)
+        logger.info(f"Image with tweet content box saved to {output_path}")
+        print(f"Image with tweet content box saved to {output_path}")
+
+    return [region]
+
+def render_object_boxes(
+    img: "PIL.Image.Image",
+    object_data: List[Dict[str, Any]],
+    output_path: str,
+    box_color: str = "red",
+    box_width: int = 3,
+    autocrop: bool = False,
+    resize: bool = False,
+    encoding: Optional[OutputEncoding] = None
+) -> List[Dict[str, Any]]:
     """
+    Pad detected object boxes, then crop each object out or draw them all, and save the result.
 
-    parser = argparse.ArgumentParser(
-        description="Detect objects or tweet content in images and draw bounding boxes",
-        epilog=examples,
-        formatter_class=argparse.RawDescriptionHelpFormatter
-    )
-    parser.add_argument(
-        "--image-path", type=str, required=False,
-        help="Path to the input image file or directory containing images"
-    )
-    parser.add_argument(
-        "--output-path", type=str,
-        help="Path to save the output image or directory for multiple images"
-    )
-    parser.add_argument(
-        "--mode", type=str, choices=["tweet", "general"], default="tweet",
-        help="Detection mode: 'tweet' for tweet content or 'general' for all objects"
-    )
-    parser.add_argument(
-        "--box-color", type=str, default="red",
-        help="Color of the bounding box (name or hex code)"
-    )
-    parser.add_argument(
-        "--box-width", type=int, default=4,
-        help="Width of the bounding box line"
-    )
-    parser.add_argument(
-        "--label", type=str,
-        help="Custom label for the bounding box (tweet mode only)"
-    )
-    parser.add_argument(
-        "--autocrop", action="store_true",
-        help="Crop image to the detected area instead of drawing a bounding box"
-    )
-    parser.add_argument(
-        "--crop-percent", type=float, default=100.0,
-        help="When using --autocrop with tweets, percentage of tweet height to include (default: 100.0)"
-    )
-    parser.add_argument(
-        "--resize", action="store_true",
-        help="When used with --autocrop, resize the output to 1080x1350 and center it on a background of the primary color"
-    )
-    parser.add_argument(
-        "--temperature", type=float, default=settings.GEMINI_TEMPERATURE,
-        help=f"Temperature setting for the Gemini model (0.0-1.0). Lower values produce more consistent results. (default: {settings.GEMINI_TEMPERATURE} - deterministic)"
-    )
-    parser.add_argument(
-        "--verbose", action="store_true",
-        help="Enable verbose debug logging"
-    )
+    Args:
+        img: The full-resolution image
+        object_data: The boxes from parse_boxes, normalized to 0-1000
+        output_path: Path to save the output image. With autocrop, each object is saved
+            next to it as "{name}_{n}_{label}{ext}".
+        box_color: Color of the bounding box (name or hex code)
+        box_width: Width of the bounding box line
+        autocrop: If True, save individual cropped images for each object instead of drawing boxes
+        resize: If True and autocrop is True, resize the cropped images to 1080x1350
+        encoding: How to encode the outputs. Defaults to OutputEncoding().
+
+    Returns:
+        List[Dict[str, Any]]: One region per valid box, in the format of
+            render_tweet_box. Without autocrop, they all share the one output file.
+    """
+    import PIL.ImageDraw
+
+    width, height = img.size
+    object_count = 0
+    regions: List[Dict[str, Any]] = []
+
+    # Initialize draw only if we're not autocropping
+    # This fixes the linter error about using draw before assignment
+    draw = None
+    if not autocrop:
+        # Draw bounding boxes on the original image
+        draw = PIL.ImageDraw.Draw(img)
+
+    for i, obj in enumerate(object_data):
+        xmin: Optional[float] = obj.get('xmin')
+        ymin: Optional[float] = obj.get('ymin')
+        xmax: Optional[float] = obj.get('xmax')
+        ymax: Optional[float] = obj.get('ymax')
+        label: str = obj.get('label', 'Object')  # Default label if not present
+
+        logger.debug(f"Processing object: {label} at coordinates: xmin={xmin}, ymin={ymin}, xmax={xmax}, ymax={ymax}")
+
+        if all(isinstance(coord, (int, float)) for coord in [xmin, ymin, xmax, ymax]): #check if coordinates are valid numbers.
+            # Convert normalized coordinates (0-1000 range) to absolute pixel coordinates
+            abs_xmin = int(xmin / 1000 * width)
+            abs_ymin = int(ymin / 1000 * height)
+            abs_xmax = int(xmax / 1000 * width)
+            abs_ymax = int(ymax / 1000 * height)
+            logger.debug(f"Converted to absolute coordinates: xmin={abs_xmin}, ymin={abs_ymin}, xmax={abs_xmax}, ymax={abs_ymax}")
+
+            # Add padding to ensure we capture all content
+            # Horizontal padding (3% of width on each side)
+            h_padding = int(width * 0.03)
+
+            if autocrop:
+                # For autocropping, use tighter padding to avoid including unwanted elements
+                # Vertical padding (5% of detected height)
+                v_padding = int((abs_ymax - abs_ymin) * 0.05)
+            else:
+                # For drawing boxes, use more generous padding
+                # Vertical padding (8% of detected height for top and bottom)
+                v_padding = int((abs_ymax - abs_ymin) * 0.08)
+
+            # Apply padding while ensuring we don't go out of bounds
+            padded_xmin = max(0, abs_xmin - h_padding)
+            padded_ymin = max(0, abs_ymin - v_padding)
+            padded_xmax = min(width, abs_xmax + h_padding)
+            padded_ymax = min(height, abs_ymax + v_padding)
+
+            logger.debug(f"Added padding to coordinates: xmin={padded_xmin}, ymin={padded_ymin}, xmax={padded_xmax}, ymax={padded_ymax}")
+
+            object_output = output_path
+            if autocrop:
+                # For autocrop, create a unique filename for each object
+                # Get the base output path and extension
+                output_dir = os.path.dirname(output_path)
+                output_basename = os.path.basename(output_path)
+                output_name, output_ext = os.path.splitext(output_basename)
+
+                # Create a unique filename for each object
+                object_output = os.path.join(
+                    output_dir,
+                    f"{output_name}_{i+1}_{label.lower().replace(' ', '_')}{output_ext}"
+                )
+
+                # Crop the image to the padded bounding box
+                with span("crop"):
+                    cropped_img = img.crop((padded_xmin, padded_ymin, padded_xmax, padded_ymax))
 
-    return parser.parse_args()
+                # Either resize the cropped image or just save it
+                if resize:
+                    logger.info(f"Resizing cropped image of {label} to 1080x1350")
+                    object_output = resize_image_with_background(cropped_img, object_output, encoding)
+                else:
+                    save_output(cropped_img, object_output, encoding)
+                    logger.info(f"Cropped image for {label} saved to {object_output}")
+                    print(f"Cropped image for {label} saved to {object_output}")
+            else:
+                # Draw using padded coordinates
+                with span("draw"):
+                    draw.rectangle([(padded_xmin, padded_ymin), (padded_xmax, padded_ymax)], outline=box_color, width=box_width)
+                    draw.text((padded_xmin, padded_ymin - 10), label, fill=box_color) #draw the label above the bounding box.
+                logger.debug(f"Drew bounding box for object: {label}")
+
+            regions.append({
+                'label': label,
+                'box': [abs_xmin, abs_ymin, abs_xmax, abs_ymax],
+                'padded': [padded_xmin, padded_ymin, padded_xmax, padded_ymax],
+                'output': object_output,
+            })
+            object_count += 1
+        else:
+            logger.warning(f"Invalid bounding box coordinates for {label}: {obj}")
+            print(f"Warning: Invalid bounding box coordinates for {label}: {obj}")
+
+    if not autocrop and object_count > 0:
+        save_output(img, output_path, encoding)
+        logger.info(f"Image with {object_count} bounding boxes saved to {output_path}")
+        print(f"Image with bounding boxes saved to {output_path}")
+    elif not autocrop and object_count == 0:
+        logger.warning("No valid objects detected to draw bounding boxes")
+        print("Warning: No valid objects detected to draw bounding boxes")
+
+    return regions
 
 def detect_tweet_content(
     image_path: str,
@@ -567,8 +4322,10 @@ def detect_tweet_content(
     autocrop: bool = False,
     crop_percent: float = 92.0,
     resize: bool = False,
-    temperature: float = settings.GEMINI_TEMPERATURE
-) -> None:
+    temperature: float = settings.GEMINI_TEMPERATURE,
+    ctx: Optional[RunContext] = None,
+    image: Optional[LoadedImage] = None
+) -> List[Dict[str, Any]]:
     """
     Detects tweet content in an image using Gemini, draws a bounding box, and saves the result.
 
@@ -587,208 +4344,25 @@ def detect_tweet_content(
         resize: If True and autocrop is True, resize the cropped image to 1080x1350. Defaults to False.
         temperature: Temperature setting for the Gemini model (0.0-1.0).
                     Defaults to settings.GEMINI_TEMPERATURE (deterministic).
+        ctx: Shared state of the current run (detector, cache, models, upload settings). Defaults to None.
+        image: The already loaded image. If None, it is loaded from image_path.
 
     Returns:
-        None
+        List[Dict[str, Any]]: The detected box (a single one), normalized to 0-1000.
 
     Raises:
         FileNotFoundError: If the image file doesn't exist.
-        Exception: If there's an error processing the image or in the Gemini API.
+        InvalidImageError: If the file cannot be decoded as an image.
+        GeminiAPIError: If the Gemini API call fails or returns no usable box.
     """
-    try:
-        logger.info(f"Detecting tweet content in {image_path}")
-        logger.debug(f"Using box color: {box_color}, width: {box_width}, label: {label}, autocrop: {autocrop}, crop_percent: {crop_percent}, resize: {resize}, temperature: {temperature}")
-
-        model = genai.GenerativeModel(settings.GEMINI_MODEL, generation_config={"temperature": temperature})
-        logger.debug(f"Initialized Gemini model: {settings.GEMINI_MODEL} with temperature: {temperature}")
-
-        img = PIL.Image.open(image_path)
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format='JPEG')
-        img_byte_arr = img_byte_arr.getvalue()
-        logger.debug(f"Image loaded and converted, size: {len(img_byte_arr)} bytes")
-
-        img_part: Dict[str, Union[str, bytes]] = {"mime_type": "image/jpeg", "data": img_byte_arr}
-
-        prompt_parts: List[Union[Dict[str, Union[str, bytes]], str]] = [
-            img_part,
-            """You're looking at a screenshot of a tweet. Create a precise bounding box around the MAIN TWEET CONTENT ONLY.
-
-            The bounding box MUST include:
-            1. The user's profile picture/avatar (usually circular)
-            2. The username and @handle
-            3. The "Follow" button
-            4. The entire tweet text/content - CRITICALLY IMPORTANT TO INCLUDE ALL TEXT, INCLUDING ANY EMOJI OR SPECIAL CHARACTERS
-
-            This is a single cohesive unit that forms the main tweet. Make sure the box captures ALL of this content.
-
-            The bounding box MUST exclude:
-            1. The navigation elements and header
-            2. The date/timestamp (generally a line like "11:34 PM · 2/28/25")
-            3. The view count (e.g., "2M Views")
-            4. Like/retweet/view counts and all engagement metrics
-            5. Any replies or comments below the main tweet
-            6. Any UI elements at the bottom of the screen
-
-            VERY IMPORTANT: Draw the bottom boundary of the box ABOVE the timestamp and view count row.
-            The timestamp is generally shown in a smaller font below the tweet content, often with a dot separator and view count.
-
-            Make sure your coordinates cover the ENTIRE tweet content from the profile picture to the end of the tweet text.
-            When in doubt, make the bounding box LARGER rather than smaller to ensure no text is cut off.
-
-            It is better to include a bit more space than to cut off any part of the text!
-
-            Return only a JSON object with the exact coordinates as:
-            {"xmin": [left coordinate], "ymin": [top coordinate], "xmax": [right coordinate], "ymax": [bottom coordinate]}
-
-            The coordinates should be NORMALIZED to a range of 0-1000, where 0 represents the left/top edge and 1000 represents the right/bottom edge of the image."""
-        ]
-
-        logger.debug("Sending prompt to Gemini")
-        # Use the retry mechanism for the API call
-        response = generate_gemini_content(model, prompt_parts)
-        logger.debug("Received response from Gemini")
-
-        json_string: str = response.text
-        logger.debug(f"Raw response: {json_string}")
-
-        try:
-            # Try to find the JSON object in the response text
-            json_pattern = r'\{.*?\}'
-            match = re.search(json_pattern, json_string, re.DOTALL)
-
-            if match:
-                json_string = match.group(0)
-                logger.debug(f"Extracted JSON: {json_string}")
-
-            # Clean up malformed JSON with square brackets around values
-            json_string = re.sub(r'\[\s*(\d+)\s*\]', r'\1', json_string)
-            logger.debug(f"Cleaned JSON: {json_string}")
-
-            tweet_box: Dict[str, Any] = json.loads(json_string)
-        except json.JSONDecodeError:
-            logger.error(f"Invalid JSON response from Gemini: {json_string}")
-            print(f"Error: Invalid JSON response from Gemini: {json_string}")
-
-            # Attempt to manually extract coordinates if JSON parsing fails
-            try:
-                logger.debug("Attempting manual coordinate extraction")
-                xmin_match = re.search(r'"xmin":\s*\[?(\d+)', json_string)
-                ymin_match = re.search(r'"ymin":\s*\[?(\d+)', json_string)
-                xmax_match = re.search(r'"xmax":\s*\[?(\d+)', json_string)
-                ymax_match = re.search(r'"ymax":\s*\[?(\d+)', json_string)
-
-                if all([xmin_match, ymin_match, xmax_match, ymax_match]):
-                    tweet_box = {
-                        'xmin': int(xmin_match.group(1)),
-                        'ymin': int(ymin_match.group(1)),
-                        'xmax': int(xmax_match.group(1)),
-                        'ymax': int(ymax_match.group(1))
-                    }
-                    logger.debug(f"Manually extracted coordinates: {tweet_box}")
-                else:
-                    logger.error("Could not manually extract coordinates")
-                    return
-            except Exception as e:
-                logger.exception(f"Failed to manually extract coordinates: {e}")
-                return
-
-        # Check if we have valid coordinates
-        required_keys = ['xmin', 'ymin', 'xmax', 'ymax']
-        if all(key in tweet_box for key in required_keys):
-            xmin: float = float(tweet_box['xmin'])
-            ymin: float = float(tweet_box['ymin'])
-            xmax: float = float(tweet_box['xmax'])
-            ymax: float = float(tweet_box['ymax'])
-
-            logger.debug(f"Bounding box coordinates: xmin={xmin}, ymin={ymin}, xmax={xmax}, ymax={ymax}")
-
-            # Validate coordinates
-            if all(isinstance(coord, (int, float)) for coord in [xmin, ymin, xmax, ymax]):
-                # Convert normalized coordinates (0-1000 range) to absolute pixel coordinates
-                width, height = img.size
-                abs_xmin = int(xmin / 1000 * width)
-                abs_ymin = int(ymin / 1000 * height)
-                abs_xmax = int(xmax / 1000 * width)
-                abs_ymax = int(ymax / 1000 * height)
-                logger.debug(f"Converted to absolute coordinates: xmin={abs_xmin}, ymin={abs_ymin}, xmax={abs_xmax}, ymax={abs_ymax}")
-
-                # Add padding to ensure we capture all content
-                # Horizontal padding (5% of width on each side)
-                h_padding = int(width * 0.05)
-                # Vertical padding (5% of detected height for top, but no padding at the bottom to exclude timestamp/view count)
-                v_padding_top = int((abs_ymax - abs_ymin) * 0.05)
-
-                # For autocrop, we want to exclude the timestamp and view count at the bottom
-                # Create smarter padding calculations based on whether we're cropping or drawing boxes
-                if autocrop:
-                    # When cropping, reduce bottom padding to exclude timestamp
-                    # Estimate the position of timestamp (typically about 92-95% of the way down from the top of the tweet)
-                    # Find approximate height of tweet content excluding timestamp
-                    tweet_content_height = abs_ymax - abs_ymin
-                    # Target approximately 92% of the tweet height to cut off timestamp
-                    timestamp_position = abs_ymin + int(tweet_content_height * crop_percent / 100)
-
-                    # Apply more precise padding for cropping
-                    padded_xmin = max(0, abs_xmin - h_padding)
-                    padded_ymin = max(0, abs_ymin - v_padding_top)
-                    padded_xmax = min(width, abs_xmax + h_padding)
-                    # Use the estimated timestamp position instead of the full ymax
-                    padded_ymax = min(height, timestamp_position)
-
-                    logger.debug(f"Cropping with tighter bottom margin to exclude timestamp: ymax={padded_ymax}")
-                    logger.debug(f"Original height: {abs_ymax-abs_ymin}px, Cropped height: {padded_ymax-padded_ymin}px, Crop percent: {crop_percent}%")
-                    logger.debug(f"Removed approximately {abs_ymax-timestamp_position}px from bottom to exclude timestamp/views")
-                else:
-                    # For drawing boxes, use normal padding to show the full tweet
-                    v_padding_bottom = int((abs_ymax - abs_ymin) * 0.10)
-
-                    # Apply standard padding for drawing boxes
-                    padded_xmin = max(0, abs_xmin - h_padding)
-                    padded_ymin = max(0, abs_ymin - v_padding_top)
-                    padded_xmax = min(width, abs_xmax + h_padding)
-                    padded_ymax = min(height, abs_ymax + v_padding_bottom)
-
-                logger.debug(f"Added padding to coordinates: xmin={padded_xmin}, ymin={padded_ymin}, xmax={padded_xmax}, ymax={padded_ymax}")
-
-                if autocrop:
-                    # Crop the image to the padded bounding box
-                    cropped_img = img.crop((padded_xmin, padded_ymin, padded_xmax, padded_ymax))
-
-                    # Either resize the cropped image or just save it
-                    if resize:
-                        logger.info("Resizing cropped image to 1080x1350")
-                        resize_image_with_background(cropped_img, output_path)
-                    else:
-                        cropped_img.save(output_path)
-                        logger.info(f"Cropped image saved to {output_path}")
-                        print(f"Cropped image saved to {output_path}")
-                else:
-                    # Draw using padded coordinates
-                    draw = PIL.ImageDraw.Draw(img)
-                    draw.rectangle([(padded_xmin, padded_ymin), (padded_xmax, padded_ymax)], outline=box_color, width=box_width)
-
-                    # Use custom label or default
-                    box_label = label if label else "Tweet Content"
-                    draw.text((padded_xmin, padded_ymin - 20), box_label, fill=box_color)
-                    logger.debug(f"Drew bounding box with label: {box_label}")
-
-                    img.save(output_path)
-                    logger.info(f"Image with tweet content box saved to {output_path}")
-                    print(f"Image with tweet content box saved to {output_path}")
-            else:
-                logger.warning(f"Invalid bounding box coordinates: {tweet_box}")
-                print(f"Warning: Invalid bounding box coordinates: {tweet_box}")
-        else:
-            logger.error(f"Missing required coordinates in response: {tweet_box}")
-            print(f"Error: Missing required coordinates in response: {tweet_box}")
-
-    except Exception as e:
-        logger.exception(f"Error processing image: {e}")
-        print(f"Error processing image: {e}")
-        import traceback
-        traceback.print_exc()
+    logger.info(f"Detecting tweet content in {image_path}")
+    logger.debug(f"Using box color: {box_color}, width: {box_width}, label: {label}, autocrop: {autocrop}, crop_percent: {crop_percent}, resize: {resize}, temperature: {temperature}")
 
+    loaded = image or load_image(image_path)
+    detector = ctx.detector if ctx and ctx.detector else GeminiDetector()
+    boxes = detector.detect(loaded, "tweet", temperature, ctx).boxes
+    render_tweet_box(loaded.image, boxes[0], output_path, box_color, box_width, label, autocrop, crop_percent, resize)
+    return boxes
 
 def detect_objects_and_draw_boxes(
     image_path: str,
@@ -797,8 +4371,10 @@ def detect_objects_and_draw_boxes(
     box_width: int = 3,
     autocrop: bool = False,
     resize: bool = False,
-    temperature: float = settings.GEMINI_TEMPERATURE
-) -> None:
+    temperature: float = settings.GEMINI_TEMPERATURE,
+    ctx: Optional[RunContext] = None,
+    image: Optional[LoadedImage] = None
+) -> List[Dict[str, Any]]:
     """
     Detects objects in an image using Gemini, draws bounding boxes, and saves the result.
 
@@ -815,155 +4391,25 @@ def detect_objects_and_draw_boxes(
         resize: If True and autocrop is True, resize the cropped images to 1080x1350. Defaults to False.
         temperature: Temperature setting for the Gemini model (0.0-1.0).
                     Defaults to settings.GEMINI_TEMPERATURE (deterministic).
+        ctx: Shared state of the current run (detector, cache, models, upload settings). Defaults to None.
+        image: The already loaded image. If None, it is loaded from image_path.
 
     Returns:
-        None
+        List[Dict[str, Any]]: The detected objects, normalized to 0-1000.
 
     Raises:
         FileNotFoundError: If the image file doesn't exist.
-        Exception: If there's an error processing the image or in the Gemini API.
+        InvalidImageError: If the file cannot be decoded as an image.
+        GeminiAPIError: If the Gemini API call fails or its response is not a list.
     """
-    try:
-        logger.info(f"Detecting objects in {image_path}")
-        logger.debug(f"Using box color: {box_color}, width: {box_width}, autocrop: {autocrop}, resize: {resize}, temperature: {temperature}")
+    logger.info(f"Detecting objects in {image_path}")
+    logger.debug(f"Using box color: {box_color}, width: {box_width}, autocrop: {autocrop}, resize: {resize}, temperature: {temperature}")
 
-        model = genai.GenerativeModel(settings.GEMINI_MODEL, generation_config={"temperature": temperature})
-        logger.debug(f"Initialized Gemini model: {settings.GEMINI_MODEL} with temperature: {temperature}")
-
-        img = PIL.Image.open(image_path)
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format='JPEG')
-        img_byte_arr = img_byte_arr.getvalue()
-        logger.debug(f"Image loaded and converted, size: {len(img_byte_arr)} bytes")
-
-        img_part: Dict[str, Union[str, bytes]] = {"mime_type": "image/jpeg", "data": img_byte_arr}
-
-        prompt_parts: List[Union[Dict[str, Union[str, bytes]], str]] = [
-            img_part,
-            "Identify and provide bounding box coordinates for all objects in the image. Return the results in JSON format. Each object should have 'label', 'xmin', 'ymin', 'xmax', and 'ymax' fields. The coordinates should be NORMALIZED to a range of 0-1000, where 0 represents the left/top edge and 1000 represents the right/bottom edge of the image. If there are no objects, return an empty JSON array. Example: [{'label': 'dog', 'xmin': 100, 'ymin': 200, 'xmax': 400, 'ymax': 600}, {'label': 'cat', 'xmin': 500, 'ymin': 300, 'xmax': 800, 'ymax': 700}]"
-        ]
-
-        logger.debug("Sending prompt to Gemini")
-        response = model.generate_content(prompt_parts)
-        response.resolve()
-        logger.debug("Received response from Gemini")
-
-        json_string: str = response.text
-        logger.debug(f"Raw response: {json_string}")
-
-        try:
-            # Clean up malformed JSON with square brackets around values
-            json_string = re.sub(r'\[\s*(\d+)\s*\]', r'\1', json_string)
-            logger.debug(f"Cleaned JSON data: {json_string}")
-
-            object_data: List[Dict[str, Any]] = json.loads(json_string)
-            logger.debug(f"Parsed JSON data with {len(object_data)} objects")
-        except json.JSONDecodeError:
-            logger.error(f"Invalid JSON response from Gemini: {json_string}")
-            print(f"Error: Invalid JSON response from Gemini: {json_string}")
-            # No manual extraction for object detection as it's more complex
-            return
-
-        if isinstance(object_data, list):
-            width, height = img.size
-            object_count = 0
-
-            # Initialize draw only if we're not autocropping
-            # This fixes the linter error about using draw before assignment
-            draw = None
-            if not autocrop:
-                # Draw bounding boxes on the original image
-                draw = PIL.ImageDraw.Draw(img)
-
-            for i, obj in enumerate(object_data):
-                xmin: Optional[float] = obj.get('xmin')
-                ymin: Optional[float] = obj.get('ymin')
-                xmax: Optional[float] = obj.get('xmax')
-                ymax: Optional[float] = obj.get('ymax')
-                label: str = obj.get('label', 'Object')  # Default label if not present
-
-                logger.debug(f"Processing object: {label} at coordinates: xmin={xmin}, ymin={ymin}, xmax={xmax}, ymax={ymax}")
-
-                if all(isinstance(coord, (int, float)) for coord in [xmin, ymin, xmax, ymax]): #check if coordinates are valid numbers.
-                    # Convert normalized coordinates (0-1000 range) to absolute pixel coordinates
-                    abs_xmin = int(xmin / 1000 * width)
-                    abs_ymin = int(ymin / 1000 * height)
-                    abs_xmax = int(xmax / 1000 * width)
-                    abs_ymax = int(ymax / 1000 * height)
-                    logger.debug(f"Converted to absolute coordinates: xmin={abs_xmin}, ymin={abs_ymin}, xmax={abs_xmax}, ymax={abs_ymax}")
-
-                    # Add padding to ensure we capture all content
-                    # Horizontal padding (3% of width on each side)
-                    h_padding = int(width * 0.03)
-
-                    if autocrop:
-                        # For autocropping, use tighter padding to avoid including unwanted elements
-                        # Vertical padding (5% of detected height)
-                        v_padding = int((abs_ymax - abs_ymin) * 0.05)
-                    else:
-                        # For drawing boxes, use more generous padding
-                        # Vertical padding (8% of detected height for top and bottom)
-                        v_padding = int((abs_ymax - abs_ymin) * 0.08)
-
-                    # Apply padding while ensuring we don't go out of bounds
-                    padded_xmin = max(0, abs_xmin - h_padding)
-                    padded_ymin = max(0, abs_ymin - v_padding)
-                    padded_xmax = min(width, abs_xmax + h_padding)
-                    padded_ymax = min(height, abs_ymax + v_padding)
-
-                    logger.debug(f"Added padding to coordinates: xmin={padded_xmin}, ymin={padded_ymin}, xmax={padded_xmax}, ymax={padded_ymax}")
-
-                    if autocrop:
-                        # For autocrop, create a unique filename for each object
-                        # Get the base output path and extension
-                        output_dir = os.path.dirname(output_path)
-                        output_basename = os.path.basename(output_path)
-                        output_name, output_ext = os.path.splitext(output_basename)
-
-                        # Create a unique filename for each object
-                        object_output = os.path.join(
-                            output_dir,
-                            f"{output_name}_{i+1}_{label.lower().replace(' ', '_')}{output_ext}"
-                        )
-
-                        # Crop the image to the padded bounding box
-                        cropped_img = img.crop((padded_xmin, padded_ymin, padded_xmax, padded_ymax))
-
-                        # Either resize the cropped image or just save it
-                        if resize:
-                            logger.info(f"Resizing cropped image of {label} to 1080x1350")
-                            resize_image_with_background(cropped_img, object_output)
-                        else:
-                            cropped_img.save(object_output)
-                            logger.info(f"Cropped image for {label} saved to {object_output}")
-                            print(f"Cropped image for {label} saved to {object_output}")
-                    else:
-                        # Draw using padded coordinates
-                        draw.rectangle([(padded_xmin, padded_ymin), (padded_xmax, padded_ymax)], outline=box_color, width=box_width)
-                        draw.text((padded_xmin, padded_ymin - 10), label, fill=box_color) #draw the label above the bounding box.
-                        logger.debug(f"Drew bounding box for object: {label}")
-
-                    object_count += 1
-                else:
-                    logger.warning(f"Invalid bounding box coordinates for {label}: {obj}")
-                    print(f"Warning: Invalid bounding box coordinates for {label}: {obj}")
-
-            if not autocrop and object_count > 0:
-                img.save(output_path)
-                logger.info(f"Image with {object_count} bounding boxes saved to {output_path}")
-                print(f"Image with bounding boxes saved to {output_path}")
-            elif not autocrop and object_count == 0:
-                logger.warning("No valid objects detected to draw bounding boxes")
-                print("Warning: No valid objects detected to draw bounding boxes")
-        else:
-            logger.error("Gemini returned results that are not a list")
-            print("Gemini returned results that are not a list. Check the output.")
-
-    except Exception as e:
-        logger.exception(f"Error processing image: {e}")
-        print(f"Error processing image: {e}")
-        import traceback
-        traceback.print_exc()
+    loaded = image or load_image(image_path)
+    detector = ctx.detector if ctx and ctx.detector else GeminiDetector()
+    object_data = detector.detect(loaded, "general", temperature, ctx).boxes
+    render_object_boxes(loaded.image, object_data, output_path, box_color, box_width, autocrop, resize)
+    return object_data
 
 def main() -> int:
     """
@@ -1054,7 +4500,35 @@ def main() -> int:
         autocrop=args.autocrop,
         crop_percent=args.crop_percent,
         resize=args.resize,
-        temperature=args.temperature
+        temperature=args.temperature,
+        concurrency=args.concurrency,
+        use_cache=not args.no_cache,
+        upload_max_edge=args.upload_max_edge,
+        upload_quality=args.upload_quality,
+        resume=args.resume,
+        detector="replay" if args.replay is not None else args.detector,
+        render_workers=args.render_workers,
+        dedup_distance=None if args.no_dedup else args.dedup_distance,
+        discovery=DiscoveryFilter(
+            recursive=args.recursive,
+            include=args.include,
+            exclude=args.exclude,
+            min_size=args.min_size,
+            max_size=args.max_size,
+            modified_since=args.modified_since
+        ),
+        results_path=args.results,
+        replay_results=args.replay or None,
+        profile_path=args.profile,
+        tile=args.tile,
+        tile_overlap=args.tile_overlap,
+        batch_size=args.batch_size,
+        encoding=OutputEncoding(
+            format=args.output_format,
+            quality=args.output_quality,
+            strip_metadata=args.strip_metadata,
+            optimize=args.optimize
+        )
     )
 
 if __name__ == "__main__":
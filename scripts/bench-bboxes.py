@@ -0,0 +1,300 @@
+#!/usr/bin/env -S uv run --script
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "google-generativeai",
+#     "pillow",
+#     "pydantic",
+#     "pydantic-settings",
+#     "tenacity",
+# ]
+# ///
+"""
+End-to-end benchmark for the bboxes batch pipeline (home/private_dot_bin/executable_bboxes.py).
+
+Every real bboxes run costs money, so this runs the whole directory pipeline -- queue,
+thread pool, upload encoding, rate limiter, retries, parsing, drawing and saving --
+against MockGeminiModel, the local stand-in that GEMINI_MOCK selects. The mock sleeps for
+a configurable latency and fails a configurable fraction of requests, so the numbers show
+what the pipeline does around the network, and how retries eat into throughput:
+
+    img/s         images finished per second of wall-clock time
+    p50/p99       per-image latency, from when a worker takes the image to its final result
+    calls/img     Gemini requests per image, including retries
+    retry s/img   time per image spent on failed attempts and the backoff after them
+    retry %       share of all image latency that went to retries
+
+Inputs and mock failures are deterministic (seeded), so numbers are comparable across
+commits. Backoff waits come from GEMINI_MIN_WAIT / GEMINI_MAX_WAIT as usual; set them in
+the environment to see what a different retry policy would cost.
+
+With --startup it instead measures how long the CLI takes to get going, in fresh
+interpreters and without GEMINI_API_KEY, since every run pays for it before the first
+image:
+
+    import        importing the script as a module
+    --help        printing the help
+    arg error     rejecting a bad argument
+
+Usage:
+
+    # The default matrix: 64 images at concurrency 1, 4, 8, 16 and 32
+    uv run scripts/bench-bboxes.py
+
+    # Quick run while iterating: fast mock, 10% errors, short backoff
+    GEMINI_MIN_WAIT=0.1 GEMINI_MAX_WAIT=0.5 uv run scripts/bench-bboxes.py \\
+        --images 32 --concurrency 4,16 --latency-ms 200 --error-rate 0.1
+
+    # How much the render processes help when outputs are cropped and resized
+    uv run scripts/bench-bboxes.py --autocrop --resize --render-workers 0
+    uv run scripts/bench-bboxes.py --autocrop --resize --render-workers 8
+
+    # CLI startup time, plus the heaviest top-level imports
+    uv run scripts/bench-bboxes.py --startup
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import io
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import ModuleType
+
+BBOXES_SCRIPT = Path(__file__).resolve().parent.parent / "home" / "private_dot_bin" / "executable_bboxes.py"
+
+DEFAULT_CONCURRENCY = "1,4,8,16,32"
+
+IMPORT_BBOXES = (
+    "import importlib.util as u; "
+    f"s = u.spec_from_file_location('bboxes', {str(BBOXES_SCRIPT)!r}); "
+    "s.loader.exec_module(u.module_from_spec(s))"
+)
+
+# name -> arguments to a fresh interpreter
+STARTUP_COMMANDS: dict[str, list[str]] = {
+    "import": ["-c", IMPORT_BBOXES],
+    "--help": [str(BBOXES_SCRIPT), "--help"],
+    "arg error": [str(BBOXES_SCRIPT), "--concurrency", "0"],
+}
+
+
+def load_bboxes(latency_ms: float, jitter_ms: float, error_rate: float, throttle_rate: float, seed: int) -> ModuleType:
+    """Import the bboxes script with the mock selected; its settings are read at import."""
+    os.environ.update(
+        GEMINI_MOCK="true",
+        MOCK_BOXES="random",
+        MOCK_LATENCY_MS=str(latency_ms),
+        MOCK_JITTER_MS=str(jitter_ms),
+        MOCK_ERROR_RATE=str(error_rate),
+        MOCK_THROTTLE_RATE=str(throttle_rate),
+        MOCK_SEED=str(seed),
+    )
+    os.environ.setdefault("GEMINI_API_KEY", "mock")  # never sent anywhere
+
+    spec = importlib.util.spec_from_file_location("bboxes", BBOXES_SCRIPT)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["bboxes"] = module
+    spec.loader.exec_module(module)
+    # Retries and mock failures are expected here; keep them out of the table
+    logging.getLogger("bboxes").setLevel(logging.CRITICAL)
+    return module
+
+
+def generate_images(directory: Path, count: int, size: tuple[int, int], seed: int = 0) -> list[Path]:
+    """`count` PNGs of flat background with a few random blocks, like screenshots."""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        image = Image.new("RGB", size, rng.choice(["white", "black", "#15202b"]))
+        draw = ImageDraw.Draw(image)
+        for _ in range(rng.randint(3, 12)):
+            x0, y0 = rng.randrange(size[0] - 20), rng.randrange(size[1] - 20)
+            x1, y1 = rng.randint(x0 + 10, size[0]), rng.randint(y0 + 10, size[1])
+            draw.rectangle((x0, y0, x1, y1), fill=tuple(rng.randrange(256) for _ in range(3)))
+        path = directory / f"img{i:04d}.png"
+        image.save(path)
+        paths.append(path)
+    return paths
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def bench(
+    bboxes: ModuleType,
+    images: list[Path],
+    output_dir: Path,
+    concurrency: int,
+    mode: str,
+    render_workers: int = 0,
+    **render_options: object,
+) -> dict[str, float]:
+    """Run one batch and measure it."""
+    latencies: list[float] = []
+    ctx = bboxes.RunContext(limiter=bboxes.RateLimiter.from_settings(concurrency))
+    jobs = [(str(path), str(output_dir / path.name)) for path in images]
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        done, failed, _ = asyncio.run(
+            bboxes.process_batch(
+                jobs,
+                concurrency,
+                render_workers,
+                on_result=lambda result: latencies.append(result.elapsed),
+                mode=mode,
+                ctx=ctx,
+                **render_options,
+            )
+        )
+    elapsed = time.perf_counter() - start
+
+    stats = ctx.models.mock_stats
+    return {
+        "img/s": len(jobs) / elapsed,
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+        "calls/img": stats.calls / len(jobs),
+        "retry s/img": stats.retry_seconds / len(jobs),
+        "retry %": 100 * stats.retry_seconds / sum(latencies),
+        "failed": failed,
+    }
+
+
+def startup_env() -> dict[str, str]:
+    """The environment without an API key, so nothing can quietly depend on one."""
+    return {name: value for name, value in os.environ.items() if name != "GEMINI_API_KEY"}
+
+
+def bench_startup(repeat: int) -> dict[str, float]:
+    """Median wall-clock seconds of each STARTUP_COMMANDS entry, in fresh interpreters."""
+    times = {}
+    for name, command in STARTUP_COMMANDS.items():
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, *command], capture_output=True, env=startup_env())
+            runs.append(time.perf_counter() - start)
+        times[name] = statistics.median(runs)
+    return times
+
+
+def heaviest_imports(count: int) -> list[tuple[str, float]]:
+    """The top-level modules whose import (with their own imports) takes longest on --help."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *STARTUP_COMMANDS["--help"]],
+        capture_output=True,
+        text=True,
+        env=startup_env(),
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"; nesting indents the name
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].startswith(" ") and not fields[2].startswith("  ") and fields[1].strip().isdigit():
+            imports.append((fields[2].strip(), int(fields[1]) / 1e6))
+    return sorted(imports, key=lambda item: item[1], reverse=True)[:count]
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the bboxes batch pipeline against a mock Gemini.")
+    parser.add_argument("--images", type=int, default=64, help="images per run (default: 64)")
+    parser.add_argument(
+        "--concurrency",
+        default=DEFAULT_CONCURRENCY,
+        help=f"comma-separated concurrency levels (default: {DEFAULT_CONCURRENCY})",
+    )
+    parser.add_argument("--mode", choices=["tweet", "general"], default="tweet", help="detection mode (default: tweet)")
+    parser.add_argument(
+        "--render-workers",
+        type=int,
+        default=0,
+        help="render processes; 0 renders in the request threads (default: 0)",
+    )
+    parser.add_argument("--autocrop", action="store_true", help="crop instead of drawing boxes")
+    parser.add_argument("--resize", action="store_true", help="with --autocrop, also resize to 1080x1350")
+    parser.add_argument("--size", default="1170x2000", help="image size as WIDTHxHEIGHT (default: 1170x2000)")
+    parser.add_argument("--latency-ms", type=float, default=1500.0, help="mean mock latency (default: 1500)")
+    parser.add_argument("--jitter-ms", type=float, default=300.0, help="mock latency standard deviation (default: 300)")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="fraction of requests failing with a 503 (default: 0.05)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests failing with a 429 (default: 0)")
+    parser.add_argument("--seed", type=int, default=0, help="image generator and mock seed (default: 0)")
+    parser.add_argument("--startup", action="store_true", help="measure CLI startup instead of the pipeline")
+    parser.add_argument("--repeat", type=int, default=5, help="with --startup, runs per command; the median is reported (default: 5)")
+    args = parser.parse_args(argv)
+
+    try:
+        args.levels = [int(level) for level in args.concurrency.split(",")]
+        args.dimensions = tuple(int(side) for side in args.size.lower().split("x"))
+    except ValueError:
+        parser.error("--concurrency takes integers and --size takes WIDTHxHEIGHT")
+    if args.images < 1 or min(args.levels) < 1 or len(args.dimensions) != 2 or args.render_workers < 0:
+        parser.error("--images and --concurrency must be at least 1, --render-workers at least 0, and --size is WIDTHxHEIGHT")
+    if not 0 <= args.error_rate + args.throttle_rate <= 1:
+        parser.error("--error-rate plus --throttle-rate must be between 0 and 1")
+
+    return args
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+
+    if args.startup:
+        print(f"{'command':<10}  {'ms':>7}")
+        for name, seconds in bench_startup(args.repeat).items():
+            print(f"{name:<10}  {seconds * 1000:>7.1f}")
+        print(f"\n{'heaviest imports on --help':<40}  {'ms':>7}")
+        for module, seconds in heaviest_imports(8):
+            print(f"{module:<40}  {seconds * 1000:>7.1f}")
+        return 0
+
+    bboxes = load_bboxes(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate, args.seed)
+
+    with tempfile.TemporaryDirectory(prefix="bench-bboxes-") as tmp:
+        input_dir, output_dir = Path(tmp) / "in", Path(tmp) / "out"
+        input_dir.mkdir()
+        output_dir.mkdir()
+        images = generate_images(input_dir, args.images, args.dimensions, seed=args.seed)
+
+        print(
+            f"{'conc':>5}  {'img/s':>7}  {'p50 s':>7}  {'p99 s':>7}  {'calls/img':>9}  "
+            f"{'retry s/img':>11}  {'retry %':>7}  {'failed':>6}"
+        )
+        for level in args.levels:
+            row = bench(
+                bboxes,
+                images,
+                output_dir,
+                level,
+                args.mode,
+                args.render_workers,
+                autocrop=args.autocrop,
+                resize=args.resize,
+            )
+            print(
+                f"{level:>5}  {row['img/s']:>7.2f}  {row['p50']:>7.3f}  {row['p99']:>7.3f}  "
+                f"{row['calls/img']:>9.2f}  {row['retry s/img']:>11.3f}  {row['retry %']:>7.1f}  {row['failed']:>6}"
+            )
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,182 @@
+#!/usr/bin/env -S uv run --script
+# /// script
+# requires-python = ">=3.13"
+# dependencies = []
+# ///
+"""
+Throughput benchmark for the JSONC scanner behind scripts/check-jsonc.py (scripts/jsonc.py).
+
+The correctness tests (test_scripts_check_jsonc.py) say nothing about speed, and a
+scanner that walks text one character at a time is exactly the kind of code where a
+"harmless" refactor costs 5x. This generates synthetic JSONC corpora of a given size and
+shape and reports MB/s for each stage of the check:
+
+    uncomment             comment blanking (the tokenizer)
+    drop_trailing_commas  trailing-comma blanking on the uncommented text
+    loads                 the whole in-memory parse (both of the above + json.loads)
+    validate_stream       the constant-memory --stream path
+
+Corpora are deterministic (seeded), so numbers are comparable across commits. Each
+profile varies how much of the text is comments versus strings, since those are the two
+states the scanner has to track:
+
+    plain          few comments, mostly numbers/booleans
+    comment-heavy  a comment before most members, block and line
+    string-heavy   mostly string values, full of // /* and escaped quotes
+
+Usage:
+
+    # The full matrix: 1KB, 1MB and 100MB x every profile
+    uv run scripts/bench-check-jsonc.py
+
+    # Quick run while iterating on the scanner
+    uv run scripts/bench-check-jsonc.py --sizes 1KB,1MB --profiles plain --repeat 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from collections.abc import Callable
+
+import jsonc
+
+# name -> (comment density, string density): the chance that a member is preceded by a
+# comment, and the chance that a value is a string rather than a number/literal.
+PROFILES: dict[str, tuple[float, float]] = {
+    "plain": (0.02, 0.2),
+    "comment-heavy": (0.6, 0.2),
+    "string-heavy": (0.05, 0.9),
+}
+
+DEFAULT_SIZES = "1KB,1MB,100MB"
+
+_UNITS = {"B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3}
+
+# Distinct records generated per corpus; larger corpora repeat them. Enough variety that
+# branch patterns do not degenerate, cheap enough that a 100MB corpus builds in seconds.
+_RECORD_POOL = 256
+
+_STRINGS = [
+    "https://example.com/a/b",
+    "/* not a comment */",
+    'she said \\"// hi\\"',
+    "C:\\\\Users\\\\me",
+    "caf\\u00e9 \\u2603",
+    "plain text value",
+]
+
+
+def parse_size(text: str) -> int:
+    """'100MB' -> 104857600. A bare number is bytes."""
+    text = text.strip().upper()
+    for unit in sorted(_UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            return int(float(text[: -len(unit)]) * _UNITS[unit])
+    return int(text)
+
+
+def _record(rng: random.Random, comment_density: float, string_density: float) -> str:
+    lines = ["  {"]
+    members = rng.randint(3, 8)
+
+    for i in range(members):
+        if rng.random() < comment_density:
+            if rng.random() < 0.5:
+                lines.append("    // a line comment, with a URL https://x/y and a \"quote")
+            else:
+                lines.append("    /* a block comment\n       spanning two lines */")
+
+        if rng.random() < string_density:
+            value = f'"{rng.choice(_STRINGS)}"'
+        else:
+            value = rng.choice(["0", "-12.5e3", "true", "false", "null", str(rng.randint(0, 10**9))])
+
+        trailing = "," if i < members - 1 or rng.random() < 0.3 else ""
+        lines.append(f'    "key_{i}": {value}{trailing}')
+
+    lines.append("  },")
+    return "\n".join(lines)
+
+
+def generate_corpus(size: int, comment_density: float, string_density: float, seed: int = 0) -> str:
+    """A valid JSONC document (a top-level array of objects) of at least `size` bytes."""
+    rng = random.Random(seed)
+    pool = [_record(rng, comment_density, string_density) for _ in range(_RECORD_POOL)]
+
+    parts = ["// generated benchmark corpus\n[\n"]
+    length = len(parts[0])
+    i = 0
+    while length < size:
+        record = pool[i % _RECORD_POOL]
+        parts.append(record)
+        parts.append("\n")
+        length += len(record) + 1
+        i += 1
+    parts.append("]\n")  # the last record's trailing comma is a JSONC trailing comma
+
+    return "".join(parts)
+
+
+def best_of(fn: Callable[[], object], repeat: int) -> float:
+    """Fastest wall-clock time of `repeat` runs, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench(text: str, repeat: int) -> dict[str, float]:
+    """MB/s per stage for one corpus."""
+    uncommented = jsonc.uncomment(text)
+    chunk = jsonc.STREAM_CHUNK_SIZE
+    stages: dict[str, Callable[[], object]] = {
+        "uncomment": lambda: jsonc.uncomment(text),
+        "drop_trailing_commas": lambda: jsonc.drop_trailing_commas(uncommented),
+        "loads": lambda: jsonc.loads(text),
+        "validate_stream": lambda: jsonc.validate_stream(text[i : i + chunk] for i in range(0, len(text), chunk)),
+    }
+    megabytes = len(text.encode("utf-8")) / 1024**2
+    return {name: megabytes / best_of(fn, repeat) for name, fn in stages.items()}
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the check-jsonc scanner (MB/s per stage).")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma-separated corpus sizes (default: {DEFAULT_SIZES})")
+    parser.add_argument(
+        "--profiles",
+        default=",".join(PROFILES),
+        help=f"comma-separated corpus profiles, from: {', '.join(PROFILES)} (default: all)",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage; the fastest is reported (default: 3)")
+    parser.add_argument("--seed", type=int, default=0, help="corpus generator seed (default: 0)")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.profiles.split(",")) - PROFILES.keys()
+    if unknown:
+        parser.error(f"unknown profile(s): {', '.join(sorted(unknown))}")
+
+    return args
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+
+    print(f"{'size':>8}  {'profile':<14}  {'stage':<21}  {'MB/s':>9}")
+    for size_text in args.sizes.split(","):
+        size = parse_size(size_text)
+        for profile in args.profiles.split(","):
+            comment_density, string_density = PROFILES[profile]
+            text = generate_corpus(size, comment_density, string_density, seed=args.seed)
+            for stage, rate in bench(text, args.repeat).items():
+                print(f"{size_text:>8}  {profile:<14}  {stage:<21}  {rate:>9.2f}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
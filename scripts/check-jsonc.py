@@ -12,150 +12,350 @@ be excluded from it, leaving them with no syntax checking at all. This is the ch
 for those files: comments (and trailing commas) are allowed, everything else is still
 strict JSON.
 
-The file on disk is only ever read. Comments are ignored for the duration of a parse by
+Checking only ever reads the file. Comments are ignored for the duration of a parse by
 building a comment-free copy of the *text in memory*; the file keeps every comment it
 has. Comment spans are blanked rather than deleted so that reported line/column numbers
 still point at the right place in the original file.
 
+That in-memory copy costs several times the file's size, which is fine for editor
+configs and not for multi-gigabyte generated dumps. `--stream` validates those in
+constant memory instead: the file is mmap'd (or read in chunks), comments are blanked
+chunk by chunk with string/comment state carried across chunk boundaries, and the result
+is fed to an incremental validator that checks JSON syntax without ever building the
+parsed value.
+
+`--format` is the one opt-in exception: it re-indents files in place, built on the same
+tokenizer as `uncomment`, so comments and trailing commas survive untouched. Only the
+indentation of each line, trailing whitespace and runs of blank lines are normalised --
+line breaks stay where the author put them, so a reformat never produces a diff bigger
+than the indentation fix itself. Files whose bytes would not change are never written,
+and the rest are written atomically as one batch. `--format --check` reports what would
+change and exits non-zero without writing anything.
+
+On a big repo, `--changed-since REF` asks git once for the *.json/*.jsonc files changed
+since REF and checks only those, and `--staged` validates what is actually in the index
+by streaming blobs out of `git cat-file --batch` -- nothing is checked out, and partially
+staged files are judged on the staged half.
+
+The parsing itself lives in scripts/jsonc.py, an importable library; this script is the
+command line around it (plus the in-place formatter and the git modes).
+
 Usage (pre-commit passes the filenames):
 
     uv run scripts/check-jsonc.py .devcontainer/devcontainer.json
+
+    # Very large files: constant memory, same verdict
+    uv run scripts/check-jsonc.py --stream huge-dump.jsonc
+
+    # Normalise indentation in place / just report what would change
+    uv run scripts/check-jsonc.py --format .devcontainer/devcontainer.json
+    uv run scripts/check-jsonc.py --format --check .devcontainer/devcontainer.json
+
+    # Only what changed since main / only what is about to be committed
+    uv run scripts/check-jsonc.py --changed-since origin/main
+    uv run scripts/check-jsonc.py --staged
 """
 
 from __future__ import annotations
 
+import argparse
+import codecs
 import json
+import os
+import subprocess
 import sys
+import tempfile
+import threading
+from collections.abc import Iterable, Iterator
 from pathlib import Path
-from typing import Any
+from typing import IO
+
+# Re-exported so `check-jsonc.py` stays a drop-in for the tests and the benchmark.
+from jsonc import (  # noqa: F401
+    STREAM_CHUNK_SIZE,
+    JsoncError,
+    StreamUncommenter,
+    StreamValidator,
+    check_file,
+    drop_trailing_commas,
+    format_jsonc,
+    iter_errors,
+    iter_file_chunks,
+    tokenize,
+    uncomment,
+    validate_stream,
+)
+from jsonc import loads as loads_jsonc  # noqa: F401
+
+
+def write_atomically(contents: dict[Path, str]) -> None:
+    """Replace every file in `contents` with its new text, as one batch.
+
+    All new contents are written to temp files beside their targets first (same
+    filesystem, original permissions), and only once every one of them is safely on disk
+    are they renamed over the originals. A failure while staging -- disk full, a
+    read-only directory -- therefore leaves every file untouched, and a reader never
+    sees a half-written file.
+    """
+    staged: list[tuple[Path, Path]] = []
 
+    try:
+        for path, text in contents.items():
+            fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+            tmp = Path(tmp_name)
+            staged.append((tmp, path))
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as fh:
+                fh.write(text)
+            os.chmod(tmp, path.stat().st_mode & 0o7777)
+    except BaseException:
+        for tmp, _ in staged:
+            tmp.unlink(missing_ok=True)
+        raise
+
+    for tmp, path in staged:
+        os.replace(tmp, path)
+
+
+def format_files(paths: Iterable[Path], *, indent: int = 2, check: bool = False) -> int:
+    """Reformat `paths` in place (or, with `check`, only report). Returns an exit code.
+
+    Files that do not parse are reported and left alone; files whose bytes would not
+    change are never written. Exit code is non-zero if anything failed to parse, or, in
+    `check` mode, if anything would be reformatted.
+    """
+    failed = False
+    changed: dict[Path, str] = {}
+
+    for path in paths:
+        try:
+            original = path.read_bytes()
+            formatted = format_jsonc(original.decode("utf-8"), indent=indent)
+        except OSError as exc:
+            print(f"{path}: {exc.strerror or exc}", file=sys.stderr)
+            failed = True
+            continue
+        except (JsoncError, json.JSONDecodeError, UnicodeDecodeError) as exc:
+            print(f"{path}: {exc}", file=sys.stderr)
+            failed = True
+            continue
 
-class JsoncError(ValueError):
-    """A JSONC file that cannot be parsed even once comments are ignored."""
+        if formatted.encode("utf-8") != original:
+            changed[path] = formatted
 
+    for path in changed:
+        print(f"{'would reformat' if check else 'reformatted'} {path}", file=sys.stderr)
 
-def uncomment(text: str) -> str:
-    """Blank out JSONC comments, leaving a string strict json can parse.
+    if changed and not check:
+        try:
+            write_atomically(changed)
+        except OSError as exc:
+            print(f"error: nothing written: {exc}", file=sys.stderr)
+            return 1
 
-    Scans character by character so that comment markers *inside strings* are treated as
-    data. A regex would truncate `"https://example.com"` at the `//` and then report a
-    bogus syntax error on a perfectly valid file.
+    return 1 if failed or (check and changed) else 0
 
-    Comments become spaces (newlines preserved) so offsets, and therefore the line and
-    column in any error message, still match the original file.
-    """
-    out: list[str] = []
-    i = 0
-    n = len(text)
-
-    while i < n:
-        char = text[i]
-
-        if char == '"':
-            start = i
-            i += 1
-            while i < n:
-                if text[i] == "\\":  # escape: consume the escaped char too, so \" does
-                    i += 2           # not look like the end of the string
-                    continue
-                if text[i] == '"':
-                    i += 1
-                    break
-                i += 1
-            out.append(text[start:i])
-            continue
 
-        if char == "/" and i + 1 < n:
-            nxt = text[i + 1]
+# --------------------------------------------------------------------------------------
+# git-aware modes: only the files that changed, or the staged blobs themselves
+# --------------------------------------------------------------------------------------
 
-            if nxt == "/":
-                while i < n and text[i] != "\n":
-                    out.append(" ")
-                    i += 1
-                continue
+# Pathspecs for --changed-since/--staged. Plain pathspecs are relative to the current
+# directory, so from a subdirectory "*.json" would silently skip the rest of the tree;
+# `top` anchors these at the repository root, and `glob`'s "**/" also matches the root
+# itself.
+GIT_PATHSPECS = (":(top,glob)**/*.json", ":(top,glob)**/*.jsonc")
 
-            if nxt == "*":
-                end = text.find("*/", i + 2)
-                if end == -1:
-                    line = text.count("\n", 0, i) + 1
-                    raise JsoncError(f"unterminated block comment starting on line {line}")
-                for ch in text[i : end + 2]:
-                    out.append("\n" if ch == "\n" else " ")
-                i = end + 2
-                continue
 
-        out.append(char)
-        i += 1
+def _git(*args: str) -> bytes:
+    """Run git and return stdout. Raises CalledProcessError (stderr captured) or OSError."""
+    return subprocess.run(["git", *args], check=True, capture_output=True).stdout
+
 
-    return "".join(out)
+def _split_z(output: bytes) -> list[str]:
+    return [os.fsdecode(name) for name in output.split(b"\0") if name]
 
 
-def drop_trailing_commas(text: str) -> str:
-    """Blank commas that sit just before a closing brace/bracket.
+def git_changed_files(ref: str) -> list[Path]:
+    """JSON/JSONC files added, copied, modified or renamed since `ref`, working tree included.
 
-    VS Code's jsonc-parser tolerates trailing commas, so a file that is valid in the
-    editor must not fail this hook. Assumes comments are already gone; still string-aware
-    so a comma inside a string value is left alone.
+    One `git diff` lists every candidate, so unrelated files are never stat'd or read.
     """
-    chars = list(text)
-    i = 0
-    n = len(chars)
-
-    while i < n:
-        char = chars[i]
-
-        if char == '"':
-            i += 1
-            while i < n:
-                if chars[i] == "\\":
-                    i += 2
-                    continue
-                if chars[i] == '"':
-                    break
-                i += 1
-            i += 1
-            continue
+    top = Path(os.fsdecode(_git("rev-parse", "--show-toplevel").rstrip(b"\n")))
+    names = _split_z(_git("diff", "--name-only", "-z", "--diff-filter=ACMR", ref, "--", *GIT_PATHSPECS))
+    return [Path(os.path.relpath(top / name)) for name in names]
 
-        if char == ",":
-            j = i + 1
-            while j < n and chars[j].isspace():
-                j += 1
-            if j < n and chars[j] in "}]":
-                chars[i] = " "
 
-        i += 1
+def git_staged_files() -> list[str]:
+    """Repo-relative JSON/JSONC paths with staged additions or modifications."""
+    return _split_z(_git("diff", "--cached", "--name-only", "-z", "--diff-filter=ACMR", "--", *GIT_PATHSPECS))
 
-    return "".join(chars)
 
+class _BlobReader:
+    """The body of one `git cat-file --batch` record, as decoded text chunks.
 
-def loads_jsonc(text: str) -> Any:
-    """Parse JSONC text into Python objects. Strict JSON once comments are ignored."""
-    return json.loads(drop_trailing_commas(uncomment(text)))
+    Iterating stops at the end of this blob; `drain` skips whatever a failed validation
+    left unread, so the next header is read from the right place.
+    """
 
+    def __init__(self, stream: IO[bytes], size: int, chunk_size: int) -> None:
+        self._stream = stream
+        self._remaining = size
+        self._chunk_size = chunk_size
 
-def check_file(path: Path) -> str | None:
-    """Return an error message if `path` is not valid JSONC, else None. Never writes."""
-    try:
-        text = path.read_text(encoding="utf-8")
-    except OSError as exc:
-        return exc.strerror or str(exc)
+    def _read(self) -> bytes:
+        block = self._stream.read(min(self._chunk_size, self._remaining))
+        if not block:
+            raise EOFError("git cat-file output ended mid-blob")
+        self._remaining -= len(block)
+        return block
+
+    def __iter__(self) -> Iterator[str]:
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        while self._remaining:
+            yield decoder.decode(self._read())
+        yield decoder.decode(b"", final=True)
+
+    def drain(self) -> None:
+        while self._remaining:
+            self._read()
+        self._stream.read(1)  # the newline that terminates every record
+
+
+def check_staged(names: list[str], chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[tuple[str, str | None]]:
+    """Validate the *staged* content of `names` (repo-relative), yielding (name, error).
+
+    The index blobs are streamed out of a single `git cat-file --batch` process through
+    the same streaming scanner as `--stream`, so nothing is checked out or written and
+    memory stays constant however large a blob is.
+    """
+    if not names:
+        return
+
+    top = os.fsdecode(_git("rev-parse", "--show-toplevel").rstrip(b"\n"))
+    proc = subprocess.Popen(
+        ["git", "cat-file", "--batch"], cwd=top, stdin=subprocess.PIPE, stdout=subprocess.PIPE
+    )
+    assert proc.stdin is not None and proc.stdout is not None
+
+    def feed_names() -> None:
+        # Written from a thread: git answers as it reads, and a full stdout pipe would
+        # otherwise stall it while we are still blocked writing a long name list.
+        assert proc.stdin is not None
+        with proc.stdin:
+            for name in names:
+                proc.stdin.write(f":{name}\n".encode())
+
+    writer = threading.Thread(target=feed_names, daemon=True)
+    writer.start()
 
     try:
-        loads_jsonc(text)
-    except (JsoncError, json.JSONDecodeError, UnicodeDecodeError) as exc:
-        return str(exc)
+        for name in names:
+            header = proc.stdout.readline().split()
+            if len(header) != 3:  # "<object> missing" (e.g. a file staged for deletion)
+                yield name, "not in the index"
+                continue
 
-    return None
+            blob = _BlobReader(proc.stdout, int(header[2]), chunk_size)
+            try:
+                validate_stream(blob)
+                error = None
+            except (JsoncError, UnicodeDecodeError) as exc:
+                error = str(exc)
+            blob.drain()
+            yield name, error
+    finally:
+        writer.join()
+        proc.stdout.close()
+        proc.wait()
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Validate JSON-with-comments (JSONC) files. Read-only unless --format.",
+    )
+    parser.add_argument("files", nargs="*", type=Path, help="JSONC files to check")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="validate in constant memory (mmap + incremental scan) for very large files",
+    )
+    parser.add_argument(
+        "--format",
+        action="store_true",
+        help="normalise indentation in place, keeping comments and trailing commas",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="with --format: report files that would change and exit non-zero, write nothing",
+    )
+    parser.add_argument(
+        "--indent", type=int, default=2, help="spaces per nesting level for --format (default: 2)"
+    )
+    parser.add_argument(
+        "--changed-since",
+        metavar="REF",
+        help="also check every *.json/*.jsonc file git reports as changed since REF",
+    )
+    parser.add_argument(
+        "--staged",
+        action="store_true",
+        help="check the staged (index) content of changed *.json/*.jsonc files, not the working tree",
+    )
+    args = parser.parse_args(argv)
+
+    if args.check and not args.format:
+        parser.error("--check only applies to --format")
+    if args.stream and args.format:
+        parser.error("--stream cannot be combined with --format")
+    if args.staged and (args.files or args.format or args.changed_since):
+        parser.error("--staged takes no files and cannot be combined with --format or --changed-since")
+
+    return args
+
+
+# What the git modes raise: git could not be started, exited non-zero, or its
+# `cat-file --batch` output ended mid-blob (_BlobReader).
+GIT_ERRORS = (OSError, subprocess.CalledProcessError, EOFError)
+
+
+def describe_git_error(exc: BaseException) -> str:
+    """One line for a failure in GIT_ERRORS, for the `error:` message."""
+    if isinstance(exc, subprocess.CalledProcessError):
+        detail = os.fsdecode(exc.stderr or b"").strip()
+        return f"git failed: {detail or exc}"
+    if isinstance(exc, EOFError):
+        return f"git failed: {exc}"
+    return f"could not run git: {exc.strerror or exc}"
 
 
 def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    files: list[Path] = list(args.files)
     failed = False
 
-    for name in argv:
-        error = check_file(Path(name))
-        if error is not None:
-            print(f"{name}: {error}", file=sys.stderr)
-            failed = True
+    # Only the git calls are guarded: unreadable files are already reported per file by
+    # check_file and format_files, and anything else is a bug worth a traceback.
+    try:
+        if args.changed_since:
+            files.extend(git_changed_files(args.changed_since))
+
+        if args.staged:
+            for name, error in check_staged(git_staged_files()):
+                if error is not None:
+                    print(f"{name}: {error}", file=sys.stderr)
+                    failed = True
+            return 1 if failed else 0
+    except GIT_ERRORS as exc:
+        print(f"error: {describe_git_error(exc)}", file=sys.stderr)
+        return 1
+
+    if args.format:
+        return format_files(files, indent=args.indent, check=args.check)
+
+    for name, error in iter_errors(files, stream=args.stream):
+        print(f"{name}: {error}", file=sys.stderr)
+        failed = True
 
     return 1 if failed else 0
 
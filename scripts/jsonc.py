@@ -0,0 +1,713 @@
+"""
+JSON-with-comments (JSONC) parsing: the library behind scripts/check-jsonc.py.
+
+JSONC is strict JSON plus `//` and `/* */` comments and trailing commas -- what VS Code's
+jsonc-parser accepts, and what .devcontainer/devcontainer.json and cmux's config are
+written in. Unlike the hyphenated CLI, this module is importable by name: scripts/ is
+sys.path[0] whenever a script in it runs, and pytest adds it via `pythonpath`, so other
+tools can parse JSONC without spawning check-jsonc.py or copying its scanner.
+
+    import jsonc
+
+    settings = jsonc.load(".devcontainer/devcontainer.json")
+    for path, error in jsonc.iter_errors(paths):
+        print(f"{path}: {error}")
+    configs = jsonc.parse_many(paths)  # {path: parsed value}
+
+Comments are never deleted, only blanked to spaces (newlines kept) in an in-memory copy,
+so line/column numbers in every error still point into the original file. Nothing in
+this module writes to disk.
+
+The batch API (`iter_errors`, `parse_many`, `check_file`) shares one lazily created
+thread pool, so reads overlap, and one small cache of parse results keyed by path, mtime
+and size, so asking about an unchanged file twice in one process parses it once.
+"""
+
+from __future__ import annotations
+
+import codecs
+import copy
+import json
+import mmap
+import os
+import re
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, Any
+
+__all__ = [
+    "JsoncError",
+    "StreamUncommenter",
+    "StreamValidator",
+    "check_file",
+    "clear_cache",
+    "drop_trailing_commas",
+    "format_jsonc",
+    "iter_errors",
+    "iter_file_chunks",
+    "load",
+    "loads",
+    "parse_many",
+    "tokenize",
+    "uncomment",
+    "validate_stream",
+]
+
+# Streaming reads files this many bytes at a time; only one chunk (plus a few characters
+# of carried scanner state) is ever held in memory.
+STREAM_CHUNK_SIZE = 1 << 20
+
+# Token kinds yielded by tokenize().
+CODE = "code"
+STRING = "string"
+LINE_COMMENT = "line_comment"
+BLOCK_COMMENT = "block_comment"
+
+# One alternative per token kind, tried in order at each position. A string is its body
+# plus the closing quote -- `\\[\s\S]` consumes each escaped char, so \" does not end it --
+# or, unterminated, whatever is left. A `/` that opens no comment is code on its own.
+_TOKEN = re.compile(
+    r'(?P<string>"[^"\\]*(?:\\[\s\S][^"\\]*)*(?:"|\\)?)'
+    r"|(?P<line_comment>//[^\n]*)"
+    r"|(?P<block_comment>/\*[\s\S]*?\*/)"
+    r"|(?P<unterminated>/\*)"
+    r'|(?P<code>[^"/]+|/)'
+)
+# StreamUncommenter's jumps: runs of code, and runs inside a string.
+_CODE_RUN = re.compile(r'[^"/]+')
+_RAW_STRING_RUN = re.compile(r'[^"\\]+')
+_NOT_NEWLINE = re.compile(r"[^\n]")
+
+
+class JsoncError(ValueError):
+    """A JSONC file that cannot be parsed even once comments are ignored."""
+
+
+def tokenize(text: str) -> Iterator[tuple[str, int, int]]:
+    """Split JSONC text into `(kind, start, end)` spans: code, strings and comments.
+
+    Scans left to right so that comment markers *inside strings* are treated as data. A
+    regex that only looked for comments would truncate `"https://example.com"` at the
+    `//` and then report a bogus syntax error on a perfectly valid file.
+
+    Spans are contiguous and cover the whole text. A line comment stops before its
+    newline; an unterminated string runs to the end of the text (strict json reports it
+    later); an unterminated block comment raises JsoncError.
+    """
+    for match in _TOKEN.finditer(text):
+        kind = match.lastgroup
+        if kind == "unterminated":
+            _raise_unterminated(text, match.start())
+        yield kind, match.start(), match.end()
+
+
+def _raise_unterminated(text: str, start: int) -> None:
+    line = text.count("\n", 0, start) + 1
+    raise JsoncError(f"unterminated block comment starting on line {line}")
+
+
+def uncomment(text: str) -> str:
+    """Blank out JSONC comments, leaving a string strict json can parse.
+
+    Comments become spaces (newlines preserved) so offsets, and therefore the line and
+    column in any error message, still match the original file.
+    """
+    out: list[str] = []
+
+    # Same tokens as tokenize(), without the generator: this is the hot loop.
+    for match in _TOKEN.finditer(text):
+        kind = match.lastgroup
+        if kind == LINE_COMMENT:
+            out.append(" " * (match.end() - match.start()))
+        elif kind == BLOCK_COMMENT:
+            out.append(_NOT_NEWLINE.sub(" ", match.group()))
+        elif kind == "unterminated":
+            _raise_unterminated(text, match.start())
+        else:
+            out.append(match.group())
+
+    return "".join(out)
+
+
+def drop_trailing_commas(text: str) -> str:
+    """Blank commas that sit just before a closing brace/bracket.
+
+    VS Code's jsonc-parser tolerates trailing commas, so a file that is valid in the
+    editor must not fail this hook. Assumes comments are already gone; still string-aware
+    so a comma inside a string value is left alone.
+    """
+    chars = list(text)
+    i = 0
+    n = len(chars)
+
+    while i < n:
+        char = chars[i]
+
+        if char == '"':
+            i += 1
+            while i < n:
+                if chars[i] == "\\":
+                    i += 2
+                    continue
+                if chars[i] == '"':
+                    break
+                i += 1
+            i += 1
+            continue
+
+        if char == ",":
+            j = i + 1
+            while j < n and chars[j].isspace():
+                j += 1
+            if j < n and chars[j] in "}]":
+                chars[i] = " "
+
+        i += 1
+
+    return "".join(chars)
+
+
+def loads(text: str) -> Any:
+    """Parse JSONC text into Python objects. Strict JSON once comments are ignored.
+
+    Raises JsoncError (unterminated block comment) or json.JSONDecodeError; both are
+    ValueErrors, and line/column numbers point into the original text.
+    """
+    return json.loads(drop_trailing_commas(uncomment(text)))
+
+
+def load(source: str | os.PathLike[str] | IO[str]) -> Any:
+    """Parse a JSONC file, given as a path or an open text file, like `json.load`."""
+    if isinstance(source, (str, os.PathLike)):
+        return loads(Path(source).read_text(encoding="utf-8"))
+    return loads(source.read())
+
+
+# --------------------------------------------------------------------------------------
+# Streaming: the same verdict as loads, in constant memory
+# --------------------------------------------------------------------------------------
+
+class StreamUncommenter:
+    """Incremental `uncomment`: feed text in arbitrary chunks, get blanked text back.
+
+    String and comment state is carried across chunk boundaries, so a `//` split over
+    two chunks, or an escape that ends one chunk, behaves exactly as it would in a single
+    `uncomment` call: joining every `feed` result and the `close` result gives
+    `uncomment(whole_text)`, character for character. A `/` that ends a chunk cannot be
+    classified until the next one arrives, so output may lag input by that one character.
+    """
+
+    _CODE, _STRING, _ESCAPE, _LINE, _BLOCK, _BLOCK_STAR = range(6)
+
+    def __init__(self) -> None:
+        self._state = self._CODE
+        self._pending_slash = False
+        self._lines = 0  # newlines counted so far, for the unterminated-comment message
+        self._block_line = 0
+
+    def feed(self, chunk: str) -> str:
+        out: list[str] = []
+        i = 0
+        n = len(chunk)
+        counted = 0  # chunk[:counted] is already included in self._lines
+        state = self._state
+
+        while i < n:
+            if state == self._CODE:
+                if self._pending_slash:
+                    self._pending_slash = False
+                    nxt = chunk[i]
+                    if nxt == "/" or nxt == "*":
+                        out.append("  ")
+                        i += 1
+                        if nxt == "/":
+                            state = self._LINE
+                        else:
+                            state = self._BLOCK
+                            # Count only since the last count: recounting from the
+                            # chunk start at every comment would be quadratic.
+                            self._lines += chunk.count("\n", counted, i)
+                            counted = i
+                            self._block_line = self._lines + 1
+                        continue
+                    out.append("/")
+
+                match = _CODE_RUN.match(chunk, i)
+                if match:
+                    out.append(match.group())
+                    i = match.end()
+                    continue
+
+                if chunk[i] == '"':
+                    out.append('"')
+                    state = self._STRING
+                else:  # "/": comment or not depends on the next character
+                    self._pending_slash = True
+                i += 1
+
+            elif state == self._STRING:
+                match = _RAW_STRING_RUN.match(chunk, i)
+                if match:
+                    out.append(match.group())
+                    i = match.end()
+                    continue
+                out.append(chunk[i])
+                state = self._CODE if chunk[i] == '"' else self._ESCAPE
+                i += 1
+
+            elif state == self._ESCAPE:
+                out.append(chunk[i])
+                state = self._STRING
+                i += 1
+
+            elif state == self._LINE:
+                end = chunk.find("\n", i)
+                if end == -1:
+                    end = n
+                else:
+                    state = self._CODE  # the newline itself is code, not comment
+                out.append(" " * (end - i))
+                i = end
+
+            elif state == self._BLOCK:
+                end = chunk.find("*", i)
+                if end == -1:
+                    out.append(_NOT_NEWLINE.sub(" ", chunk[i:]))
+                    i = n
+                else:
+                    out.append(_NOT_NEWLINE.sub(" ", chunk[i : end + 1]))
+                    state = self._BLOCK_STAR
+                    i = end + 1
+
+            else:  # _BLOCK_STAR: the previous character closed a "*"
+                char = chunk[i]
+                out.append("\n" if char == "\n" else " ")
+                if char == "/":
+                    state = self._CODE
+                elif char != "*":
+                    state = self._BLOCK
+                i += 1
+
+        self._state = state
+        self._lines += chunk.count("\n", counted)
+        return "".join(out)
+
+    def close(self) -> str:
+        """Flush held-back state. Raises JsoncError on an unterminated block comment."""
+        if self._state in (self._BLOCK, self._BLOCK_STAR):
+            raise JsoncError(f"unterminated block comment starting on line {self._block_line}")
+        if self._pending_slash:
+            self._pending_slash = False
+            return "/"
+        return ""
+
+
+_WHITESPACE_RUN = re.compile(r"[ \t\n\r]+")
+_STRING_RUN = re.compile(r'[^"\\\x00-\x1f]+')
+_ATOM_RUN = re.compile(r"[-+.0-9A-Za-z]+")
+_NUMBER = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?")
+# json.loads accepts these non-standard constants too, so the stream must as well.
+_CONSTANTS = frozenset({"true", "false", "null", "NaN", "Infinity", "-Infinity"})
+_HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+_ESCAPES = frozenset('"\\/bfnrtu')
+
+
+class StreamValidator:
+    """Incremental JSON syntax check over comment-free text, in constant memory.
+
+    Accepts exactly what `json.loads(drop_trailing_commas(text))` accepts, but only
+    tracks lexer state, the open-container stack and the current number/literal -- it
+    never builds the parsed value. Error messages follow `json.JSONDecodeError`'s
+    "msg: line L column C (char P)" shape so both modes report positions the same way.
+
+    Trailing commas are handled the way `drop_trailing_commas` handles them: a comma is
+    held back until the next significant character, and dropped if that is a `}` or `]`.
+    """
+
+    _CODE, _STRING, _ESCAPE = range(3)
+
+    # Grammar states: what the next significant token may be.
+    _VALUE, _VALUE_OR_CLOSE, _KEY, _KEY_OR_CLOSE, _COLON, _COMMA_OR_CLOSE, _DONE = range(7)
+
+    _EXPECTING = {
+        _VALUE: "Expecting value",
+        _VALUE_OR_CLOSE: "Expecting value",
+        _KEY: "Expecting property name enclosed in double quotes",
+        _KEY_OR_CLOSE: "Expecting property name enclosed in double quotes",
+        _COLON: "Expecting ':' delimiter",
+        _COMMA_OR_CLOSE: "Expecting ',' delimiter",
+        _DONE: "Extra data",
+    }
+
+    def __init__(self) -> None:
+        self._lex = self._CODE
+        self._unicode_digits = 0  # hex digits still owed by a \uXXXX escape
+        self._expect = self._VALUE
+        self._stack: list[str] = []
+        self._atom: list[str] | None = None
+        self._atom_where: tuple[int, int, int] = (1, 1, 0)
+        self._string_where: tuple[int, int, int] = (1, 1, 0)
+        self._comma_where: tuple[int, int, int] | None = None
+        # Position bookkeeping: newlines only ever appear in whitespace runs (a raw one
+        # in a string is an error), so counting them there keeps line/column exact.
+        self._base = 0  # absolute offset of the current chunk
+        self._line = 1
+        self._last_newline = -1  # absolute offset of the most recent newline
+
+    def _where(self, i: int) -> tuple[int, int, int]:
+        pos = self._base + i
+        return self._line, pos - self._last_newline, pos
+
+    @staticmethod
+    def _error(msg: str, where: tuple[int, int, int]) -> JsoncError:
+        line, column, pos = where
+        return JsoncError(f"{msg}: line {line} column {column} (char {pos})")
+
+    def _after_value(self) -> None:
+        if not self._stack:
+            self._expect = self._DONE
+        else:
+            self._expect = self._COMMA_OR_CLOSE
+
+    def _token(self, char: str, where: tuple[int, int, int]) -> None:
+        """Advance the grammar by one significant character ('"' and 'a' = string/atom)."""
+        expect = self._expect
+
+        if char == "," and expect == self._COMMA_OR_CLOSE:
+            self._expect = self._KEY if self._stack[-1] == "{" else self._VALUE
+        elif char == ":" and expect == self._COLON:
+            self._expect = self._VALUE
+        elif char == '"' and expect in (self._KEY, self._KEY_OR_CLOSE):
+            self._expect = self._COLON
+        elif char in "}]" and (
+            expect == self._COMMA_OR_CLOSE
+            or (expect == self._KEY_OR_CLOSE and char == "}")
+            or (expect == self._VALUE_OR_CLOSE and char == "]")
+        ) and self._stack[-1] == ("{" if char == "}" else "["):
+            self._stack.pop()
+            self._after_value()
+        elif expect in (self._VALUE, self._VALUE_OR_CLOSE) and char in '{["a':
+            if char == "{":
+                self._stack.append("{")
+                self._expect = self._KEY_OR_CLOSE
+            elif char == "[":
+                self._stack.append("[")
+                self._expect = self._VALUE_OR_CLOSE
+            else:
+                self._after_value()
+        else:
+            raise self._error(self._EXPECTING[expect], where)
+
+    def _significant(self, char: str, where: tuple[int, int, int]) -> None:
+        if self._comma_where is not None:
+            comma_where, self._comma_where = self._comma_where, None
+            if char not in "}]":  # not a trailing comma after all: it counts
+                self._token(",", comma_where)
+        if char == ",":
+            self._comma_where = where
+        else:
+            self._token(char, where)
+
+    def _finish_atom(self) -> None:
+        assert self._atom is not None
+        atom = "".join(self._atom)
+        self._atom = None
+        if atom not in _CONSTANTS and not _NUMBER.fullmatch(atom):
+            raise self._error("Expecting value", self._atom_where)
+
+    def feed(self, chunk: str) -> None:
+        i = 0
+        n = len(chunk)
+
+        while i < n:
+            if self._lex == self._STRING:
+                match = _STRING_RUN.match(chunk, i)
+                if match:
+                    i = match.end()
+                    continue
+                char = chunk[i]
+                if char == '"':
+                    self._lex = self._CODE
+                elif char == "\\":
+                    self._lex = self._ESCAPE
+                else:
+                    raise self._error("Invalid control character at", self._where(i))
+                i += 1
+
+            elif self._lex == self._ESCAPE:
+                char = chunk[i]
+                if self._unicode_digits:
+                    if char not in _HEX_DIGITS:
+                        raise self._error("Invalid \\uXXXX escape", self._where(i))
+                    self._unicode_digits -= 1
+                    if not self._unicode_digits:
+                        self._lex = self._STRING
+                elif char not in _ESCAPES:
+                    raise self._error("Invalid \\escape", self._where(i))
+                elif char == "u":
+                    self._unicode_digits = 4
+                else:
+                    self._lex = self._STRING
+                i += 1
+
+            else:
+                match = _ATOM_RUN.match(chunk, i)
+                if match:
+                    if self._atom is None:
+                        self._atom_where = self._where(i)
+                        self._significant("a", self._atom_where)
+                        self._atom = []
+                    self._atom.append(match.group())
+                    i = match.end()
+                    if i < n:  # delimited here; otherwise it may continue next chunk
+                        self._finish_atom()
+                    continue
+                if self._atom is not None:
+                    self._finish_atom()
+
+                match = _WHITESPACE_RUN.match(chunk, i)
+                if match:
+                    newlines = match.group().count("\n")
+                    if newlines:
+                        self._line += newlines
+                        self._last_newline = self._base + match.start() + match.group().rfind("\n")
+                    i = match.end()
+                    continue
+
+                char = chunk[i]
+                if char == '"':
+                    self._string_where = self._where(i)
+                    self._significant('"', self._string_where)
+                    self._lex = self._STRING
+                elif char in "{}[]:,":
+                    self._significant(char, self._where(i))
+                else:
+                    raise self._error(self._EXPECTING[self._expect], self._where(i))
+                i += 1
+
+        self._base += n
+
+    def close(self) -> None:
+        """Raise JsoncError unless everything fed so far is one complete JSON value."""
+        if self._lex != self._CODE:
+            raise self._error("Unterminated string starting at", self._string_where)
+        if self._atom is not None:
+            self._finish_atom()
+        if self._comma_where is not None:
+            comma_where, self._comma_where = self._comma_where, None
+            self._token(",", comma_where)
+        if self._expect != self._DONE:
+            raise self._error(self._EXPECTING[self._expect], self._where(0))
+
+
+def validate_stream(chunks: Iterable[str]) -> None:
+    """Raise JsoncError unless the concatenated `chunks` are valid JSONC."""
+    uncommenter = StreamUncommenter()
+    validator = StreamValidator()
+    for chunk in chunks:
+        validator.feed(uncommenter.feed(chunk))
+    validator.feed(uncommenter.close())
+    validator.close()
+
+
+def iter_file_chunks(path: Path, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[str]:
+    """Yield `path`'s text `chunk_size` bytes at a time, decoding UTF-8 incrementally.
+
+    Regular files are mmap'd so the OS pages them in and out as needed; anything that
+    cannot be mapped (an empty file, a pipe) falls back to plain chunked reads.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+
+    with path.open("rb") as fh:
+        try:
+            mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            mapped = None
+
+        if mapped is not None:
+            with mapped:
+                for start in range(0, len(mapped), chunk_size):
+                    yield decoder.decode(mapped[start : start + chunk_size])
+        else:
+            while block := fh.read(chunk_size):
+                yield decoder.decode(block)
+
+    yield decoder.decode(b"", final=True)
+
+
+# --------------------------------------------------------------------------------------
+# Formatting: re-indent in place, keeping every comment and trailing comma
+# --------------------------------------------------------------------------------------
+
+_BRACKET_OR_NEWLINE = re.compile(r"[{}\[\]\n]")
+_LEADING_CLOSERS = re.compile(r"[}\]\s]*")
+
+
+def format_jsonc(text: str, indent: int = 2) -> str:
+    """Return `text` re-indented by bracket depth, comments and line breaks preserved.
+
+    Raises JsoncError/json.JSONDecodeError if `text` is not valid JSONC -- a file that
+    does not parse is reported, never guessed at.
+
+    Each line is re-indented to `indent` spaces per open `{`/`[` at its start, one level
+    less per closing bracket it starts with. Trailing whitespace is stripped, runs of
+    blank lines collapse to one and the result ends with exactly one newline (CRLF files
+    stay CRLF). Continuation lines of a block comment are left exactly as written.
+    Strings cannot span lines in valid JSON, so no string value can change.
+    """
+    loads(text)
+
+    newline = "\r\n" if "\r\n" in text else "\n"
+    # Per source line: (bracket depth at its start, starts inside a block comment?).
+    line_info: list[tuple[int, bool]] = [(0, False)]
+    depth = 0
+
+    for kind, start, end in tokenize(text):
+        if kind == CODE:
+            for match in _BRACKET_OR_NEWLINE.finditer(text, start, end):
+                char = match.group()
+                if char == "\n":
+                    line_info.append((depth, False))
+                elif char in "{[":
+                    depth += 1
+                else:
+                    depth -= 1
+        elif kind == BLOCK_COMMENT:
+            line_info.extend((depth, True) for _ in range(text.count("\n", start, end)))
+
+    out: list[str] = []
+    for line, (line_depth, in_comment) in zip(text.split("\n"), line_info, strict=True):
+        if in_comment:
+            out.append(line.rstrip())
+            continue
+
+        stripped = line.strip()
+        if not stripped:
+            if out and out[-1]:
+                out.append("")
+            continue
+
+        closers = _LEADING_CLOSERS.match(stripped).group()
+        level = line_depth - closers.count("}") - closers.count("]")
+        out.append(" " * (indent * level) + stripped)
+
+    while out and not out[-1]:
+        out.pop()
+
+    return newline.join(out) + newline
+
+
+# --------------------------------------------------------------------------------------
+# Batch API: one shared pool, one shared cache
+# --------------------------------------------------------------------------------------
+
+# Parse results kept per process. Editor configs are small; this bounds the worst case.
+CACHE_SIZE = 256
+
+# (resolved path, st_mtime_ns, st_size) -> (parsed value, None) or (None, error message).
+# Keyed on mtime and size so an edited file is re-parsed, never served stale.
+_cache: OrderedDict[tuple[str, int, int], tuple[Any, str | None]] = OrderedDict()
+_cache_lock = threading.Lock()
+
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _shared_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1), thread_name_prefix="jsonc")
+        return _pool
+
+
+def clear_cache() -> None:
+    """Forget every cached parse result."""
+    with _cache_lock:
+        _cache.clear()
+
+
+def _parse_cached(path: Path) -> tuple[Any, str | None]:
+    """(value, None) if `path` parses, else (None, error message). Uses the shared cache.
+
+    The value is the cached object itself: anything handing it to a caller must copy it
+    first (see parse_many), or one caller's mutation would leak into the next.
+    """
+    try:
+        stat = path.stat()
+    except OSError as exc:
+        return None, exc.strerror or str(exc)
+
+    key = (str(path.resolve()), stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+            return hit
+
+    try:
+        result: tuple[Any, str | None] = (loads(path.read_text(encoding="utf-8")), None)
+    except OSError as exc:
+        return None, exc.strerror or str(exc)  # not cached: may be transient
+    except (JsoncError, json.JSONDecodeError, UnicodeDecodeError) as exc:
+        result = (None, str(exc))
+
+    with _cache_lock:
+        _cache[key] = result
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    return result
+
+
+def check_file(path: Path, *, stream: bool = False) -> str | None:
+    """Return an error message if `path` is not valid JSONC, else None. Never writes.
+
+    With `stream=True` the file is validated chunk by chunk in constant memory instead of
+    being read and parsed whole; the verdict is the same, only the messages may differ.
+    """
+    if not stream:
+        return _parse_cached(path)[1]
+
+    try:
+        validate_stream(iter_file_chunks(path))
+    except OSError as exc:
+        return exc.strerror or str(exc)
+    except (JsoncError, UnicodeDecodeError) as exc:
+        return str(exc)
+
+    return None
+
+
+def iter_errors(paths: Iterable[str | os.PathLike[str]], *, stream: bool = False) -> Iterator[tuple[Path, str]]:
+    """Yield `(path, error message)` for every path that is not valid JSONC, in input order.
+
+    Files are checked concurrently on the shared pool; valid files yield nothing. With
+    `stream=True` each file is validated in constant memory (and not cached).
+    """
+    pool = _shared_pool()
+    futures = [(path, pool.submit(check_file, path, stream=stream)) for path in map(Path, paths)]
+    for path, future in futures:
+        error = future.result()
+        if error is not None:
+            yield path, error
+
+
+def parse_many(paths: Iterable[str | os.PathLike[str]]) -> dict[Path, Any]:
+    """Parse every path concurrently on the shared pool: `{path: parsed value}`.
+
+    Raises JsoncError naming the first path (in input order) that fails; use
+    `iter_errors` to collect every failure instead.
+    """
+    pool = _shared_pool()
+    futures = [(path, pool.submit(_parse_cached, path)) for path in map(Path, paths)]
+    parsed: dict[Path, Any] = {}
+    for path, future in futures:
+        value, error = future.result()
+        if error is not None:
+            raise JsoncError(f"{path}: {error}")
+        parsed[path] = copy.deepcopy(value)
+    return parsed
@@ -0,0 +1,1108 @@
+"""
+Tests for ``home/private_dot_bin/executable_bboxes.py``, run against its mock Gemini.
+
+The script calls a paid API, so these never touch the network: ``GEMINI_MOCK`` makes
+every model come from ``MockGeminiModel``, which answers after a simulated latency
+(zero here) and fails a configurable fraction of requests. Everything around the model
+-- retries, parsing, the cache key, the batch engine, drawing -- is the real code.
+
+Like the script itself, the module needs google-generativeai, Pillow, pydantic-settings
+and tenacity; the tests are skipped where those are not installed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+pytest.importorskip("PIL")
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("tenacity")
+
+REPO_ROOT = Path(__file__).parent
+SCRIPT = REPO_ROOT / "home" / "private_dot_bin" / "executable_bboxes.py"
+BENCH_SCRIPT = REPO_ROOT / "scripts" / "bench-bboxes.py"
+
+
+@pytest.fixture(scope="module")
+def bb() -> Iterator[ModuleType]:
+    with pytest.MonkeyPatch.context() as mp:
+        # Settings and the retry policy are read at import
+        mp.setenv("GEMINI_API_KEY", "mock")
+        mp.setenv("GEMINI_MOCK", "true")
+        mp.setenv("MOCK_LATENCY_MS", "0")
+        mp.setenv("MOCK_JITTER_MS", "0")
+        mp.setenv("GEMINI_MIN_WAIT", "0")
+        mp.setenv("GEMINI_MAX_WAIT", "0")
+        spec = importlib.util.spec_from_file_location("bboxes", SCRIPT)
+        assert spec is not None and spec.loader is not None
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["bboxes"] = module
+        spec.loader.exec_module(module)
+        yield module
+
+
+@pytest.fixture
+def images(tmp_path: Path) -> Path:
+    from PIL import Image, ImageDraw
+
+    directory = tmp_path / "in"
+    directory.mkdir()
+    for i in range(6):
+        image = Image.new("RGB", (300, 400), "white")
+        ImageDraw.Draw(image).rectangle((20, 40 + i * 10, 280, 300), fill="navy")
+        image.save(directory / f"img{i}.png")
+    (directory / "notes.txt").write_text("not an image", encoding="utf-8")
+    return directory
+
+
+def test_directory_run_uses_the_mock(bb: ModuleType, images: Path, tmp_path: Path) -> None:
+    out = tmp_path / "out"
+
+    assert bb.process_path(str(images), str(out), use_cache=False, concurrency=3) == 0
+
+    assert sorted(path.name for path in out.glob("*.png")) == [f"img{i}_bbox.png" for i in range(6)]
+
+
+def test_random_boxes_are_valid_and_stable_per_image(bb: ModuleType, images: Path) -> None:
+    loaded = bb.load_image(str(images / "img0.png"))
+    ctx = bb.RunContext(models=bb.ModelPool(mock=True))
+
+    boxes = bb.detect_boxes(loaded, "general", 0.0, ctx)
+
+    assert 1 <= len(boxes) <= 4
+    for box in boxes:
+        assert box["label"]
+        assert 0 <= box["xmin"] < box["xmax"] <= 1000
+        assert 0 <= box["ymin"] < box["ymax"] <= 1000
+    assert bb.detect_boxes(loaded, "general", 0.0, ctx) == boxes
+
+
+def test_canned_response(bb: ModuleType, images: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    canned = {"xmin": 100, "ymin": 200, "xmax": 900, "ymax": 800}
+    monkeypatch.setattr(bb.settings, "MOCK_BOXES", json.dumps(canned))
+    loaded = bb.load_image(str(images / "img1.png"))
+
+    assert bb.detect_boxes(loaded, "tweet", 0.0, bb.RunContext(models=bb.ModelPool(mock=True))) == [canned]
+
+
+def test_failures_are_retried(bb: ModuleType, images: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(bb.settings, "MOCK_ERROR_RATE", 0.3)
+    monkeypatch.setattr(bb.settings, "MOCK_THROTTLE_RATE", 0.2)
+    monkeypatch.setattr(bb.settings, "MOCK_SEED", 0)
+    ctx = bb.RunContext(models=bb.ModelPool(mock=True), limiter=bb.RateLimiter.from_settings(4))
+    jobs = [(str(path), str(tmp_path / path.name)) for path in sorted(images.glob("*.png"))]
+
+    done, failed, _ = asyncio.run(bb.process_batch(jobs, 4, ctx=ctx))
+
+    stats = ctx.models.mock_stats
+    assert done + failed == len(jobs)
+    assert stats.calls == len(jobs) + stats.errors + stats.throttled - failed
+    assert stats.errors + stats.throttled > 0
+    assert ctx.limiter.throttled == stats.throttled
+
+
+def test_batch_keeps_at_most_concurrency_images_in_flight(
+    bb: ModuleType, images: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    lock = threading.Lock()
+    in_flight = [0]
+    peak = [0]
+
+    def request_boxes(*args: object) -> list[dict[str, float]]:
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.02)
+        with lock:
+            in_flight[0] -= 1
+        return [{"xmin": 100, "ymin": 100, "xmax": 900, "ymax": 900}]
+
+    monkeypatch.setattr(bb, "request_boxes", request_boxes)
+    (images / "broken.png").write_bytes(b"not a png")
+    jobs = [(str(path), str(tmp_path / path.name)) for path in sorted(images.glob("*.png"))]
+
+    done, failed, skipped = asyncio.run(bb.process_batch(jobs, 2, ctx=bb.RunContext(models=bb.ModelPool(mock=True))))
+
+    assert (done, failed, skipped) == (6, 0, 1)
+    assert peak[0] == 2
+
+
+@pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork",
+    reason="spawned render workers re-import the script by path, which only works when it runs as __main__",
+)
+def test_render_workers_save_the_outputs(bb: ModuleType, images: Path, tmp_path: Path) -> None:
+    out = tmp_path / "out"
+    out.mkdir()
+    jobs = [(str(path), str(out / path.name)) for path in sorted(images.glob("*.png"))]
+    jobs.append((str(images / "img0.png"), str(tmp_path / "missing" / "img0.png")))
+    results: list = []
+
+    done, failed, _ = asyncio.run(
+        bb.process_batch(
+            jobs, 3, 2, on_result=results.append, ctx=bb.RunContext(models=bb.ModelPool(mock=True)), autocrop=True
+        )
+    )
+
+    assert (done, failed) == (6, 1)
+    assert sorted(path.name for path in out.iterdir()) == [f"img{i}.png" for i in range(6)]
+    assert [result.status for result in results].count("failed") == 1
+    assert all(result.elapsed is not None and result.elapsed >= 0 for result in results)
+    # The workers are sent the file's bytes, not the pixels, and decode them again
+    assert all("redecode" in result.stages for result in results if result.status == "done")
+
+
+def test_results_sidecar(bb: ModuleType, images: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(bb.settings, "MOCK_ERROR_RATE", 0.3)
+    monkeypatch.setattr(bb.settings, "MOCK_SEED", 1)
+    results = tmp_path / "results.jsonl"
+
+    bb.process_path(str(images), str(tmp_path / "out"), mode="general", use_cache=False, dedup_distance=None,
+                    render_workers=0, results_path=str(results))
+
+    records = [json.loads(line) for line in results.read_text(encoding="utf-8").splitlines()]
+    assert sorted(Path(record["path"]).name for record in records) == [f"img{i}.png" for i in range(6)]
+    done = [record for record in records if record["status"] == "done"]
+    assert done
+    for record in done:
+        assert (record["width"], record["height"]) == (300, 400)
+        assert record["elapsed_ms"] >= 0
+        assert record["requests"] == 1
+        assert "redecode" not in record["stages_ms"]  # rendered in-process
+        assert len(record["regions"]) == len(record["boxes"])
+        for region, box in zip(record["regions"], record["boxes"]):
+            assert region["label"] == box["label"]
+            assert region["box"][0] == int(box["xmin"] / 1000 * 300)
+            padded = region["padded"]
+            assert padded[0] <= region["box"][0] and padded[3] >= region["box"][3]
+            assert Path(region["output"]).exists()
+    assert sum(record["retries"] for record in records) > 0
+
+
+def test_replay_renders_stored_boxes_without_requests(
+    bb: ModuleType, images: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    results = tmp_path / "results.jsonl"
+    cache = bb.DetectionCache(tmp_path / "cache", ttl=3600, max_bytes=10**6)
+    monkeypatch.setattr(bb.DetectionCache, "from_settings", classmethod(lambda cls: cache))
+    assert bb.process_path(str(images), str(tmp_path / "first"), render_workers=0, dedup_distance=None,
+                           results_path=str(results)) == 0
+    (images / "new.png").write_bytes((images / "img0.png").read_bytes() + b"changed")
+    monkeypatch.setattr(bb.settings, "MOCK_ERROR_RATE", 1.0)  # any request would now fail
+
+    for replay_results, out in ((str(results), tmp_path / "from_results"), (None, tmp_path / "from_cache")):
+        assert bb.process_path(str(images), str(out), mode="tweet", autocrop=True, render_workers=0, detector="replay",
+                               replay_results=replay_results, dedup_distance=None) == 1  # new.png has no boxes
+
+        assert sorted(path.name for path in out.glob("*.png")) == [f"img{i}_cropped.png" for i in range(6)]
+
+
+def test_stage_timings_and_run_summary(bb: ModuleType, images: Path, tmp_path: Path) -> None:
+    ctx = bb.RunContext(models=bb.ModelPool(mock=True))
+    jobs = [(str(path), str(tmp_path / path.name)) for path in sorted(images.glob("*.png"))]
+    results: list = []
+
+    asyncio.run(bb.process_batch(jobs, 3, on_result=results.append, ctx=ctx, autocrop=True, resize=True))
+
+    for result in results:
+        assert {"read", "decode", "encode", "request", "parse", "crop", "resize", "save"} <= set(result.stages)
+        assert sum(result.stages.values()) <= result.elapsed
+    summary = ctx.metrics.summary()
+    assert summary[0].split()[:2] == ["Stage", "(ms)"]
+    assert any(line.startswith("request ") for line in summary)
+    assert f"Gemini requests: {len(jobs)}, retries: 0 (on 0 images)" in summary
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in summary if " | " in line) == len(jobs)
+
+
+def test_profile_processes_one_image(bb: ModuleType, images: Path, tmp_path: Path) -> None:
+    import pstats
+
+    (images / "broken.png").write_bytes(b"not a png")  # sorts first, and is passed over
+    out = tmp_path / "out"
+    profile = tmp_path / "bboxes.pstats"
+
+    assert bb.process_path(str(images), str(out), use_cache=False, profile_path=str(profile)) == 0
+
+    assert [path.name for path in out.glob("*.png")] == ["img0_bbox.png"]
+    stats = pstats.Stats(str(profile))
+    assert any(function == "request_boxes" for _, _, function in stats.stats)  # type: ignore[attr-defined]
+
+
+def test_tile_layout_covers_tall_images(bb: ModuleType) -> None:
+    tiles = bb.tile_layout((1080, 20000), 1.5, 0.25)
+
+    assert tiles[0] == (0, 0, 1080, 1620) and tiles[-1][3] == 20000
+    assert all(bottom - top == 1620 for _, top, _, bottom in tiles)
+    assert all(previous[3] - tile[1] >= 405 for previous, tile in zip(tiles, tiles[1:]))
+    assert bb.tile_layout((1080, 1620), 1.5, 0.25) == []
+    assert bb.tile_layout((1080, 20000), 0, 0.25) == []
+
+
+def test_merge_tile_boxes(bb: ModuleType) -> None:
+    def box(label: str, ymin: float, ymax: float) -> dict:
+        return {"label": label, "xmin": 100, "ymin": ymin, "xmax": 500, "ymax": ymax}
+
+    merged = bb.merge_tile_boxes(
+        [
+            (box("card", 140, 200), True),  # cut off by the bottom of the first tile
+            (box("card", 100, 260), False),  # the whole card, from the next tile
+            (box("card", 102, 258), False),  # found again in the overlap
+            (box("photo", 100, 260), False),
+            (box("card", 600, 700), False),
+        ],
+        0.5,
+    )
+
+    assert merged == [box("card", 100, 260), box("photo", 100, 260), box("card", 600, 700)]
+
+
+def test_tiled_detection_maps_tile_boxes_to_the_image(
+    bb: ModuleType, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    from PIL import Image
+
+    monkeypatch.setattr(bb.settings, "MOCK_BOXES", json.dumps([{"label": "card", "xmin": 100, "ymin": 100, "xmax": 900, "ymax": 300}]))
+    path = tmp_path / "scroll.png"
+    Image.new("RGB", (300, 2000), "white").save(path)
+    loaded = bb.load_image(str(path))
+    ctx = bb.RunContext(models=bb.ModelPool(mock=True), tile_aspect=1.5, tile_overlap=0.25)
+
+    with bb.collecting_stats() as stats:
+        boxes = bb.detect_boxes(loaded, "general", 0.0, ctx)
+
+    tiles = bb.tile_layout((300, 2000), 1.5, 0.25)
+    assert stats.requests == len(tiles) == 6
+    assert [round(box["ymin"] * 2) for box in boxes] == [round(top + 45) for _, top, _, _ in tiles]
+    assert all((box["xmin"], box["xmax"]) == (100, 900) for box in boxes)
+    monkeypatch.setattr(bb.settings, "MOCK_BOXES", "random")
+    with bb.collecting_stats() as stats:
+        bb.detect_boxes(loaded, "tweet", 0.0, ctx)
+    assert stats.requests == 1  # tweet mode is never tiled
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 2])
+def test_tiles_are_requested_by_at_most_the_limiters_concurrency(
+    bb: ModuleType, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, max_concurrency: int
+) -> None:
+    from PIL import Image
+
+    lock = threading.Lock()
+    threads: set[int] = set()
+    request_boxes = bb.request_boxes
+
+    def recording_request_boxes(*args: object) -> list[dict]:
+        with lock:
+            threads.add(threading.get_ident())
+        time.sleep(0.01)
+        return request_boxes(*args)
+
+    monkeypatch.setattr(bb, "request_boxes", recording_request_boxes)
+    path = tmp_path / "scroll.png"
+    Image.new("RGB", (300, 2000), "white").save(path)
+    ctx = bb.RunContext(
+        models=bb.ModelPool(mock=True), limiter=bb.RateLimiter(max_concurrency), tile_aspect=1.5, tile_overlap=0.25
+    )
+
+    bb.detect_boxes(bb.load_image(str(path)), "general", 0.0, ctx)
+
+    assert ctx.models.mock_stats.calls == 6
+    assert 1 <= len(threads) <= max_concurrency
+
+
+def test_batched_prompts_answer_like_single_ones(bb: ModuleType, images: Path, tmp_path: Path) -> None:
+    ctx = bb.RunContext(models=bb.ModelPool(mock=True), batcher=bb.PromptBatcher(3, linger=1.0))
+    jobs = [(str(path), str(tmp_path / path.name)) for path in sorted(images.glob("*.png"))]
+    results: list = []
+
+    done, _, _ = asyncio.run(bb.process_batch(jobs, 6, on_result=results.append, ctx=ctx, mode="general"))
+
+    assert done == len(jobs)
+    assert ctx.batcher.images == len(jobs) and ctx.batcher.requests < len(jobs)
+    assert ctx.models.mock_stats.calls == ctx.batcher.requests and ctx.batcher.fallbacks == 0
+    single = bb.RunContext(models=bb.ModelPool(mock=True))
+    for result in results:
+        assert result.boxes == bb.detect_boxes(bb.load_image(result.image_path), "general", 0.0, single)
+
+
+def test_batched_prompts_fall_back_for_missing_answers(
+    bb: ModuleType, images: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    parse = bb.parse_batch_boxes
+    monkeypatch.setattr(bb, "parse_batch_boxes", lambda *args: {i: boxes for i, boxes in parse(*args).items() if i != 0})
+    ctx = bb.RunContext(models=bb.ModelPool(mock=True), batcher=bb.PromptBatcher(3, linger=1.0))
+    jobs = [(str(path), str(tmp_path / path.name)) for path in sorted(images.glob("*.png"))]
+
+    done, _, _ = asyncio.run(bb.process_batch(jobs, 6, ctx=ctx, mode="general"))
+
+    assert done == len(jobs)
+    assert ctx.batcher.fallbacks >= 1
+    assert ctx.models.mock_stats.calls == ctx.batcher.requests + ctx.batcher.fallbacks
+
+
+def test_batched_answers_are_cached_apart_from_single_ones(bb: ModuleType, images: Path, tmp_path: Path) -> None:
+    cache = bb.DetectionCache(tmp_path / "cache", ttl=3600, max_bytes=10**6)
+    jobs = [(str(path), str(tmp_path / path.name)) for path in sorted(images.glob("*.png"))]
+    batched = bb.RunContext(cache=cache, models=bb.ModelPool(mock=True), batcher=bb.PromptBatcher(3, linger=1.0))
+    asyncio.run(bb.process_batch(jobs, 6, ctx=batched, mode="general"))
+
+    single = bb.RunContext(cache=cache, models=bb.ModelPool(mock=True))
+    asyncio.run(bb.process_batch(jobs, 6, ctx=single, mode="general"))
+    again = bb.RunContext(cache=cache, models=bb.ModelPool(mock=True), batcher=bb.PromptBatcher(3, linger=1.0))
+    asyncio.run(bb.process_batch(jobs, 6, ctx=again, mode="general"))
+
+    assert single.models.mock_stats.calls == len(jobs)
+    assert again.models.mock_stats.calls == 0
+    assert len(list((tmp_path / "cache").rglob("*.json"))) == 2 * len(jobs)
+
+
+def test_parse_boxes_validates_schema_responses(bb: ModuleType) -> None:
+    box = {"xmin": 100.0, "ymin": 200.0, "xmax": 900.0, "ymax": 800.0}
+
+    assert bb.parse_boxes(json.dumps(box), "tweet") == [box]
+    assert bb.parse_boxes(json.dumps([{"label": "cat", **box}]), "general") == [{"label": "cat", **box}]
+    assert bb.parse_boxes("[]", "general") == []
+
+
+@pytest.mark.parametrize(
+    "box",
+    [
+        {"xmin": 500, "ymin": 20, "xmax": 30, "ymax": 40},  # inverted
+        {"xmin": 10, "ymin": 900, "xmax": 30, "ymax": 40},  # inverted
+        {"xmin": -5, "ymin": 20, "xmax": 30, "ymax": 40},  # out of range
+        {"xmin": 10, "ymin": 20, "xmax": 30, "ymax": 1400},  # out of range
+    ],
+)
+def test_parse_boxes_rejects_unusable_boxes(bb: ModuleType, box: dict[str, int]) -> None:
+    with pytest.raises(bb.GeminiAPIError):
+        bb.parse_boxes(json.dumps(box), "tweet")
+    with pytest.raises(bb.GeminiAPIError):
+        bb.parse_boxes(json.dumps([{"label": "cat", **box}]), "general")
+
+
+def test_parse_boxes_falls_back_to_scraping(bb: ModuleType) -> None:
+    expected = {"xmin": 10.0, "ymin": 20.0, "xmax": 30.0, "ymax": 40.0}
+
+    prose = 'Sure! The tweet is at ```json\n{"xmin": [10], "ymin": [20], "xmax": 30, "ymax": 40}\n```'
+    assert bb.parse_boxes(prose, "tweet") == [expected]
+    broken = 'cut off: {"xmin": 10, "ymin": 20, "xmax": 30, "ymax": 40'
+    assert bb.parse_boxes(broken, "tweet") == [expected]
+    bracketed = '[{"label": "cat", "xmin": [10], "ymin": 20, "xmax": 30, "ymax": 40}, {"xmin": 10, "ymin": 20, "xmax": 30, "ymax": 40}]'
+    assert bb.parse_boxes(bracketed, "general") == [{"label": "cat", **expected}, {"label": "Object", **expected}]
+    # The valid boxes of a response are kept, the inverted one is left out
+    mixed = '[{"label": "cat", "xmin": 10, "ymin": 20, "xmax": 30, "ymax": 40}, {"label": "dog", "xmin": 500, "ymin": 20, "xmax": 30, "ymax": 40}]'
+    assert bb.parse_boxes(mixed, "general") == [{"label": "cat", **expected}]
+
+    for response, mode in (('{"xmin": 10}', "tweet"), ("no boxes here", "tweet"), ('{"label": "cat"}', "general"), ("nope", "general")):
+        with pytest.raises(bb.GeminiAPIError):
+            bb.parse_boxes(response, mode)
+
+
+def test_unusable_boxes_are_not_cached(
+    bb: ModuleType, images: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(bb.settings, "MOCK_BOXES", json.dumps({"xmin": 500, "ymin": 20, "xmax": 30, "ymax": 40}))
+    cache = bb.DetectionCache(tmp_path / "cache", ttl=3600, max_bytes=10**6)
+    ctx = bb.RunContext(cache=cache, models=bb.ModelPool(mock=True))
+
+    result = bb.process_image(str(images / "img0.png"), str(tmp_path / "out.png"), ctx=ctx)
+
+    assert result.status == "failed"
+    assert not list((tmp_path / "cache").rglob("*.json"))
+
+
+def test_parse_batch_boxes_keeps_only_usable_answers(bb: ModuleType) -> None:
+    box = {"xmin": 1, "ymin": 2, "xmax": 3, "ymax": 4}
+    response = json.dumps([
+        {"index": 0, "boxes": box},
+        {"index": 1, "boxes": {"xmin": 1}},  # incomplete
+        {"index": 2, "boxes": box},
+        {"index": 2, "boxes": box},  # answered twice
+        {"index": 7, "boxes": box},  # no such image
+    ])
+
+    assert bb.parse_batch_boxes(response, "tweet", 4) == {0: [box]}
+    assert bb.parse_batch_boxes("not json", "tweet", 4) == {}
+
+
+def test_output_format_sets_the_encoder_and_extension(bb: ModuleType, images: Path, tmp_path: Path) -> None:
+    from PIL import Image
+
+    sizes = {}
+    for output_format in ("keep", "webp", "avif"):
+        out = tmp_path / output_format
+        encoding = bb.OutputEncoding(format=output_format, quality="small")
+
+        assert bb.process_path(str(images), str(out), use_cache=False, render_workers=0, encoding=encoding) == 0
+
+        outputs = sorted(out.glob("img*"))
+        assert [path.name for path in outputs] == [f"img{i}_bbox{bb.OUTPUT_EXTENSIONS.get(output_format, '.png')}" for i in range(6)]
+        with Image.open(outputs[0]) as image:
+            assert image.format == {"keep": "PNG", "webp": "WEBP", "avif": "AVIF"}[output_format]
+        sizes[output_format] = sum(path.stat().st_size for path in outputs)
+
+    assert sizes["webp"] < sizes["keep"] and sizes["avif"] < sizes["keep"]
+
+
+def test_strip_metadata_drops_exif_and_icc(bb: ModuleType, tmp_path: Path) -> None:
+    from PIL import Image, ImageCms
+
+    exif = Image.Exif()
+    exif[0x010F] = "Camera"  # Make
+    icc = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+    image = Image.new("RGB", (200, 300), "white")
+    image.info.update(exif=exif.tobytes(), icc_profile=icc)
+
+    for strip in (False, True):
+        for output_format in ("jpeg", "webp"):
+            encoding = bb.OutputEncoding(format=output_format, strip_metadata=strip)
+            path = encoding.output_path(str(tmp_path / f"out_{strip}.png"))
+            bb.save_output(image, path, encoding)
+
+            with Image.open(path) as saved:
+                assert bool(saved.getexif()) is not strip
+                assert (saved.info.get("icc_profile") == icc) is not strip
+
+
+def test_bk_tree_search_matches_a_linear_scan(bb: ModuleType) -> None:
+    rng = random.Random(0)
+    keys = [rng.getrandbits(64) for _ in range(300)]
+    tree = bb.BKTree()
+    for i, key in enumerate(keys):
+        tree.add(key, i)
+
+    for probe in keys[:10] + [rng.getrandbits(64) for _ in range(10)]:
+        for radius in (0, 8, 24):
+            expected = sorted(i for i, key in enumerate(keys) if (key ^ probe).bit_count() <= radius)
+            assert sorted(i for _, i in tree.search(probe, radius)) == expected
+
+
+def test_near_duplicates_reuse_boxes(bb: ModuleType, tmp_path: Path) -> None:
+    from PIL import Image, ImageDraw
+
+    tweet = Image.new("RGB", (600, 900), "white")
+    for y in range(100, 700, 60):
+        ImageDraw.Draw(tweet).rectangle((40, y, 300 + y // 2, y + 30), fill="black")
+    paths = []
+    for quality in (60, 75, 90):  # the same capture, saved three times
+        paths.append(tmp_path / f"dup{quality}.jpg")
+        tweet.save(paths[-1], quality=quality)
+    other = Image.new("RGB", (600, 900), "white")
+    ImageDraw.Draw(other).rectangle((100, 300, 500, 600), fill="black")
+    paths.append(tmp_path / "other.png")
+    other.save(paths[-1])
+    ctx = bb.RunContext(models=bb.ModelPool(mock=True), dedup=bb.NearDuplicateIndex(8))
+    results: list = []
+
+    asyncio.run(bb.process_batch([(str(path), str(tmp_path / f"out_{path.name}")) for path in paths], 4, on_result=results.append, ctx=ctx))
+
+    assert ctx.models.mock_stats.calls == 2
+    assert (ctx.dedup.hits, ctx.dedup.lookups) == (2, 4)
+    boxes = {Path(result.image_path).name: result.boxes for result in results}
+    assert boxes["dup60.jpg"] == boxes["dup75.jpg"] == boxes["dup90.jpg"] != boxes["other.png"]
+
+
+def test_different_tweets_with_similar_hashes_do_not_share_boxes(bb: ModuleType, tmp_path: Path) -> None:
+    from PIL import Image, ImageDraw
+
+    def tweet(line_widths: list[int]) -> Image.Image:
+        image = Image.new("RGB", (1080, 1920), "white")
+        draw = ImageDraw.Draw(image)
+        draw.ellipse((40, 160, 140, 260), fill="steelblue")
+        draw.rectangle((160, 180, 500, 210), fill="black")
+        y = 300
+        for width in line_widths:
+            draw.rectangle((40, y, 40 + width, y + 30), fill="black")
+            y += 55
+        draw.rectangle((40, y + 40, 600, y + 65), fill="gray")  # timestamp row
+        return image
+
+    short, long = tweet([900, 850, 950, 700]), tweet([900, 850, 950, 700, 400])
+    assert bb.BKTree.distance(bb.dhash(short), bb.dhash(long)) <= bb.settings.DEDUP_DISTANCE
+    paths = [tmp_path / "short.png", tmp_path / "long.png"]
+    short.save(paths[0])
+    long.save(paths[1])
+    ctx = bb.RunContext(models=bb.ModelPool(mock=True), dedup=bb.NearDuplicateIndex(bb.settings.DEDUP_DISTANCE))
+
+    asyncio.run(bb.process_batch([(str(path), str(tmp_path / f"out_{path.name}")) for path in paths], 1, ctx=ctx))
+
+    assert ctx.models.mock_stats.calls == 2
+    assert (ctx.dedup.hits, ctx.dedup.rejected) == (0, 1)
+
+
+def test_mock_detections_are_cached_apart_from_real_ones(bb: ModuleType, images: Path, tmp_path: Path) -> None:
+    cache = bb.DetectionCache(tmp_path / "cache", ttl=3600, max_bytes=10**6)
+    ctx = bb.RunContext(cache=cache, models=bb.ModelPool(mock=True))
+    loaded = bb.load_image(str(images / "img2.png"))
+
+    boxes = bb.detect_boxes(loaded, "tweet", 0.0, ctx)
+
+    prompt = bb.PROMPTS["tweet"]
+    assert cache.get(bb.DetectionCache.make_key(loaded.sha256, "tweet", prompt, "mock", 0.0)) == boxes
+    assert cache.get(bb.DetectionCache.make_key(loaded.sha256, "tweet", prompt, bb.settings.GEMINI_MODEL, 0.0)) is None
+
+
+def test_no_cache_neither_reads_nor_writes_the_cache(
+    bb: ModuleType, images: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setattr(bb.settings, "CACHE_DIR", str(cache_dir))
+    calls: list[str] = []
+    request_boxes = bb.request_boxes
+
+    def counting_request_boxes(*args: object) -> list[dict]:
+        calls.append(str(args[0]))
+        return request_boxes(*args)
+
+    monkeypatch.setattr(bb, "request_boxes", counting_request_boxes)
+
+    def run(use_cache: bool) -> int:
+        calls.clear()
+        assert bb.process_path(str(images), str(tmp_path / "out"), use_cache=use_cache, dedup_distance=None,
+                               render_workers=0) == 0
+        return len(calls)
+
+    assert run(use_cache=False) == 6
+    assert not cache_dir.exists()
+    assert run(use_cache=True) == 6
+    assert len(list(cache_dir.rglob("*.json"))) == 6
+    assert run(use_cache=True) == 0
+    assert run(use_cache=False) == 6
+
+
+def test_cache_entries_expire(bb: ModuleType, tmp_path: Path) -> None:
+    cache = bb.DetectionCache(tmp_path / "cache", ttl=3600, max_bytes=10**6)
+    boxes = [{"xmin": 1, "ymin": 2, "xmax": 3, "ymax": 4}]
+    cache.put("aa01", boxes)
+    path = tmp_path / "cache" / "aa" / "aa01.json"
+
+    assert cache.get("aa01") == boxes
+    old = time.time() - 3601
+    os.utime(path, (old, old))
+    assert cache.get("aa01") is None
+    assert not path.exists()
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_eviction_drops_expired_then_oldest_entries(bb: ModuleType, tmp_path: Path) -> None:
+    cache = bb.DetectionCache(tmp_path / "cache", ttl=3600, max_bytes=10**6)
+    boxes = [{"xmin": 1, "ymin": 2, "xmax": 3, "ymax": 4}]
+    now = time.time()
+    # One expired entry, then five of increasing age
+    for i, age in enumerate([7200, 500, 400, 300, 200, 100]):
+        key = f"{i:02x}" * 2
+        cache.put(key, boxes)
+        os.utime(cache._entry_path(key), (now - age, now - age))
+    size = cache._entry_path("0101").stat().st_size
+    cache.max_bytes = 3 * size
+
+    cache.evict()
+
+    assert sorted(path.stem for path in (tmp_path / "cache").rglob("*.json")) == ["0303", "0404", "0505"]
+
+
+def test_model_pool_shares_one_client_and_one_model_per_config(
+    bb: ModuleType, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    import google.generativeai as genai
+    from google.generativeai import client as genai_client
+
+    clients: list[object] = []
+    configs: list[dict] = []
+
+    class Model:
+        def __init__(self, model_name: str, generation_config: dict) -> None:
+            time.sleep(0.01)  # widen the window for a race
+            configs.append(generation_config)
+
+    monkeypatch.setattr(genai_client, "get_default_generative_client", lambda: clients.append(object()))
+    monkeypatch.setattr(genai, "GenerativeModel", Model)
+    # Not the real load_gemini: it caches the configured SDK for the rest of the session
+    monkeypatch.setattr(bb, "load_gemini", lambda: genai)
+    pool = bb.ModelPool(model_name="gemini-test", mock=False)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        models = list(executor.map(lambda _: pool.get("tweet", 0.0), range(16)))
+
+    assert len(clients) == 1
+    assert len(configs) == 1
+    assert all(model is models[0] for model in models)
+    others = [pool.get("general", 0.0), pool.get("tweet", 0.5), pool.get("tweet", 0.0, batched=True)]
+    assert len({id(model) for model in [models[0], *others]}) == 4
+    assert len(clients) == 1
+    assert configs[-1]["response_schema"] == bb.BATCH_RESPONSE_SCHEMAS["tweet"]
+    assert pool.get("general", 0.0) is others[0]
+
+
+@pytest.mark.parametrize(
+    ("size", "max_edge", "expected"),
+    [
+        ((3000, 4000), 0, (3000, 4000)),
+        ((800, 600), 1024, (800, 600)),
+        ((1024, 500), 1024, (1024, 500)),
+        ((3000, 4000), 1024, (768, 1024)),
+        ((4000, 3000), 1024, (1024, 768)),
+        ((10000, 3), 1000, (1000, 1)),
+    ],
+)
+def test_upload_size_scales_the_longest_edge(
+    bb: ModuleType, size: tuple[int, int], max_edge: int, expected: tuple[int, int]
+) -> None:
+    assert bb.upload_size(size, max_edge) == expected
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "P", "L"])
+def test_uploads_are_downscaled_jpegs(bb: ModuleType, mode: str) -> None:
+    import io
+
+    from PIL import Image
+
+    img = Image.new("RGB", (2400, 3200), "white").convert(mode)
+
+    for max_edge, expected in ((1024, (768, 1024)), (0, (2400, 3200))):
+        upload = Image.open(io.BytesIO(bb.encode_for_upload(img, max_edge, 80)))
+        assert upload.format == "JPEG"
+        assert upload.size == expected
+        assert upload.mode in ("RGB", "L")
+
+
+def test_load_image_hashes_and_decodes_once(bb: ModuleType, images: Path) -> None:
+    import hashlib
+
+    path = images / "img3.png"
+
+    loaded = bb.load_image(str(path))
+
+    assert loaded.sha256 == hashlib.sha256(path.read_bytes()).hexdigest()
+    assert loaded.data == path.read_bytes()
+    assert loaded.image.size == (300, 400)
+    assert bb.load_image(str(path), data=loaded.data).sha256 == loaded.sha256
+
+
+def test_load_image_rejects_files_that_are_not_images(bb: ModuleType, images: Path, tmp_path: Path) -> None:
+    truncated = tmp_path / "truncated.png"
+    truncated.write_bytes((images / "img0.png").read_bytes()[:200])
+
+    for path in (images / "notes.txt", truncated):
+        with pytest.raises(bb.InvalidImageError, match="Not a valid image file"):
+            bb.load_image(str(path))
+    with pytest.raises(FileNotFoundError):
+        bb.load_image(str(tmp_path / "missing.png"))
+
+
+def test_non_images_are_skipped_without_a_request(bb: ModuleType, images: Path, tmp_path: Path) -> None:
+    ctx = bb.RunContext(models=bb.ModelPool(mock=True))
+
+    result = bb.process_image(str(images / "notes.txt"), str(tmp_path / "notes.png"), ctx=ctx)
+
+    assert result.status == "skipped"
+    assert ctx.models.mock_stats.calls == 0
+    assert not (tmp_path / "notes.png").exists()
+
+
+def test_bench_script_runs(bb: ModuleType, tmp_path: Path) -> None:
+    spec = importlib.util.spec_from_file_location("bench_bboxes", BENCH_SCRIPT)
+    assert spec is not None and spec.loader is not None
+    bench = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bench)
+
+    images = bench.generate_images(tmp_path, 4, (200, 300))
+    row = bench.bench(bb, images, tmp_path, 2, "tweet")
+
+    assert row["failed"] == 0
+    assert row["calls/img"] == 1.0
+    assert row["img/s"] > 0
+
+
+# --------------------------------------------------------------------------------------
+# Detector backends
+# --------------------------------------------------------------------------------------
+
+TIMESTAMP_TOP = 680  # of the synthetic tweet screenshot, 1600 pixels tall
+
+
+@pytest.fixture
+def screenshot(tmp_path: Path) -> Path:
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (1080, 1600), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((40, 40, 400, 80), fill="black")  # header
+    draw.line((0, 130, 1080, 130), fill=(235, 235, 235), width=2)
+    draw.ellipse((40, 170, 140, 270), fill="steelblue")  # avatar
+    draw.rectangle((160, 190, 520, 220), fill="black")  # name
+    for i in range(5):  # text
+        draw.rectangle((40, 320 + i * 60, 940 - i * 80, 350 + i * 60), fill="black")
+    draw.rectangle((40, TIMESTAMP_TOP, 600, TIMESTAMP_TOP + 28), fill=(110, 110, 110))
+    draw.line((0, TIMESTAMP_TOP + 80, 1080, TIMESTAMP_TOP + 80), fill=(235, 235, 235), width=2)
+    draw.rectangle((40, TIMESTAMP_TOP + 110, 1000, TIMESTAMP_TOP + 140), fill=(120, 120, 120))  # engagement bar
+    path = tmp_path / "tweet.png"
+    image.save(path)
+    return path
+
+
+@pytest.fixture
+def noise(tmp_path: Path) -> Path:
+    from PIL import Image
+
+    path = tmp_path / "noise.png"
+    Image.frombytes("L", (300, 400), random.Random(0).randbytes(300 * 400)).save(path)
+    return path
+
+
+def test_local_detector_stops_above_the_timestamp(bb: ModuleType, screenshot: Path) -> None:
+    detection = bb.LocalTweetDetector().detect(bb.load_image(str(screenshot)), "tweet", 0.0)
+
+    (box,) = detection.boxes
+    assert detection.confidence > 0.9
+    assert box["ymin"] == pytest.approx(170 / 1600 * 1000, abs=5)  # the avatar, below the header divider
+    assert box["ymax"] == pytest.approx(590 / 1600 * 1000, abs=5)  # the last line of text
+    assert box["ymax"] < TIMESTAMP_TOP / 1600 * 1000
+    assert box["xmin"] == pytest.approx(40 / 1080 * 1000, abs=5)
+
+
+def test_local_detector_has_low_confidence_on_noise(bb: ModuleType, noise: Path) -> None:
+    _, confidence = bb.find_tweet_region(bb.load_image(str(noise)).image)
+
+    assert confidence < 0.2
+
+
+def test_local_detector_only_supports_tweet_mode(bb: ModuleType, screenshot: Path) -> None:
+    with pytest.raises(bb.DetectionError):
+        bb.LocalTweetDetector().detect(bb.load_image(str(screenshot)), "general", 0.0)
+
+
+def test_local_then_gemini_escalates_below_the_threshold(bb: ModuleType, screenshot: Path, noise: Path) -> None:
+    detector = bb.LocalThenGeminiDetector(threshold=0.5)
+    ctx = bb.RunContext(models=bb.ModelPool(mock=True), detector=detector)
+
+    local = detector.detect(bb.load_image(str(screenshot)), "tweet", 0.0, ctx)
+    assert local.detector == "local"
+    assert (detector.local_count, detector.escalated_count, ctx.models.mock_stats.calls) == (1, 0, 0)
+
+    escalated = detector.detect(bb.load_image(str(noise)), "tweet", 0.0, ctx)
+    assert escalated.detector == "gemini"
+    detector.detect(bb.load_image(str(screenshot)), "general", 0.0, ctx)
+    assert (detector.local_count, detector.escalated_count, ctx.models.mock_stats.calls) == (1, 2, 2)
+
+
+def test_detector_is_abstract(bb: ModuleType) -> None:
+    with pytest.raises(TypeError):
+        bb.Detector()
+
+
+# --------------------------------------------------------------------------------------
+# Rate limiting
+# --------------------------------------------------------------------------------------
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.slept: list[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+
+
+@pytest.fixture
+def clock(bb: ModuleType, monkeypatch: pytest.MonkeyPatch) -> _Clock:
+    clock = _Clock()
+    monkeypatch.setattr(bb.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(bb.time, "sleep", clock.sleep)
+    return clock
+
+
+THROTTLED = RuntimeError("429 Resource has been exhausted (e.g. check quota)")
+
+
+def test_throttling_halves_the_limit_once_per_burst(bb: ModuleType) -> None:
+    limiter = bb.RateLimiter(8)
+    first, second = limiter.request(), limiter.request()
+    first.__enter__()
+    second.__enter__()  # in flight before the limit was halved
+
+    assert first.__exit__(RuntimeError, THROTTLED, None) is False
+    assert limiter.limit == 4
+    assert second.__exit__(RuntimeError, THROTTLED, None) is False
+    assert limiter.limit == 4
+    with pytest.raises(RuntimeError), limiter.request():
+        raise THROTTLED
+    assert (limiter.limit, limiter.throttled, limiter.in_flight) == (2, 3, 0)
+
+    with pytest.raises(ValueError), limiter.request():
+        raise ValueError("not a throttling error")
+    assert limiter.limit > 2 and limiter.throttled == 3
+
+
+def test_successes_raise_the_limit_additively(bb: ModuleType) -> None:
+    limiter = bb.RateLimiter(8)
+    limiter.limit = 4.0
+
+    for _ in range(4):
+        with limiter.request():
+            pass
+
+    assert 4.9 < limiter.limit < 5  # about one per `limit` successes
+    for _ in range(100):
+        with limiter.request():
+            pass
+    assert limiter.limit == 8
+
+
+def test_budgets_delay_requests(bb: ModuleType, clock: _Clock) -> None:
+    limiter = bb.RateLimiter(4, rpm=60, tpm=6000)
+
+    for _ in range(6):  # the burst: a tenth of a minute's budget
+        with limiter.request(tokens=10):
+            pass
+    assert clock.slept == []
+    with limiter.request(tokens=10):
+        pass
+    assert clock.slept == [pytest.approx(1.0)]  # one request per second
+    clock.now += 1.0
+    with limiter.request(tokens=1100):
+        pass
+    assert clock.slept[-1] == pytest.approx(5.0)  # refilled to 600 tokens, 500 short at 100 per second
+
+
+def test_token_bucket_refills_up_to_its_capacity(bb: ModuleType, clock: _Clock) -> None:
+    bucket = bb.TokenBucket(60)
+
+    assert bucket.reserve(6) == 0
+    assert bucket.reserve(2) == pytest.approx(2.0)
+    clock.now += 60
+    assert bucket.reserve(6) == 0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+
+
+def test_is_throttle_error_follows_the_cause_chain(bb: ModuleType) -> None:
+    class ResourceExhausted(Exception):
+        pass
+
+    try:
+        try:
+            raise ResourceExhausted("out of capacity")
+        except ResourceExhausted as e:
+            raise bb.GeminiAPIError("Error in Gemini API call") from e
+    except bb.GeminiAPIError as e:
+        wrapped = e
+
+    assert bb.is_throttle_error(wrapped)
+    assert bb.is_throttle_error(THROTTLED)
+    assert not bb.is_throttle_error(bb.GeminiAPIError("503 Service Unavailable"))
+
+
+def test_throttling_while_resolving_counts_for_the_limiter(bb: ModuleType) -> None:
+    class StreamedResponse:
+        def __init__(self, fail: bool) -> None:
+            self.fail = fail
+
+        def resolve(self) -> None:
+            if self.fail:
+                raise THROTTLED
+
+    class Model:
+        calls = 0
+
+        def generate_content(self, prompt_parts: list) -> StreamedResponse:
+            self.calls += 1
+            return StreamedResponse(fail=self.calls == 1)
+
+    limiter = bb.RateLimiter(8)
+
+    bb.generate_gemini_content(Model(), ["prompt"], limiter)
+
+    assert (limiter.throttled, limiter.in_flight) == (1, 0)
+    assert limiter.limit < 8
+
+
+# --------------------------------------------------------------------------------------
+# Directory discovery
+# --------------------------------------------------------------------------------------
+
+
+@pytest.fixture
+def tree(images: Path) -> Path:
+    for subdirectory in ("2024", "2024/drafts", "2025", ".thumbnails"):
+        (images / subdirectory).mkdir()
+    for name in ("2024/a.png", "2024/drafts/b.png", "2025/c.jpg", "2025/big.png", ".thumbnails/d.png"):
+        (images / name).write_bytes((images / "img0.png").read_bytes())
+    (images / "2025" / "big.png").write_bytes(b"\0" * 10**6)
+    return images
+
+
+def _discover(bb: ModuleType, root: Path, **filters) -> list[str]:
+    return [Path(path).relative_to(root).as_posix() for path in bb.discover_images(str(root), bb.DiscoveryFilter(**filters))]
+
+
+def test_discovery_is_flat_unless_recursive(bb: ModuleType, tree: Path) -> None:
+    assert _discover(bb, tree) == [f"img{i}.png" for i in range(6)]
+    assert _discover(bb, tree, recursive=True)[6:] == ["2024/a.png", "2024/drafts/b.png", "2025/big.png", "2025/c.jpg"]
+
+
+def test_discovery_filters(bb: ModuleType, tree: Path) -> None:
+    os.utime(tree / "img0.png", (0, 0))
+
+    assert _discover(bb, tree, recursive=True, include=["*.jpg", "2024/*"]) == ["2024/a.png", "2024/drafts/b.png", "2025/c.jpg"]
+    assert _discover(bb, tree, recursive=True, exclude=["drafts", "img*"]) == ["2024/a.png", "2025/big.png", "2025/c.jpg"]
+    assert "2025/big.png" not in _discover(bb, tree, recursive=True, max_size=bb.parse_size("500KB"))
+    assert _discover(bb, tree, recursive=True, min_size=bb.parse_size("0.5MB")) == ["2025/big.png"]
+    assert "img0.png" not in _discover(bb, tree, modified_since=bb.parse_since("1d"))
+
+
+def test_parse_since(bb: ModuleType) -> None:
+    assert bb.parse_since("2h", now=10_000) == 10_000 - 7200
+    assert bb.parse_since("2025-06-01") == bb.datetime(2025, 6, 1).timestamp()
+    with pytest.raises(ValueError):
+        bb.parse_since("yesterday")
+
+
+def test_recursive_run_mirrors_the_tree(bb: ModuleType, tree: Path) -> None:
+    out = tree / "out"  # inside the tree, so a second run must not pick up the outputs
+
+    for _ in range(2):
+        assert bb.process_path(str(tree), str(out), use_cache=False, render_workers=0,
+                               discovery=bb.DiscoveryFilter(recursive=True, exclude=["big.png"])) == 0
+
+    outputs = sorted(path.relative_to(out).as_posix() for path in out.rglob("*.*") if not path.name.startswith("."))
+    assert outputs == ["2024/a_bbox.png", "2024/drafts/b_bbox.png", "2025/c_bbox.jpg"] + [f"img{i}_bbox.png" for i in range(6)]
+
+
+def test_batch_starts_before_discovery_finishes(bb: ModuleType, images: Path, tmp_path: Path) -> None:
+    first_done = threading.Event()
+    waited: list[bool] = []
+
+    def jobs() -> Iterator[tuple[str, str]]:
+        yield str(images / "img0.png"), str(tmp_path / "img0.png")
+        waited.append(first_done.wait(timeout=10))
+        yield str(images / "img1.png"), str(tmp_path / "img1.png")
+
+    done, failed, _ = asyncio.run(bb.process_batch(
+        jobs(), 2, on_result=lambda result: first_done.set(), ctx=bb.RunContext(models=bb.ModelPool(mock=True))
+    ))
+
+    assert (done, failed) == (2, 0)
+    assert waited == [True]
+
+
+# --------------------------------------------------------------------------------------
+# Journal and --resume
+# --------------------------------------------------------------------------------------
+
+
+def _run(bb: ModuleType, images: Path, out: Path, **options: object) -> int:
+    return bb.process_path(str(images), str(out), use_cache=False, dedup_distance=None, render_workers=0, **options)
+
+
+def _mtimes(out: Path) -> dict[str, int]:
+    return {path.name: path.stat().st_mtime_ns for path in out.glob("*.png")}
+
+
+def test_resume_skips_done_images(bb: ModuleType, images: Path, tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    out = tmp_path / "out"
+    assert _run(bb, images, out) == 0
+    before = _mtimes(out)
+    capsys.readouterr()
+
+    assert _run(bb, images, out, resume=True) == 0
+
+    assert "skipped 6 images already done" in capsys.readouterr().out
+    assert _mtimes(out) == before
+
+
+def test_resume_redoes_missing_outputs_and_changed_inputs(bb: ModuleType, images: Path, tmp_path: Path) -> None:
+    from PIL import Image
+
+    out = tmp_path / "out"
+    assert _run(bb, images, out) == 0
+    before = _mtimes(out)
+    (out / "img2_bbox.png").unlink()
+    Image.new("RGB", (300, 400), "gray").save(images / "img4.png")
+
+    assert _run(bb, images, out, resume=True) == 0
+
+    after = _mtimes(out)
+    assert sorted(name for name in after if after[name] != before.get(name)) == ["img2_bbox.png", "img4_bbox.png"]
+
+
+@pytest.mark.parametrize(
+    "changed", [{"crop_percent": 80.0}, {"box_color": "blue"}, {"label": "Post"}, {"resize": True}]
+)
+def test_resume_redoes_images_done_with_other_options(
+    bb: ModuleType, images: Path, tmp_path: Path, changed: dict[str, object]
+) -> None:
+    out = tmp_path / "out"
+    results = tmp_path / "results.jsonl"
+    assert _run(bb, images, out, autocrop=True) == 0
+
+    assert _run(bb, images, out, resume=True, results_path=str(results), autocrop=True, **changed) == 0
+
+    assert len(results.read_text(encoding="utf-8").splitlines()) == 6
+
+
+def test_journal_ignores_a_torn_last_line(bb: ModuleType, images: Path, tmp_path: Path) -> None:
+    out = tmp_path / "out"
+    assert _run(bb, images, out) == 0
+    journal_path = out / bb.BatchJournal.FILENAME
+    lines = journal_path.read_text(encoding="utf-8").splitlines()
+    journal_path.write_text("\n".join(lines[:-1]) + "\n" + lines[-1][:20], encoding="utf-8")
+    journal = bb.BatchJournal(journal_path, resume=True)
+    journal.close()
+
+    assert len(journal._completed) == 5
+
+
+# --------------------------------------------------------------------------------------
+# Startup: no API key and no heavy imports until a detection needs them
+# --------------------------------------------------------------------------------------
+
+
+def _without_key() -> dict[str, str]:
+    return {name: value for name, value in os.environ.items() if name != "GEMINI_API_KEY"}
+
+
+def test_help_needs_no_api_key() -> None:
+    result = subprocess.run(
+        [sys.executable, str(SCRIPT), "--help"], capture_output=True, text=True, env=_without_key(), cwd=REPO_ROOT
+    )
+
+    assert result.returncode == 0
+    assert "--image-path" in result.stdout
+
+
+def test_import_defers_the_sdk_and_pil() -> None:
+    bench = importlib.util.spec_from_file_location("bench_bboxes", BENCH_SCRIPT)
+    assert bench is not None and bench.loader is not None
+    module = importlib.util.module_from_spec(bench)
+    bench.loader.exec_module(module)
+    code = module.IMPORT_BBOXES + "; import sys; print(sorted(m for m in ('google.generativeai', 'PIL.Image') if m in sys.modules))"
+
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=_without_key(), check=True)
+
+    assert result.stdout.strip() == "[]"
+
+
+def test_missing_api_key_fails_the_detection(bb: ModuleType, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(bb.settings, "GEMINI_API_KEY", None)
+
+    with pytest.raises(bb.GeminiAPIError, match="GEMINI_API_KEY"):
+        bb.ModelPool(mock=False).get("tweet", 0.0)
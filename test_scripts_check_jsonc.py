@@ -7,7 +7,8 @@ mirroring ``test_scripts_backup_dotfiles.py``.
 
 The checker is read-only: it answers "would this parse as JSON once comments are
 ignored?" without ever writing to the file. Comments are the whole point of the JSONC
-files it guards, so ``test_never_modifies_file`` pins that guarantee down.
+files it guards, so ``test_never_modifies_file`` pins that guarantee down. Only the
+opt-in ``--format`` mode writes, and its tests pin down that it keeps every comment.
 
 Most of the remaining tests defend against *false alarms* rather than missed errors: a
 naive comment scanner sees the ``//`` in ``"https://example.com"`` and blanks the rest
@@ -18,7 +19,12 @@ cmux config opens with exactly such a ``$schema`` URL.
 from __future__ import annotations
 
 import importlib.util
+import json
+import random
+import shutil
+import subprocess
 import sys
+from collections.abc import Callable, Iterator
 from pathlib import Path
 from types import ModuleType
 
@@ -26,6 +32,7 @@ import pytest
 
 REPO_ROOT = Path(__file__).parent
 SCRIPT = REPO_ROOT / "scripts" / "check-jsonc.py"
+BENCH_SCRIPT = REPO_ROOT / "scripts" / "bench-check-jsonc.py"
 
 # The two real JSONC files in the repo that the pre-commit hook is scoped to.
 REAL_JSONC_FILES = [
@@ -157,6 +164,541 @@ def test_unterminated_block_comment_fails(mod: ModuleType, tmp_path: Path) -> No
     assert mod.check_file(path) is not None
 
 
+# --------------------------------------------------------------------------------------
+# Streaming mode: same verdict as the in-memory parse, whatever the chunk boundaries
+# --------------------------------------------------------------------------------------
+
+STREAM_SAMPLES = [
+    pytest.param('{\n  // c\n  "a": [1, 2,],\n  "u": "https://x/y",\n}', id="jsonc"),
+    pytest.param('{"a": "she said \\"// hi\\"", "b": /* x */ 2}', id="escaped-quote"),
+    pytest.param('{"a": "\\u00e9\\n", "b": [true, false, null, -1.5e3]}', id="escapes-and-atoms"),
+    pytest.param("[,]", id="lone-trailing-comma"),
+    pytest.param('{\n  "a": 1\n', id="missing-brace"),
+    pytest.param("{\n  a: 1\n}", id="unquoted-key"),
+    pytest.param("[1,,]", id="double-comma"),
+    pytest.param("[01]", id="leading-zero"),
+    pytest.param('{"a": 1} x', id="extra-data"),
+    pytest.param('{"a": /* never closed', id="unterminated-block"),
+    pytest.param('{"a": "open', id="unterminated-string"),
+    pytest.param("", id="empty"),
+]
+
+
+def _chunked(text: str, size: int) -> list[str]:
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7])
+@pytest.mark.parametrize("text", STREAM_SAMPLES)
+def test_stream_uncommenter_matches_uncomment(mod: ModuleType, text: str, size: int) -> None:
+    try:
+        expected = mod.uncomment(text)
+    except mod.JsoncError:
+        expected = None
+
+    uncommenter = mod.StreamUncommenter()
+    try:
+        got = "".join(uncommenter.feed(chunk) for chunk in _chunked(text, size)) + uncommenter.close()
+    except mod.JsoncError:
+        got = None
+
+    assert got == expected
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7])
+@pytest.mark.parametrize("text", STREAM_SAMPLES)
+def test_stream_verdict_matches_loads_jsonc(mod: ModuleType, text: str, size: int) -> None:
+    try:
+        mod.loads_jsonc(text)
+        expected_ok = True
+    except ValueError:
+        expected_ok = False
+
+    try:
+        mod.validate_stream(_chunked(text, size))
+        got_ok = True
+    except mod.JsoncError:
+        got_ok = False
+
+    assert got_ok == expected_ok
+
+
+def test_stream_reports_the_same_position_as_json(mod: ModuleType) -> None:
+    text = '{\n  // keep me\n  "a": oops\n}'
+    with pytest.raises(ValueError) as in_memory:
+        mod.loads_jsonc(text)
+    with pytest.raises(mod.JsoncError) as streamed:
+        mod.validate_stream(_chunked(text, 4))
+
+    assert str(streamed.value) == str(in_memory.value) == "Expecting value: line 3 column 8 (char 22)"
+
+
+def test_stream_splits_multibyte_characters_safely(mod: ModuleType, tmp_path: Path) -> None:
+    # 3-byte chars with a 2-byte chunk size: every character straddles a boundary.
+    path = _write(tmp_path, '{"a": "\u2603\u2603\u2603"}')
+    mod.validate_stream(mod.iter_file_chunks(path, chunk_size=2))
+
+
+@pytest.mark.parametrize("text", STREAM_SAMPLES)
+def test_check_file_stream_agrees(mod: ModuleType, tmp_path: Path, text: str) -> None:
+    path = _write(tmp_path, text)
+    assert (mod.check_file(path, stream=True) is None) == (mod.check_file(path) is None)
+
+
+def test_main_stream_flag(mod: ModuleType, tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    good = _write(tmp_path, '{\n  // ok\n  "a": 1,\n}', name="good.json")
+    bad = _write(tmp_path, "{oops}", name="bad.json")
+
+    assert mod.main(["--stream", str(good)]) == 0
+    assert mod.main(["--stream", str(good), str(bad)]) != 0
+    assert "bad.json" in capsys.readouterr().err
+
+
+# --------------------------------------------------------------------------------------
+# --format: re-indents, keeps every comment and trailing comma, writes only on change
+# --------------------------------------------------------------------------------------
+
+
+def test_format_reindents_and_keeps_comments_and_trailing_commas(mod: ModuleType) -> None:
+    text = (
+        "// header\n"
+        "{\n"
+        '      "a": 1,   // why\n'
+        "\n\n\n"
+        '\t"b": [\n'
+        "  1,\n"
+        "        2,\n"
+        "    ],  \n"
+        '"c": { "inline": true },\n'
+        "}"
+    )
+    assert mod.format_jsonc(text) == (
+        "// header\n"
+        "{\n"
+        '  "a": 1,   // why\n'
+        "\n"
+        '  "b": [\n'
+        "    1,\n"
+        "    2,\n"
+        "  ],\n"
+        '  "c": { "inline": true },\n'
+        "}\n"
+    )
+
+
+def test_format_leaves_block_comment_continuation_lines_alone(mod: ModuleType) -> None:
+    text = '{\n    /* first\n         second */\n  "a": 1\n}\n'
+    assert mod.format_jsonc(text) == '{\n  /* first\n         second */\n  "a": 1\n}\n'
+
+
+def test_format_is_idempotent_and_never_touches_strings(mod: ModuleType) -> None:
+    text = '{\n"u": "https://x/y   ",\n      "k": "  // not a comment  "\n}'
+    once = mod.format_jsonc(text)
+    assert mod.format_jsonc(once) == once
+    assert mod.loads_jsonc(once) == mod.loads_jsonc(text)
+
+
+def test_format_keeps_crlf(mod: ModuleType) -> None:
+    assert mod.format_jsonc('{\r\n"a": 1\r\n}') == '{\r\n  "a": 1\r\n}\r\n'
+
+
+def test_format_refuses_invalid_input(mod: ModuleType) -> None:
+    with pytest.raises(ValueError):
+        mod.format_jsonc("{\n  a: 1\n}")
+
+
+def test_main_format_rewrites_only_changed_files(mod: ModuleType, tmp_path: Path) -> None:
+    tidy = _write(tmp_path, '{\n  "a": 1 // ok\n}\n', name="tidy.json")
+    messy = _write(tmp_path, '{\n"a": 1 // ok\n}', name="messy.json")
+    tidy_mtime = tidy.stat().st_mtime_ns
+
+    assert mod.main(["--format", str(tidy), str(messy)]) == 0
+
+    assert messy.read_text(encoding="utf-8") == '{\n  "a": 1 // ok\n}\n'
+    assert tidy.stat().st_mtime_ns == tidy_mtime
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["messy.json", "tidy.json"]  # no temp files left
+
+
+def test_main_format_check_reports_without_writing(
+    mod: ModuleType, tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    messy = _write(tmp_path, '{\n"a": 1\n}', name="messy.json")
+    before = messy.read_bytes()
+
+    assert mod.main(["--format", "--check", str(messy)]) != 0
+
+    assert messy.read_bytes() == before
+    assert "would reformat" in capsys.readouterr().err
+
+
+def test_main_format_leaves_invalid_files_alone(mod: ModuleType, tmp_path: Path) -> None:
+    bad = _write(tmp_path, '{\n"a": oops\n}', name="bad.json")
+    messy = _write(tmp_path, '{\n"a": 1\n}', name="messy.json")
+    before = bad.read_bytes()
+
+    assert mod.main(["--format", str(bad), str(messy)]) != 0
+
+    assert bad.read_bytes() == before
+    assert messy.read_text(encoding="utf-8") == '{\n  "a": 1\n}\n'
+
+
+def test_write_atomically_is_all_or_nothing(mod: ModuleType, tmp_path: Path) -> None:
+    first = _write(tmp_path, "{}", name="first.json")
+    missing = tmp_path / "gone" / "second.json"  # staging its temp file fails
+
+    with pytest.raises(OSError):
+        mod.write_atomically({first: "[]\n", missing: "[]\n"})
+
+    assert first.read_text(encoding="utf-8") == "{}"
+    assert [p.name for p in tmp_path.iterdir()] == ["first.json"]
+
+
+@pytest.mark.parametrize("path", REAL_JSONC_FILES, ids=lambda p: p.name)
+def test_real_repo_jsonc_files_are_already_formatted(mod: ModuleType, path: Path) -> None:
+    text = path.read_text(encoding="utf-8")
+    assert mod.format_jsonc(text) == text
+
+
+# --------------------------------------------------------------------------------------
+# git-aware modes: --changed-since REF and --staged
+# --------------------------------------------------------------------------------------
+
+requires_git = pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+
+
+def _git(repo: Path, *args: str) -> None:
+    subprocess.run(
+        ["git", "-c", "user.name=t", "-c", "user.email=t@example.com", *args],
+        cwd=repo,
+        check=True,
+        capture_output=True,
+    )
+
+
+@pytest.fixture
+def repo(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    _git(tmp_path, "init", "-q")
+    _write(tmp_path, '{"a": 1}', name="clean.json")
+    _git(tmp_path, "add", "-A")
+    _git(tmp_path, "commit", "-q", "-m", "init")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@requires_git
+def test_changed_since_checks_only_changed_json(
+    mod: ModuleType, repo: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    (repo / "sub").mkdir()
+    _write(repo / "sub", "{oops}", name="bad.jsonc")
+    _write(repo, "{oops}", name="notes.txt")  # not JSON: never looked at
+    _git(repo, "add", "-A")
+
+    assert [p.as_posix() for p in mod.git_changed_files("HEAD")] == ["sub/bad.jsonc"]
+    assert mod.main(["--changed-since", "HEAD"]) != 0
+    err = capsys.readouterr().err
+    assert "sub/bad.jsonc" in err
+    assert "notes.txt" not in err
+
+
+@requires_git
+@pytest.mark.parametrize("mode", [["--changed-since", "HEAD"], ["--staged"]], ids=["changed-since", "staged"])
+def test_git_modes_cover_the_whole_tree_from_a_subdirectory(
+    mod: ModuleType, repo: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str], mode: list[str]
+) -> None:
+    for directory in ("sub", "other"):
+        (repo / directory).mkdir()
+    _write(repo / "other", '{"a": 1 "b": 2}', name="a.json")
+    _write(repo, "{oops}", name="top.jsonc")
+    _git(repo, "add", "-A")
+    monkeypatch.chdir(repo / "sub")
+
+    assert mod.main(mode) == 1
+    err = capsys.readouterr().err
+    assert "a.json: Expecting ',' delimiter" in err
+    assert "top.jsonc" in err
+
+
+@requires_git
+def test_changed_since_with_nothing_changed_passes(mod: ModuleType, repo: Path) -> None:
+    assert mod.main(["--changed-since", "HEAD"]) == 0
+
+
+@requires_git
+def test_changed_since_bad_ref_fails_without_traceback(
+    mod: ModuleType, repo: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    assert mod.main(["--changed-since", "no-such-ref"]) != 0
+    assert "git failed" in capsys.readouterr().err
+
+
+def test_missing_git_is_reported_as_such(
+    mod: ModuleType, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+) -> None:
+    monkeypatch.setenv("PATH", str(tmp_path))  # no git on it
+
+    assert mod.main(["--changed-since", "HEAD"]) == 1
+    assert mod.main(["--staged"]) == 1
+    err = capsys.readouterr().err
+    assert err.count("error: could not run git") == 2
+
+
+def test_unreadable_files_are_not_blamed_on_git(
+    mod: ModuleType, tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    missing = tmp_path / "missing.json"
+
+    assert mod.main([str(missing)]) == 1
+    assert mod.main(["--format", str(missing)]) == 1
+    err = capsys.readouterr().err
+    assert err.count(str(missing)) == 2
+    assert "git" not in err
+
+
+def test_blob_reader_reports_truncated_git_output(mod: ModuleType) -> None:
+    import io
+
+    blob = mod._BlobReader(io.BytesIO(b'{"a": 1'), size=20, chunk_size=4)
+
+    with pytest.raises(EOFError, match="ended mid-blob"):
+        list(blob)
+
+
+def test_staged_reports_truncated_git_output_without_traceback(
+    mod: ModuleType, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+) -> None:
+    def check_staged(names: list[str]) -> Iterator[tuple[str, str | None]]:
+        yield "ok.json", None
+        raise EOFError("git cat-file output ended mid-blob")
+
+    monkeypatch.setattr(mod, "git_staged_files", lambda: ["ok.json", "cut.json"])
+    monkeypatch.setattr(mod, "check_staged", check_staged)
+
+    assert mod.main(["--staged"]) == 1
+    assert "error: git failed: git cat-file output ended mid-blob" in capsys.readouterr().err
+
+
+@requires_git
+def test_staged_checks_the_index_not_the_working_tree(
+    mod: ModuleType, repo: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    _write(repo, '{\n  // staged and valid\n  "a": 2,\n}', name="clean.json")
+    _git(repo, "add", "clean.json")
+    _write(repo, "{oops}", name="clean.json")  # unstaged breakage does not count
+
+    assert mod.main(["--staged"]) == 0
+
+    _git(repo, "add", "clean.json")
+    _write(repo, '{"a": 1}', name="clean.json")  # ...and an unstaged fix does not rescue it
+
+    assert mod.main(["--staged"]) != 0
+    assert "clean.json" in capsys.readouterr().err
+
+
+@requires_git
+def test_check_staged_keeps_records_in_sync_after_a_failure(mod: ModuleType, repo: Path) -> None:
+    # A small chunk size leaves most of the failing blob unread when validation stops;
+    # the next record must still be parsed from the right offset.
+    _write(repo, '{"a": oops, "padding": "' + "x" * 100 + '"}', name="bad.json")
+    _write(repo, '{"b": [1, 2,], // ok\n}', name="good.json")
+    _git(repo, "add", "-A")
+
+    results = dict(mod.check_staged(["bad.json", "good.json", "absent.json"], chunk_size=8))
+
+    assert results["bad.json"] is not None
+    assert results["good.json"] is None
+    assert results["absent.json"] is not None
+
+
+# --------------------------------------------------------------------------------------
+# Differential fuzzing: every scanner must match the original char-by-char scanner
+# --------------------------------------------------------------------------------------
+#
+# The reference implementations below are the scanner as first written: one character at
+# a time, obviously correct, slow. Any faster scanner (the regex tokenizer behind
+# `uncomment`, `StreamUncommenter` at any chunk size, `StreamValidator`) must produce the
+# same bytes -- or the same verdict -- for every input the generator can come up with.
+# Seeds are fixed, so a failure reproduces; bump FUZZ_CASES locally to search harder.
+
+FUZZ_SEEDS = range(8)
+FUZZ_CASES = 250
+
+
+def _reference_uncomment(text: str) -> str:
+    out: list[str] = []
+    i = 0
+    n = len(text)
+    while i < n:
+        char = text[i]
+        if char == '"':
+            start = i
+            i += 1
+            while i < n:
+                if text[i] == "\\":
+                    i += 2
+                    continue
+                if text[i] == '"':
+                    i += 1
+                    break
+                i += 1
+            out.append(text[start:i])
+            continue
+        if char == "/" and i + 1 < n:
+            if text[i + 1] == "/":
+                while i < n and text[i] != "\n":
+                    out.append(" ")
+                    i += 1
+                continue
+            if text[i + 1] == "*":
+                end = text.find("*/", i + 2)
+                if end == -1:
+                    line = text.count("\n", 0, i) + 1
+                    raise ValueError(f"unterminated block comment starting on line {line}")
+                for ch in text[i : end + 2]:
+                    out.append("\n" if ch == "\n" else " ")
+                i = end + 2
+                continue
+        out.append(char)
+        i += 1
+    return "".join(out)
+
+
+def _reference_drop_trailing_commas(text: str) -> str:
+    chars = list(text)
+    i = 0
+    n = len(chars)
+    while i < n:
+        if chars[i] == '"':
+            i += 1
+            while i < n:
+                if chars[i] == "\\":
+                    i += 2
+                    continue
+                if chars[i] == '"':
+                    break
+                i += 1
+            i += 1
+            continue
+        if chars[i] == ",":
+            j = i + 1
+            while j < n and chars[j].isspace():
+                j += 1
+            if j < n and chars[j] in "}]":
+                chars[i] = " "
+        i += 1
+    return "".join(chars)
+
+
+# Fragments chosen to sit on every scanner state boundary: quotes, escapes, both comment
+# openers and closers, and the characters that end them.
+_FRAGMENTS = [
+    "{", "}", "[", "]", ",", ":", '"', "\\", "/", "*", "\n", " ", "\t", "\r",
+    "//", "/*", "*/", '\\"', "\\\\", "a", "1", "-0.5e3", "true", "null", "\u00e9", "\u2603",
+    '"https://x/y"', '"/* s */"', "// c\n", "/* b */", "/* m\n l */", ",}", ",]", "\x01",
+]
+
+
+def _random_value(rng: random.Random, depth: int = 0) -> str:
+    roll = rng.random()
+    if depth > 3 or roll < 0.4:
+        return rng.choice(['1', '-2.5e3', 'true', 'null', '"s//x"', '"a\\"b"', '"\\u00e9"', "[]", "{}"])
+    gap = lambda: rng.choice(["", " ", "\n  ", " // c\n", " /* b */ "])  # noqa: E731
+    trailing = rng.choice(["", ",", gap() + ","])
+    if roll < 0.7:
+        items = [gap() + _random_value(rng, depth + 1) + gap() for _ in range(rng.randint(0, 3))]
+        return "[" + ",".join(items) + (trailing if items else "") + "]"
+    members = [
+        f'{gap()}"k{i}"{gap()}:{gap()}{_random_value(rng, depth + 1)}{gap()}' for i in range(rng.randint(0, 3))
+    ]
+    return "{" + ",".join(members) + (trailing if members else "") + "}"
+
+
+def _fuzz_inputs(seed: int) -> list[str]:
+    """Half structured-then-mutated documents, half raw fragment soup."""
+    rng = random.Random(seed)
+    inputs = []
+    for case in range(FUZZ_CASES):
+        if case % 2:
+            inputs.append("".join(rng.choice(_FRAGMENTS) for _ in range(rng.randint(0, 24))))
+            continue
+        chars = list(_random_value(rng))
+        for _ in range(rng.randint(0, 2)):
+            pos = rng.randint(0, len(chars))
+            if chars and pos < len(chars) and rng.random() < 0.4:
+                del chars[pos]
+            else:
+                chars.insert(pos, rng.choice(_FRAGMENTS))
+        inputs.append("".join(chars))
+    return inputs
+
+
+def _outcome(fn: Callable[[str], object], text: str) -> object:
+    try:
+        return fn(text)
+    except ValueError as exc:
+        return ("error", str(exc))
+
+
+@pytest.mark.parametrize("seed", FUZZ_SEEDS)
+def test_fuzz_uncomment_matches_reference(mod: ModuleType, seed: int) -> None:
+    for text in _fuzz_inputs(seed):
+        assert _outcome(mod.uncomment, text) == _outcome(_reference_uncomment, text), repr(text)
+
+
+@pytest.mark.parametrize("seed", FUZZ_SEEDS)
+def test_fuzz_drop_trailing_commas_matches_reference(mod: ModuleType, seed: int) -> None:
+    for text in _fuzz_inputs(seed):
+        assert mod.drop_trailing_commas(text) == _reference_drop_trailing_commas(text), repr(text)
+
+
+@pytest.mark.parametrize("seed", FUZZ_SEEDS)
+def test_fuzz_stream_uncommenter_matches_reference(mod: ModuleType, seed: int) -> None:
+    rng = random.Random(seed)
+
+    def streamed(text: str) -> str:
+        uncommenter = mod.StreamUncommenter()
+        size = rng.randint(1, 6)
+        return "".join(uncommenter.feed(chunk) for chunk in _chunked(text, size)) + uncommenter.close()
+
+    for text in _fuzz_inputs(seed):
+        assert _outcome(streamed, text) == _outcome(_reference_uncomment, text), repr(text)
+
+
+@pytest.mark.parametrize("seed", FUZZ_SEEDS)
+def test_fuzz_stream_verdict_matches_reference(mod: ModuleType, seed: int) -> None:
+    rng = random.Random(seed)
+
+    for text in _fuzz_inputs(seed):
+        try:
+            json.loads(_reference_drop_trailing_commas(_reference_uncomment(text)))
+            expected_ok = True
+        except ValueError:
+            expected_ok = False
+
+        try:
+            mod.validate_stream(_chunked(text, rng.randint(1, 6)))
+            got_ok = True
+        except mod.JsoncError:
+            got_ok = False
+
+        assert got_ok == expected_ok, repr(text)
+
+
+def test_bench_corpora_are_valid_jsonc(mod: ModuleType) -> None:
+    """The benchmark measures nothing useful if its corpora fail to parse."""
+    spec = importlib.util.spec_from_file_location("bench_check_jsonc", BENCH_SCRIPT)
+    assert spec is not None and spec.loader is not None
+    bench = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bench)
+
+    assert bench.parse_size("100MB") == 100 * 1024**2
+    for comment_density, string_density in bench.PROFILES.values():
+        text = bench.generate_corpus(4096, comment_density, string_density)
+        assert len(text) >= 4096
+        mod.loads_jsonc(text)
+        mod.validate_stream([text])
+
+
 # --------------------------------------------------------------------------------------
 # CLI contract: mirrors check-json (silent on success, path in the message on failure)
 # --------------------------------------------------------------------------------------
@@ -0,0 +1,150 @@
+"""
+Tests for ``scripts/jsonc.py``, the importable JSONC library behind ``check-jsonc.py``.
+
+Unlike the hyphenated CLI, this module is imported by name -- ``pyproject.toml`` puts
+``scripts/`` on pytest's ``pythonpath``, just as Python does when a script there runs.
+Scanner edge cases (URLs in strings, escaped quotes, nested comment markers) are covered
+through the CLI in ``test_scripts_check_jsonc.py``; these tests cover the library surface:
+``load``/``loads`` and the batch API with its shared pool and parse cache.
+"""
+
+from __future__ import annotations
+
+import io
+import json
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+import jsonc
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache() -> Iterator[None]:
+    jsonc.clear_cache()
+    yield
+    jsonc.clear_cache()
+
+
+def _write(tmp_path: Path, content: str, name: str = "sample.json") -> Path:
+    path = tmp_path / name
+    path.write_text(content, encoding="utf-8")
+    return path
+
+
+# --------------------------------------------------------------------------------------
+# loads / load
+# --------------------------------------------------------------------------------------
+
+
+def test_loads_accepts_comments_and_trailing_commas() -> None:
+    assert jsonc.loads('{\n  // c\n  "u": "https://x/y", /* b */\n  "a": [1,],\n}') == {
+        "u": "https://x/y",
+        "a": [1],
+    }
+
+
+def test_loads_errors_are_value_errors_with_positions() -> None:
+    with pytest.raises(ValueError, match=r"line 3 column 8"):
+        jsonc.loads('{\n  // c\n  "a": oops\n}')
+
+
+@pytest.mark.parametrize("as_type", [str, Path], ids=["str", "Path"])
+def test_load_from_path(tmp_path: Path, as_type: type) -> None:
+    path = _write(tmp_path, '{"a": 1} // trailing')
+    assert jsonc.load(as_type(path)) == {"a": 1}
+
+
+def test_load_from_file_object() -> None:
+    assert jsonc.load(io.StringIO('[1, 2, /* three */]')) == [1, 2]
+
+
+# --------------------------------------------------------------------------------------
+# Batch API: iter_errors / parse_many
+# --------------------------------------------------------------------------------------
+
+
+def test_iter_errors_yields_only_failures_in_input_order(tmp_path: Path) -> None:
+    good = _write(tmp_path, '{"a": 1}', name="good.json")
+    bad_b = _write(tmp_path, "{oops}", name="b.json")
+    bad_a = _write(tmp_path, '{"a": }', name="a.json")
+    missing = tmp_path / "missing.json"
+
+    errors = list(jsonc.iter_errors([bad_b, good, missing, bad_a]))
+
+    assert [path for path, _ in errors] == [bad_b, missing, bad_a]
+    assert all(message for _, message in errors)
+
+
+def test_iter_errors_stream_mode_agrees(tmp_path: Path) -> None:
+    good = _write(tmp_path, '{"a": [1,],} // c', name="good.json")
+    bad = _write(tmp_path, "{oops}", name="bad.json")
+
+    assert [path for path, _ in jsonc.iter_errors([good, bad], stream=True)] == [bad]
+
+
+def test_parse_many_returns_every_value(tmp_path: Path) -> None:
+    paths = [_write(tmp_path, f'{{"n": {i}}} // file {i}', name=f"{i}.json") for i in range(20)]
+
+    parsed = jsonc.parse_many(paths)
+
+    assert list(parsed) == paths
+    assert [value["n"] for value in parsed.values()] == list(range(20))
+
+
+def test_parse_many_names_the_failing_file(tmp_path: Path) -> None:
+    good = _write(tmp_path, '{"a": 1}', name="good.json")
+    bad = _write(tmp_path, "{oops}", name="bad.json")
+
+    with pytest.raises(jsonc.JsoncError, match="bad.json"):
+        jsonc.parse_many([good, bad])
+
+
+# --------------------------------------------------------------------------------------
+# The shared cache: parse once, never stale, never shared mutably
+# --------------------------------------------------------------------------------------
+
+
+def test_unchanged_file_is_parsed_once(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    path = _write(tmp_path, '{"a": 1}')
+    calls: list[str] = []
+    real_loads = jsonc.loads
+
+    def counting_loads(text: str) -> object:
+        calls.append(text)
+        return real_loads(text)
+
+    monkeypatch.setattr(jsonc, "loads", counting_loads)
+
+    jsonc.parse_many([path])
+    assert jsonc.check_file(path) is None
+    list(jsonc.iter_errors([path]))
+
+    assert len(calls) == 1
+
+
+def test_edited_file_is_reparsed(tmp_path: Path) -> None:
+    path = _write(tmp_path, '{"a": 1}')
+    assert jsonc.parse_many([path])[path] == {"a": 1}
+
+    path.write_text('{"a": 22}', encoding="utf-8")  # different size, so a different key
+
+    assert jsonc.parse_many([path])[path] == {"a": 22}
+
+
+def test_callers_cannot_mutate_the_cache(tmp_path: Path) -> None:
+    path = _write(tmp_path, '{"a": [1]}')
+
+    jsonc.parse_many([path])[path]["a"].append(2)
+
+    assert jsonc.parse_many([path])[path] == {"a": [1]}
+
+
+def test_cache_is_bounded(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(jsonc, "CACHE_SIZE", 3)
+    paths = [_write(tmp_path, json.dumps({"n": i}), name=f"{i}.json") for i in range(10)]
+
+    jsonc.parse_many(paths)
+
+    assert len(jsonc._cache) == 3